@@ -0,0 +1,227 @@
+'''
+burst_capture.py
+
+This script contains the burst capture mode of the transparent camera.
+
+In burst mode both cameras record through the video pipeline at a fixed frame rate, which is much faster than
+capturing still pairs.  Every recorded frame's sensor timestamp is saved next to the video.  Afterwards the two
+recordings are matched by nearest timestamp and the matched frames are written into the Front and Side folders
+along with a manifest of the skew between every pair.
+
+The matching and extraction only need OpenCV, so they can be run on any computer from two recorded videos:
+    python burst_capture.py side.h264 front.h264 output_directory [image_id] [start_index] [fps] [max_skew_ms]
+Recordings without the .timestamps.txt files record_burst() writes need the fps they were recorded at, their
+timestamps are then generated from it.
+'''
+
+# Necessary imports
+from time import sleep
+import csv
+import cv2
+import os
+import sys
+
+# The name of the manifest written next to the Front and Side folders
+MANIFEST_NAME = 'burst_manifest.csv'
+
+'''
+timestamps_path()
+
+Returns the path of the sensor timestamp file that belongs to a video.
+'''
+def timestamps_path(video_path):
+    return video_path + '.timestamps.txt'
+
+'''
+record_burst()
+
+Records both cameras through the video pipeline for the given number of seconds.
+
+The cameras must already be configured with a video configuration (see CameraSession) and started.  The sensor
+timestamp of every frame that is handed to the encoder is written to timestamps_path(video_path), one nanosecond
+timestamp per line, so timestamp i always belongs to frame i of the recording.  Frames the running cameras deliver
+before the encoder starts or after it stops are not in the recording, so they are not logged either.
+
+side_camera - Picamera2(0)
+front_camera - Picamera2(1)
+side_video_path - where to save the side recording
+front_video_path - where to save the front recording
+seconds - how long to record for
+'''
+def record_burst(side_camera, front_camera, side_video_path, front_video_path, seconds):
+    # Only needed on the camera itself, the rest of this script runs without Picamera2
+    from picamera2.encoders import H264Encoder
+    from picamera2.outputs import FileOutput
+
+    # Logs the absolute sensor timestamp of every request the camera hands to the encoder.  The pts files FileOutput
+    # can write start every recording at 0, so they cannot be used to match the two cameras.
+    class TimestampedEncoder(H264Encoder):
+        def __init__(self, timestamp_file):
+            super().__init__()
+            self.timestamp_file = timestamp_file
+
+        def encode(self, stream, request):
+            self.timestamp_file.write(f"{request.get_metadata()['SensorTimestamp']}\n")
+            super().encode(stream, request)
+
+    recordings = [(side_camera, side_video_path), (front_camera, front_video_path)]
+    timestamp_files = [open(timestamps_path(video_path), 'w') for camera, video_path in recordings]
+    for (camera, video_path), timestamp_file in zip(recordings, timestamp_files):
+        camera.start_encoder(TimestampedEncoder(timestamp_file), FileOutput(video_path))
+
+    sleep(seconds)
+
+    for camera, video_path in recordings:
+        camera.stop_encoder()
+    for timestamp_file in timestamp_files:
+        timestamp_file.close()
+
+'''
+read_timestamps()
+
+Reads the sensor timestamps of a recording.  The timestamp file is either the one record_burst() writes (one
+nanosecond timestamp per line) or a Picamera2 pts file ('# timecode format v2' followed by one millisecond timestamp
+per line).  If there is no timestamp file, the timestamps are generated from the frame rate instead.
+
+video_path - the recording
+frame_count - the number of frames in the recording, only used without a timestamp file
+fps - the frame rate of the recording, only used without a timestamp file
+'''
+def read_timestamps(video_path, frame_count=None, fps=None):
+    if os.path.exists(timestamps_path(video_path)):
+        with open(timestamps_path(video_path)) as timestamp_file:
+            lines = [line.strip() for line in timestamp_file if line.strip()]
+        if lines and lines[0].startswith('#'):
+            return [int(float(line) * 1e6) for line in lines if not line.startswith('#')]
+        return [int(line) for line in lines]
+    if fps is None:
+        raise FileNotFoundError(f"{timestamps_path(video_path)} does not exist, so the frame rate of the recording is needed")
+    return [int(ii * 1e9 / fps) for ii in range(frame_count)]
+
+'''
+count_frames()
+
+Returns the number of frames in a recording by decoding all of them.  Raw .h264 streams have no container to read
+the frame count from, so OpenCV's CAP_PROP_FRAME_COUNT cannot be trusted for them.
+'''
+def count_frames(video_path):
+    capture = cv2.VideoCapture(video_path)
+    frame_count = 0
+    while capture.grab():
+        frame_count += 1
+    capture.release()
+    return frame_count
+
+'''
+match_frames()
+
+Matches every side frame to the front frame with the nearest timestamp.  Both lists must be sorted.  Each front frame
+is used at most once and pairs further apart than max_skew nanoseconds are left out.
+
+Returns a list of (side_index, front_index, skew) tuples in increasing order.
+'''
+def match_frames(side_timestamps, front_timestamps, max_skew):
+    pairs = []
+    jj = 0
+    last_front = -1
+    for ii, side_timestamp in enumerate(side_timestamps):
+        # Advance to the front frame closest to this side frame
+        while jj + 1 < len(front_timestamps) and abs(front_timestamps[jj + 1] - side_timestamp) <= abs(front_timestamps[jj] - side_timestamp):
+            jj += 1
+        if jj >= len(front_timestamps) or jj == last_front:
+            continue
+        skew = abs(front_timestamps[jj] - side_timestamp)
+        if skew <= max_skew:
+            pairs.append((ii, jj, skew))
+            last_front = jj
+    return pairs
+
+'''
+FrameReader
+
+Reads the frames of a video in order, skipping forward to the requested index.
+'''
+class FrameReader():
+    def __init__(self, video_path):
+        self.capture = cv2.VideoCapture(video_path)
+        self.index = -1
+        self.frame = None
+
+    def read(self, index):
+        while self.index < index:
+            ok, self.frame = self.capture.read()
+            if not ok:
+                raise IndexError(f"The video ends before frame {index}")
+            self.index += 1
+        return self.frame
+
+    def release(self):
+        self.capture.release()
+
+'''
+extract_pairs()
+
+Writes the time matched frames of two burst recordings into the Front and Side folders and writes a manifest.
+
+side_video_path - the side recording
+front_video_path - the front recording
+output_dir - the folder containing the Front and Side folders
+image_id - the name of the saved data (ie: subject name)
+start_index - the image index of the first pair
+max_skew - the largest skew allowed between a pair in nanoseconds, defaults to half a frame
+fps - the frame rate of the recordings, only needed if they have no timestamp files
+
+Returns the list of file path pairs that were written.
+'''
+def extract_pairs(side_video_path, front_video_path, output_dir, image_id, start_index=0, max_skew=None, fps=None):
+    side_dir = os.path.join(output_dir, 'Side')
+    front_dir = os.path.join(output_dir, 'Front')
+    os.makedirs(side_dir, exist_ok=True)
+    os.makedirs(front_dir, exist_ok=True)
+
+    side_reader = FrameReader(side_video_path)
+    front_reader = FrameReader(front_video_path)
+
+    # Without timestamp files we need the frame counts to generate timestamps from the frame rate
+    side_count = count_frames(side_video_path) if fps is not None and not os.path.exists(timestamps_path(side_video_path)) else None
+    front_count = count_frames(front_video_path) if fps is not None and not os.path.exists(timestamps_path(front_video_path)) else None
+    side_timestamps = read_timestamps(side_video_path, side_count, fps)
+    front_timestamps = read_timestamps(front_video_path, front_count, fps)
+
+    # Default to half of the median frame period of the side camera
+    if max_skew is None:
+        periods = sorted(b - a for a, b in zip(side_timestamps, side_timestamps[1:]))
+        max_skew = periods[len(periods) // 2] // 2 if periods else 0
+
+    pairs = match_frames(side_timestamps, front_timestamps, max_skew)
+
+    written = []
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'a', newline='') as manifest_file:
+        manifest = csv.writer(manifest_file)
+        if manifest_file.tell() == 0:
+            manifest.writerow(['index', 'side_file', 'front_file', 'side_frame', 'front_frame', 'side_timestamp', 'front_timestamp', 'skew_ms'])
+
+        for ii, (side_index, front_index, skew) in enumerate(pairs, start=start_index):
+            side_file_path = os.path.join(side_dir, f'{image_id}_side_{ii}.jpg')
+            front_file_path = os.path.join(front_dir, f'{image_id}_front_{ii}.jpg')
+            cv2.imwrite(side_file_path, side_reader.read(side_index))
+            cv2.imwrite(front_file_path, front_reader.read(front_index))
+            manifest.writerow([ii, os.path.basename(side_file_path), os.path.basename(front_file_path),
+                               side_index, front_index, side_timestamps[side_index], front_timestamps[front_index],
+                               f'{skew / 1e6:.3f}'])
+            written.append((side_file_path, front_file_path))
+
+    side_reader.release()
+    front_reader.release()
+    return written
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 4):
+        print("Usage:  python burst_capture.py side_video front_video output_directory [image_id] [start_index] [fps] [max_skew_ms]")
+    else:
+        image_id = sys.argv[4] if len(sys.argv) > 4 else 'burst'
+        start_index = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+        fps = float(sys.argv[6]) if len(sys.argv) > 6 else None
+        max_skew = int(float(sys.argv[7]) * 1e6) if len(sys.argv) > 7 else None
+        written = extract_pairs(sys.argv[1], sys.argv[2], sys.argv[3], image_id, start_index, max_skew, fps)
+        print(f"Extracted {len(written)} pairs into \"{sys.argv[3]}\"")
@@ -8,12 +8,17 @@ Date: 4/26/24
 '''
 
 # Necessary imports
-from datetime import datetime
-from picamera2 import Picamera2, Preview
-from time import sleep
-import libcamera
+# The optional features that need OpenCV (burst mode, the quality gate and rectification) are imported where they are
+# turned on, so capturing still pairs only needs Picamera2 (which brings numpy and Pillow)
+from camera_backends import create_backend
+from camera_session import CameraSession
+from capture_engine import PairedCaptureEngine, save_request
+from dataset_export import DatasetExporter
+from encoder_pool import EncoderPool, array_request
+from frame_bus import FrameBus
+from session_archive import SessionArchive
+from session_journal import SessionJournal, resume_index
 import os
-import subprocess
 import xml.etree.ElementTree as ET
 
 # Global config
@@ -24,13 +29,54 @@ counter_value = 0 # Initialize counter_value
 # This should be moved to our settings.xml file eventually
 IMAGE_ID = "replace_me"
 
+# Choose where the frames come from:  'picamera2' (the real cameras), 'replay' (recorded images or videos) or 'synthetic'
+CAMERA_BACKEND = 'picamera2'
+CAMERA_BACKEND_OPTIONS = {} # ie: {'side_source': 'Side', 'front_source': 'Front', 'frame_rate': 10, 'preload': 0} for 'replay',
+                            # preload is the number of frames per camera decoded into memory up front (about 36 MB each)
+
 # Create a flag to toggle the camera's preview
 # This should also be moved to settings.xml eventually
 ENABLE_PREVIEW = True
+PREVIEW_SECONDS = 5
 
 # Define how many photos we want to take from the camera
 NUMBER_OF_CAPTURES = 10
 
+# Define how many pairs per second we want to capture (None captures as fast as the cameras allow)
+TARGET_PAIR_RATE = 4
+
+# Record both cameras as video instead of capturing still pairs, then extract the time matched pairs
+# NUMBER_OF_CAPTURES and TARGET_PAIR_RATE are not used in burst mode
+BURST_MODE = False
+BURST_SECONDS = 10
+BURST_FPS = 30
+BURST_SIZE = (1280, 720)
+
+# Encode the JPEGs on background threads so the cameras do not wait on the SD card
+ENCODE_IN_BACKGROUND = True
+ENCODER_WORKERS = 2
+ENCODER_QUEUE_SIZE = 8 # the number of raw frames held in memory before capturing waits on the encoders
+
+# Also write every pair straight into a pix2pixHD dataset (side images to *_A, front images to *_B) at the training size
+# This needs ENCODE_IN_BACKGROUND since the images are resized and written by the encoders
+EXPORT_DATASET = False
+EXPORT_DATASET_ROOT = os.path.expanduser('~/pix2pixHD/datasets/transparent_camera')
+EXPORT_PHASE = 'train'
+EXPORT_LOAD_SIZE = 1024 # should match pix2pixHD's --loadSize
+EXPORT_RECTIFICATION = None # a calibration from rectification.py to warp the exported side images with, or None
+
+# Score every pair for blur, exposure and (optionally) similarity to the previous pair before saving it
+# This also needs ENCODE_IN_BACKGROUND since the pairs are scored from the raw frames
+ENABLE_QUALITY_GATE = False
+QUALITY_DROP_REJECTED = True # False saves rejected pairs anyway and only flags them in quality_manifest.csv
+QUALITY_MAX_SIMILARITY = None # ie: 0.995 rejects pairs that are nearly identical to the previous saved pair, None keeps
+                              # them (a subject that sits still scores above 0.98 between pairs)
+
+# Publish every captured front frame on a shared memory frame bus (see frame_bus.py) so the eye tracker can read it
+# without waiting for the JPEG to be written, None turns this off
+# This also needs ENCODE_IN_BACKGROUND since the raw frames are published
+FRAME_BUS_NAME = None
+
 '''
 create_settings_xml()
 
@@ -55,50 +101,43 @@ def read_settings_xml(filename=settings_filename):
     return counter_value
 
 '''
-make_archive()
-
-Function that takes the photos stored in the Front and Side folders and zips them.
+run_burst()
 
-The zipped archive is then moved to the camera's website path to be downloaded.
+Records both cameras in burst mode, extracts the time matched pairs into the Front and Side folders and archives them.
 '''
-def make_archive(IMAGE_ID):
-    # Get the current directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Construct path for 'Side' and 'Front' folder
-    side_dir = os.path.join(current_dir, 'Side')
-    front_dir = os.path.join(current_dir, 'Front')
-
-    # Create dir for 'Side' and 'Front' if they do not exist
-    os.makedirs(side_dir, exist_ok=True)
-    os.makedirs(front_dir, exist_ok=True)
-
-    # Get today's date in the format MM-DD-YYYY
-    today_date = datetime.now().strftime("%m-%d-%Y")
-
-    # Construct the archive name using IMAGE_ID and today's date
-    archive_name = f"{IMAGE_ID}-{today_date}.zip"
-
-    # Navigate to the directory where 'Front' and 'Side' folders are located
-    os.chdir(current_dir)
-
-    # Use subprocess to run the zip command
-    try:
-        subprocess.check_call(['zip', '-r', archive_name, 'Front', 'Side'])
-        print(f"Done archiving the images into {archive_name}!")
-        
-        # Construct the full path of the zip file
-        zip_file_path = os.path.join(current_dir, archive_name)
-        
-        # Construct the destination path
-        destination_path = "/var/www/html/download/"
-        
-        # Use subprocess to run the sudo cp command
-        subprocess.check_call(['sudo', 'cp', zip_file_path, destination_path])
-        print(f"Successfully copied {archive_name} to {destination_path}")
-        
-    except subprocess.CalledProcessError as e:
-        print("Failed to create or copy archive: ", e)
+def run_burst(session, current_dir, counter_value):
+    from burst_capture import extract_pairs, record_burst
+
+    # Record both cameras into the Burst folder
+    burst_dir = os.path.join(current_dir, 'Burst')
+    os.makedirs(burst_dir, exist_ok=True)
+    side_video_path = os.path.join(burst_dir, f'{IMAGE_ID}_side_{counter_value}.h264')
+    front_video_path = os.path.join(burst_dir, f'{IMAGE_ID}_front_{counter_value}.h264')
+    print(f"Recording {BURST_SECONDS} s at {BURST_FPS} fps...")
+    session.mark_capture()
+    record_burst(session.side_camera, session.front_camera, side_video_path, front_video_path, BURST_SECONDS)
+    session.stop()
+
+    # Pull the time matched pairs out of the recordings
+    pairs = extract_pairs(side_video_path, front_video_path, current_dir, IMAGE_ID, counter_value)
+    print(f"Extracted {len(pairs)} pairs, see {os.path.join(current_dir, 'burst_manifest.csv')} for the skew of every pair")
+
+    # Record the pairs in the session journal and update the counter value in settings.xml
+    journal = SessionJournal(current_dir)
+    for ii, (side_file_path, front_file_path) in enumerate(pairs, start=counter_value):
+        journal.reserve(ii)
+        journal.record_pair(ii, side_file_path, front_file_path)
+    create_settings_xml(journal.next_index)
+    journal.close()
+
+    # Publish the archive of the images to the camera's website
+    archive = SessionArchive(IMAGE_ID, current_dir)
+    for side_file_path, front_file_path in pairs:
+        archive.add_pair(side_file_path, front_file_path)
+    if archive.close():
+        print(f"Added {archive.added} images to {archive.name} and published it to {archive.path}")
+    else:
+        print(f"Added {archive.added} images to {archive.name}, it was kept at {archive.local_path}")
 
 '''
 main()
@@ -110,9 +149,10 @@ def main():
     if not os.path.exists(settings_filename):
         create_settings_xml(counter_value)  # Create settings.xml with counter starting at 0
         print("\nThere is no existing settings.xml, create settings.xml...\n")
+        start_value = counter_value
     else:
-        counter_value = read_settings_xml(settings_filename)  # Read the current counter value
-        print(f"\nFound settings.xml, the counter value right now is {counter_value}\n")
+        start_value = read_settings_xml(settings_filename)  # Read the current counter value
+        print(f"\nFound settings.xml, the counter value right now is {start_value}\n")
 
     # Make sure that the subject's name has been modified
     if IMAGE_ID == "replace_me":
@@ -122,6 +162,12 @@ def main():
     # Get the current directory
     current_dir = os.path.dirname(os.path.abspath(__file__))
 
+    # The session journal is updated with every pair, so it is ahead of settings.xml if the last session crashed
+    journal_value = resume_index(current_dir)
+    if journal_value > start_value:
+        print(f"The session journal is ahead of settings.xml, continuing from image {journal_value}\n")
+        start_value = journal_value
+
     # Construct path for 'Side' and 'Front' folder
     side_dir = os.path.join(current_dir, 'Side')
     front_dir = os.path.join(current_dir, 'Front')
@@ -131,59 +177,126 @@ def main():
     os.makedirs(front_dir, exist_ok=True)
 
     # Assign the cameras
-    picam0 = Picamera2(0)
-    picam1 = Picamera2(1)
-
-    if (ENABLE_PREVIEW):
-        picam0.start_preview(Preview.QTGL)
-        picam1.start_preview(Preview.QTGL)
-
-        # Configure the front camera such that preview images are rotated 180 degrees in the preview
-        front_camera_config = Picamera2.create_preview_configuration(picam1)
-        front_camera_config["transform"] = libcamera.Transform(hflip=1, vflip=1)
-        picam1.configure(front_camera_config)
-
-        # Start the cameras
-        picam0.start()
-        picam1.start()
-
-        # Preview the output
-        sleep(5)
-
-        # Stop the cameras
-        picam0.stop()
-        picam1.stop()
-        picam0.stop_preview()
-        picam1.stop_preview()
-
-    # Configure the front camera such that captured images are rotated 180 degress
-    front_camera_config = Picamera2.create_still_configuration(picam1)
-    front_camera_config["transform"] = libcamera.Transform(hflip=1, vflip=1)
-    picam1.configure(front_camera_config)
-
-    # Start the cameras
-    picam0.start()
-    picam1.start()
-
-    # Capture the data
-    for ii in range(counter_value, counter_value + NUMBER_OF_CAPTURES):
+    backend = create_backend(CAMERA_BACKEND, **CAMERA_BACKEND_OPTIONS)
+    picam0, picam1 = backend.open()
+
+    # Configure both cameras once with a preview stream and a full resolution capture stream
+    # The front camera is rotated 180 degrees in both the preview and the captured images
+    session = CameraSession(picam0, picam1,
+                            front_transform=backend.front_transform(),
+                            preview=backend.preview() if ENABLE_PREVIEW else None,
+                            video_fps=BURST_FPS if BURST_MODE else None,
+                            video_size=BURST_SIZE)
+
+    # Preview the output, the cameras keep running afterwards so capturing can start straight away
+    session.show_preview(PREVIEW_SECONDS)
+
+    if (BURST_MODE):
+        run_burst(session, current_dir, start_value)
+        return
+
+    # Every image is appended to today's archive on the camera's website as soon as it is written
+    # and every pair is recorded in the session journal once both of its images are written
+    archive = SessionArchive(IMAGE_ID, current_dir)
+    journal = SessionJournal(current_dir)
+    def file_written(file_path):
+        archive.add_file(file_path)
+        journal.file_written(file_path)
+
+    # Capture the data, triggering both cameras at the same time
+    engine = PairedCaptureEngine(picam0, picam1, TARGET_PAIR_RATE)
+    encoder = EncoderPool(ENCODER_WORKERS, ENCODER_QUEUE_SIZE, on_written=file_written) if ENCODE_IN_BACKGROUND else None
+
+    # Write the pairs into the pix2pixHD dataset in the same pass
+    exporter = None
+    if (EXPORT_DATASET):
+        if encoder is not None:
+            rectifier = None
+            if EXPORT_RECTIFICATION:
+                from rectification import SideRectifier, load_calibration
+                rectifier = SideRectifier(load_calibration(EXPORT_RECTIFICATION))
+            exporter = DatasetExporter(EXPORT_DATASET_ROOT, encoder, IMAGE_ID, EXPORT_PHASE, EXPORT_LOAD_SIZE, rectifier)
+        else:
+            print("EXPORT_DATASET needs ENCODE_IN_BACKGROUND, the pairs will not be exported!")
+
+    # Score the pairs before they are saved
+    gate = None
+    if (ENABLE_QUALITY_GATE):
+        if encoder is not None:
+            from quality_gate import QualityGate
+            gate = QualityGate(current_dir, max_similarity=QUALITY_MAX_SIMILARITY, drop=QUALITY_DROP_REJECTED)
+        else:
+            print("ENABLE_QUALITY_GATE needs ENCODE_IN_BACKGROUND, the pairs will not be scored!")
+
+    # The bus is created with the first frame, once the size of the frames is known
+    bus = None
+    if (FRAME_BUS_NAME is not None and encoder is None):
+        print("FRAME_BUS_NAME needs ENCODE_IN_BACKGROUND, the frames will not be published!")
+
+    for ii in range(start_value, start_value + NUMBER_OF_CAPTURES):
         # Save file into Front and Side folder
         side_file_path = os.path.join(side_dir, f'{IMAGE_ID}_side_{ii}.jpg')
         front_file_path = os.path.join(front_dir, f'{IMAGE_ID}_front_{ii}.jpg')
-        picam0.capture_file(side_file_path)
-        picam1.capture_file(front_file_path)
-        print(f"Done capturing image {ii}")
-        sleep(0.25)
+        journal.reserve(ii)
+        if encoder is not None:
+            pair = engine.capture_pair(ii, array_request(), array_request())
+            # A pair the quality gate drops was still captured
+            session.mark_capture()
+            if FRAME_BUS_NAME is not None:
+                if bus is None:
+                    bus = FrameBus(FRAME_BUS_NAME, pair.front_result.shape)
+                bus.publish(pair.front_result, pair.front_timestamp)
+            if gate is not None and not gate.check(pair):
+                print(f"Dropped image {ii}, see quality_manifest.csv")
+                continue
+            journal.expect_pair(ii, side_file_path, front_file_path, pair.skew_ms)
+            encoder.submit(pair.side_result, side_file_path)
+            encoder.submit(pair.front_result, front_file_path)
+            if exporter is not None:
+                exporter.export_pair(pair)
+        else:
+            pair = engine.capture_pair(ii, save_request(side_file_path), save_request(front_file_path))
+            archive.add_pair(side_file_path, front_file_path)
+            journal.record_pair(ii, side_file_path, front_file_path, pair.skew_ms)
+            session.mark_capture()
+        print(f"Done capturing image {ii} (skew {pair.skew_ms:.2f} ms)")
+    engine.close()
+    if bus is not None:
+        bus.close()
+        print(f"Published {bus.published} front frames on the \"{FRAME_BUS_NAME}\" frame bus")
+
+    # Wait for the encoders to finish writing every frame
+    if encoder is not None:
+        encoder.close()
+        encoder_stats = encoder.stats()
+        print(f"Encoded {encoder_stats['encoded']} frames, mean encode time {encoder_stats['mean_encode_ms']:.1f} ms, capture waited {encoder_stats['blocked_seconds']:.2f} s on the encoders")
+    if gate is not None:
+        gate.close()
+        print(f"The quality gate kept {gate.saved} pairs and dropped {gate.dropped}")
+    if exporter is not None:
+        exporter.close()
+        print(f"Exported {exporter.exported} pairs to {EXPORT_DATASET_ROOT}, see {exporter.manifest_path}")
+
+    stats = engine.stats()
+    time_to_first_capture = session.time_to_first_capture()
+    if time_to_first_capture is None:
+        print("Start-up to first capture:  no capture")
+    else:
+        print(f"Start-up to first capture took {time_to_first_capture:.2f} s (not counting the preview)")
+    print(f"Captured {stats['pairs']} pairs at {stats['pairs_per_second']:.2f} pairs/s, mean skew {stats['mean_skew_ms']:.2f} ms, max skew {stats['max_skew_ms']:.2f} ms")
 
     # Update the counter value in settings.xml
-    create_settings_xml(ii + 1)
+    create_settings_xml(journal.next_index)
+    journal.close()
 
     # Stop both of the cameras
-    picam0.stop()
-    picam1.stop()
+    session.stop()
 
-    # Make an archive of the images and upload it to the camera's website
-    make_archive(IMAGE_ID)
+    # Publish the archive of the images to the camera's website
+    if archive.close():
+        print(f"Added {archive.added} images to {archive.name} and published it to {archive.path}")
+    else:
+        print(f"Added {archive.added} images to {archive.name}, it was kept at {archive.local_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,298 @@
+'''
+camera_backends.py
+
+This script contains the camera backends used by camera.py and capture_benchmark.py.
+
+A backend opens the side and front cameras.  Every camera it returns behaves like the parts of Picamera2 that the
+capture code uses (configure, start, stop, capture_request, ...), so the capture, encode and archive code does not
+need to know where the frames come from.  There are three backends:
+- picamera2:  The real cameras of the transparent camera.
+- replay:  Replays frames from a folder of images or a video file at a set frame rate.
+- synthetic:  Generates frames, so the capture code can be run on any computer.
+'''
+
+# Necessary imports
+from time import monotonic_ns, sleep
+import numpy as np
+import os
+import random
+
+# The image types the replay backend reads from a folder
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+'''
+read_image()
+
+Reads an image as an RGB array.
+'''
+def read_image(path):
+    # Only needed by the simulated cameras, so the real cameras do not need Pillow
+    from PIL import Image
+    return np.asarray(Image.open(path).convert('RGB'))
+
+'''
+SimulatedRequest
+
+Mimics the CompletedRequest object returned by Picamera2.capture_request().
+'''
+class SimulatedRequest():
+    def __init__(self, camera, array, timestamp):
+        self.camera = camera
+        self.array = array
+        self.metadata = {'SensorTimestamp': timestamp}
+
+    def get_metadata(self):
+        return dict(self.metadata)
+
+    def make_array(self, name="main"):
+        return self.array
+
+    def save(self, name, file_path):
+        from PIL import Image
+        Image.fromarray(self.array).save(file_path, quality=self.camera.jpeg_quality)
+
+    def release(self):
+        pass
+
+'''
+SimulatedCamera
+
+Mimics the parts of Picamera2 that the capture code uses.  The simulated sensor free-runs at a fixed frame rate
+with a random phase, just like a real sensor would.  A capture request waits for the next frame boundary and
+reports that moment as its sensor timestamp.
+
+Subclasses provide the frames by implementing next_frame().
+
+frame_rate - how many frames per second the simulated sensor produces
+size - the (width, height) of the frames
+'''
+class SimulatedCamera():
+    def __init__(self, frame_rate=30.0, size=(640, 480)):
+        self.frame_period = int(1e9 / frame_rate)
+        self.phase = random.randrange(self.frame_period)
+        self.size = size
+        self.jpeg_quality = 90
+        self.started = False
+
+    def next_frame(self):
+        raise NotImplementedError
+
+    def create_preview_configuration(self, *args, **kwargs):
+        return {'use_case': 'preview', 'main': {'size': self.size}}
+
+    def create_still_configuration(self, *args, **kwargs):
+        return {'use_case': 'still', 'main': {'size': self.size}}
+
+    def create_video_configuration(self, *args, **kwargs):
+        return {'use_case': 'video', 'main': {'size': self.size}}
+
+    def configure(self, config):
+        self.config = config
+
+    def start_preview(self, *args, **kwargs):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    '''
+    capture_request()
+
+    Waits for the next frame boundary of the simulated sensor and returns a SimulatedRequest stamped with it.
+    '''
+    def capture_request(self):
+        now = monotonic_ns()
+        frames_elapsed = (now - self.phase) // self.frame_period + 1
+        timestamp = self.phase + frames_elapsed * self.frame_period
+        sleep((timestamp - now) / 1e9)
+        return SimulatedRequest(self, self.next_frame(), timestamp)
+
+    def capture_array(self, name="main"):
+        request = self.capture_request()
+        return request.make_array(name)
+
+    def capture_file(self, file_path):
+        request = self.capture_request()
+        request.save("main", file_path)
+
+    def close(self):
+        pass
+
+'''
+SyntheticCamera
+
+A simulated camera that serves a generated gradient frame.
+
+camera_num - the camera index, used to make the side and front frames differ
+'''
+class SyntheticCamera(SimulatedCamera):
+    def __init__(self, camera_num=0, frame_rate=30.0, size=(640, 480)):
+        SimulatedCamera.__init__(self, frame_rate, size)
+
+        # Build a single frame up front so that capturing does not spend time generating pixels
+        width, height = size
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.frame[:] = gradient[None, :, None]
+        self.frame[..., camera_num % 3] = 255 - self.frame[..., camera_num % 3]
+
+    def next_frame(self):
+        return self.frame
+
+'''
+ReplayCamera
+
+A simulated camera that replays the frames of a folder of images or a video file, looping at the end.
+
+source - a folder of images (played in sorted order) or a video file
+preload - the number of frames decoded up front and kept in memory so decoding them does not slow down the replay
+          (folders only), the rest are decoded as they are served.  A full resolution frame takes about 36 MB, so
+          only preload as many frames as fit in memory.
+'''
+class ReplayCamera(SimulatedCamera):
+    def __init__(self, source, frame_rate=30.0, preload=0):
+        self.source = source
+        self.capture = None
+        self.frames = None
+        self.paths = None
+        self.index = 0
+
+        if os.path.isdir(source):
+            self.paths = sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+            if not self.paths:
+                raise FileNotFoundError(f"There are no images to replay in {source}")
+            self.frames = [read_image(path) for path in self.paths[:preload]]
+            first = self.frames[0] if self.frames else read_image(self.paths[0])
+        else:
+            # Only needed for videos
+            import cv2
+            self.cv2 = cv2
+            self.capture = cv2.VideoCapture(source)
+            first = self._read_video()
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        SimulatedCamera.__init__(self, frame_rate, (first.shape[1], first.shape[0]))
+
+    '''
+    _read_video()
+
+    Reads the next RGB frame of the video, starting over at the end.
+    '''
+    def _read_video(self):
+        ok, frame = self.capture.read()
+        if not ok:
+            self.capture.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+            if not ok:
+                raise IOError(f"Could not read a frame from {self.source}")
+        return self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2RGB)
+
+    def next_frame(self):
+        if self.capture is not None:
+            return self._read_video()
+        index = self.index % len(self.paths)
+        self.index += 1
+        if index < len(self.frames):
+            return self.frames[index]
+        return read_image(self.paths[index])
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+
+'''
+Picamera2Backend
+
+Opens the real side (Picamera2(0)) and front (Picamera2(1)) cameras.
+'''
+class Picamera2Backend():
+    name = 'picamera2'
+
+    def open(self):
+        from picamera2 import Picamera2
+        return Picamera2(0), Picamera2(1)
+
+    # The front camera is mounted upside down
+    def front_transform(self):
+        import libcamera
+        return libcamera.Transform(hflip=1, vflip=1)
+
+    def preview(self):
+        from picamera2 import Preview
+        return Preview.QTGL
+
+'''
+ReplayBackend
+
+Replays recorded side and front frames from folders of images or video files.
+
+side_source - the folder or video to replay for the side camera
+front_source - the folder or video to replay for the front camera
+frame_rate - the rate the frames are served at
+preload - the number of frames of each camera decoded up front (see ReplayCamera)
+'''
+class ReplayBackend():
+    name = 'replay'
+
+    def __init__(self, side_source, front_source, frame_rate=30.0, preload=0):
+        self.side_source = side_source
+        self.front_source = front_source
+        self.frame_rate = frame_rate
+        self.preload = preload
+
+    def open(self):
+        return (ReplayCamera(self.side_source, self.frame_rate, self.preload),
+                ReplayCamera(self.front_source, self.frame_rate, self.preload))
+
+    def front_transform(self):
+        return None
+
+    def preview(self):
+        return None
+
+'''
+SyntheticBackend
+
+Generates side and front frames.
+
+frame_rate - the rate the frames are served at
+size - the (width, height) of the frames
+'''
+class SyntheticBackend():
+    name = 'synthetic'
+
+    def __init__(self, frame_rate=30.0, size=(640, 480)):
+        self.frame_rate = frame_rate
+        self.size = size
+
+    def open(self):
+        return SyntheticCamera(0, self.frame_rate, self.size), SyntheticCamera(1, self.frame_rate, self.size)
+
+    def front_transform(self):
+        return None
+
+    def preview(self):
+        return None
+
+# The available backends by name
+BACKENDS = {
+    'picamera2': Picamera2Backend,
+    'replay': ReplayBackend,
+    'synthetic': SyntheticBackend,
+}
+
+'''
+create_backend()
+
+Creates the backend with the given name, passing any options to it.
+'''
+def create_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown camera backend \"{name}\", choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
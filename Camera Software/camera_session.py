@@ -0,0 +1,105 @@
+'''
+camera_session.py
+
+This script contains the dual-stream camera session used by camera.py.
+
+Both cameras are configured once with a full resolution main stream for capturing and a low resolution stream for
+the preview window.  The cameras are started a single time, so switching from the preview to capturing does not
+stop, reconfigure and restart the cameras or make auto-exposure converge a second time.
+'''
+
+# Necessary imports
+from time import monotonic, sleep
+
+# The size of the low resolution stream shown in the preview window
+PREVIEW_SIZE = (640, 480)
+
+'''
+CameraSession
+
+Configures and starts the side and front cameras once with a main and a preview stream.
+
+side_camera - Picamera2(0)
+front_camera - Picamera2(1)
+front_transform - the transform applied to the front camera (ie: libcamera.Transform(hflip=1, vflip=1))
+preview - the preview type to show (ie: Preview.QTGL), or None to disable the preview
+preview_size - the size of the low resolution preview stream
+video_fps - if given, the cameras are configured for recording video at this frame rate instead of still captures
+video_size - the size of the main stream when recording video
+'''
+class CameraSession():
+    def __init__(self, side_camera, front_camera, front_transform=None, preview=None, preview_size=PREVIEW_SIZE,
+                 video_fps=None, video_size=None):
+        self.side_camera = side_camera
+        self.front_camera = front_camera
+        self.preview = preview
+        self.started_at = monotonic()
+        self.first_capture_at = None
+        self.preview_time = 0.0
+
+        # Configure both cameras once with a full resolution main stream and a low resolution preview stream
+        for camera, transform in ((side_camera, None), (front_camera, front_transform)):
+            if video_fps is None:
+                config = camera.create_still_configuration(lores={"size": preview_size}, display="lores")
+            else:
+                main = {"size": video_size} if video_size is not None else {}
+                config = camera.create_video_configuration(main=main, lores={"size": preview_size}, display="lores",
+                                                           controls={"FrameRate": video_fps})
+            if transform is not None:
+                config["transform"] = transform
+            camera.configure(config)
+
+        # The preview has to be started before the cameras
+        if preview is not None:
+            side_camera.start_preview(preview)
+            front_camera.start_preview(preview)
+
+        side_camera.start()
+        front_camera.start()
+
+    '''
+    show_preview()
+
+    Shows the preview for the given number of seconds, then closes the preview windows.  The cameras keep running.
+    '''
+    def show_preview(self, seconds):
+        if self.preview is None:
+            return
+        sleep(seconds)
+        self.preview_time += seconds
+        self.side_camera.stop_preview()
+        self.front_camera.stop_preview()
+        self.preview = None
+
+    '''
+    mark_capture()
+
+    Records the time of the first capture of the session.
+    '''
+    def mark_capture(self):
+        if self.first_capture_at is None:
+            self.first_capture_at = monotonic()
+
+    '''
+    time_to_first_capture()
+
+    Returns the number of seconds between starting the session and the first capture, not counting the time spent
+    looking at the preview, or None if nothing was captured.
+    '''
+    def time_to_first_capture(self):
+        if self.first_capture_at is None:
+            return None
+        return self.first_capture_at - self.started_at - self.preview_time
+
+    '''
+    stop()
+
+    Closes the preview windows if they are still open and stops both cameras.
+    '''
+    def stop(self):
+        if self.preview is not None:
+            self.side_camera.stop_preview()
+            self.front_camera.stop_preview()
+            self.preview = None
+        self.side_camera.stop()
+        self.front_camera.stop()
@@ -0,0 +1,273 @@
+'''
+capture_benchmark.py
+
+This script benchmarks the capture pipeline of the transparent camera using the synthetic or replay camera backends,
+so it can be run on any computer and produces comparable numbers.  It compares the old sequential capture loop against
+the paired capture engine and reports the pairs per second along with the skew between the side and front sensor
+timestamps, then benchmarks encoding, archiving and the quality gate on the backend's frames.  Finally it hands the
+backend's front frames to another process over the shared memory frame bus and over the disk (a JPEG written and read
+back) at the camera's frame rate and reports the frames/s received and per-frame latency of both.
+'''
+
+# Necessary imports
+from camera_backends import create_backend
+from capture_engine import CapturedPair, PairedCaptureEngine, save_request
+from encoder_pool import EncoderPool, encode_jpeg
+from frame_bus import FrameBus
+from quality_gate import QualityGate
+from session_archive import SessionArchive
+from PIL import Image
+from time import monotonic, monotonic_ns
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+
+# Global configuration variables
+BENCHMARK_BACKEND = 'synthetic' # 'synthetic' or 'replay'
+REPLAY_SIDE_SOURCE = 'Side' # a folder of images or a video, only used by the replay backend
+REPLAY_FRONT_SOURCE = 'Front'
+REPLAY_PRELOAD = 0 # the number of frames per camera decoded up front (about 36 MB each at full resolution)
+NUMBER_OF_PAIRS = 40
+SENSOR_FRAME_RATE = 30.0
+TARGET_PAIR_RATE = None # None captures as fast as possible
+
+# Encoder benchmark settings
+ENCODE_FRAMES = 60
+ENCODE_FRAME_SIZE = (2304, 1296) # the 2x2 binned mode of the Camera Module 3, only used by the synthetic backend
+ENCODER_WORKER_COUNTS = [1, 2, 3, 4]
+
+# Archive benchmark settings
+ARCHIVE_NEW_PAIRS = 20
+ARCHIVE_HISTORY_PAIRS = [0, 100, 400] # pairs already in today's archive from earlier sessions
+
+# Quality gate benchmark settings
+QUALITY_PAIRS = 50
+
+# Frame handoff benchmark settings
+HANDOFF_FRAMES = 150 # captured from the backend's front camera at SENSOR_FRAME_RATE
+HANDOFF_BUS_NAME = 'capture_benchmark_frames'
+
+'''
+benchmark_sequential()
+
+Captures pairs the way camera.py used to: side camera first, then the front camera.
+'''
+def benchmark_sequential(side_camera, front_camera, output_dir):
+    total_skew = 0
+    start = monotonic()
+    for ii in range(NUMBER_OF_PAIRS):
+        side_request = side_camera.capture_request()
+        side_request.save("main", os.path.join(output_dir, f'side_{ii}.jpg'))
+        front_request = front_camera.capture_request()
+        front_request.save("main", os.path.join(output_dir, f'front_{ii}.jpg'))
+        total_skew += abs(side_request.get_metadata()['SensorTimestamp'] - front_request.get_metadata()['SensorTimestamp'])
+    elapsed = monotonic() - start
+    return {'pairs_per_second': NUMBER_OF_PAIRS / elapsed, 'mean_skew_ms': total_skew / NUMBER_OF_PAIRS / 1e6}
+
+'''
+benchmark_paired()
+
+Captures pairs with the PairedCaptureEngine.
+'''
+def benchmark_paired(side_camera, front_camera, output_dir):
+    engine = PairedCaptureEngine(side_camera, front_camera, TARGET_PAIR_RATE)
+    for ii in range(NUMBER_OF_PAIRS):
+        engine.capture_pair(ii,
+                            save_request(os.path.join(output_dir, f'side_{ii}.jpg')),
+                            save_request(os.path.join(output_dir, f'front_{ii}.jpg')))
+    engine.close()
+    return engine.stats()
+
+'''
+benchmark_encoder()
+
+Replays synthetic frames through an EncoderPool with the given number of workers and returns frames/s.
+'''
+def benchmark_encoder(frame, workers, output_dir):
+    encoder = EncoderPool(workers, queue_size=2 * workers)
+    start = monotonic()
+    for ii in range(ENCODE_FRAMES):
+        encoder.submit(frame, os.path.join(output_dir, f'encoded_{ii}.jpg'))
+    encoder.close()
+    elapsed = monotonic() - start
+    results = encoder.stats()
+    results['frames_per_second'] = ENCODE_FRAMES / elapsed
+    return results
+
+'''
+benchmark_archive()
+
+Appends ARCHIVE_NEW_PAIRS pairs to an archive that already holds history_pairs pairs and returns the seconds spent.
+'''
+def benchmark_archive(frame, history_pairs, output_dir):
+    root_dir = os.path.join(output_dir, f'archive_{history_pairs}')
+    download_dir = os.path.join(root_dir, 'download')
+    os.makedirs(os.path.join(root_dir, 'Side'), exist_ok=True)
+    os.makedirs(os.path.join(root_dir, 'Front'), exist_ok=True)
+    side_path = os.path.join(root_dir, 'Side', 'side.jpg')
+    front_path = os.path.join(root_dir, 'Front', 'front.jpg')
+    encode_jpeg(frame, side_path)
+    encode_jpeg(frame, front_path)
+
+    # Fill the archive with earlier sessions
+    archive = SessionArchive('benchmark', root_dir, download_dir)
+    for ii in range(history_pairs):
+        archive.add_file(side_path, f'Side/history_side_{ii}.jpg')
+        archive.add_file(front_path, f'Front/history_front_{ii}.jpg')
+    archive.close()
+
+    # Time a new session
+    start = monotonic()
+    archive = SessionArchive('benchmark', root_dir, download_dir)
+    for ii in range(ARCHIVE_NEW_PAIRS):
+        archive.add_file(side_path, f'Side/side_{ii}.jpg')
+        archive.add_file(front_path, f'Front/front_{ii}.jpg')
+    archive.close()
+    return monotonic() - start
+
+'''
+benchmark_quality_gate()
+
+Scores QUALITY_PAIRS pairs of full resolution frames and returns the mean milliseconds spent per pair.
+'''
+def benchmark_quality_gate(frame):
+    gate = QualityGate(drop=False)
+    start = monotonic()
+    for ii in range(QUALITY_PAIRS):
+        gate.check(CapturedPair(ii, frame, frame, 0, 0))
+    elapsed = monotonic() - start
+    gate.close()
+    return elapsed / QUALITY_PAIRS * 1000
+
+'''
+bus_consumer()
+
+Reads the newest frame from the frame bus until it is closed, recording the latency of every frame it gets.
+'''
+def bus_consumer(name, ready, results):
+    bus = FrameBus(name)
+    ready.set()
+    latencies = []
+    sequence = 0
+    while True:
+        frame = bus.read(sequence)
+        if frame is None:
+            break
+        sequence, handed_over, _, _ = frame
+        latencies.append(monotonic_ns() - handed_over)
+    bus.close()
+    results.put(latencies)
+
+'''
+disk_consumer()
+
+Decodes every JPEG whose path arrives on the queue, recording the latency of every frame.
+'''
+def disk_consumer(paths, results):
+    latencies = []
+    while True:
+        item = paths.get()
+        if item is None:
+            break
+        file_path, handed_over = item
+        np.asarray(Image.open(file_path).convert('RGB'))
+        latencies.append(monotonic_ns() - handed_over)
+    results.put(latencies)
+
+'''
+handoff_stats()
+
+Returns the number of frames received, the frames/s received and their latency percentiles.
+'''
+def handoff_stats(latencies, elapsed):
+    percentiles = np.percentile(np.array(latencies) / 1e6, [50, 99]) if latencies else [0.0, 0.0]
+    return {'frames': len(latencies), 'frames_per_second': len(latencies) / elapsed,
+            'p50_latency_ms': percentiles[0], 'p99_latency_ms': percentiles[1]}
+
+'''
+benchmark_frame_bus()
+
+Publishes HANDOFF_FRAMES frames of a camera on a frame bus as the camera delivers them, while another process reads
+the newest one.  The reader skips frames it did not get to in time, like the eye tracker does.  The latency runs from
+the moment a frame is handed to publish() until the reader has a view of it.
+'''
+def benchmark_frame_bus(camera):
+    results = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    bus = FrameBus(HANDOFF_BUS_NAME, camera.capture_array().shape)
+    consumer = multiprocessing.Process(target=bus_consumer, args=(HANDOFF_BUS_NAME, ready, results))
+    consumer.start()
+    ready.wait()
+    start = monotonic()
+    for ii in range(HANDOFF_FRAMES):
+        frame = camera.capture_array()
+        bus.publish(frame, monotonic_ns())
+    bus.close()
+    latencies = results.get()
+    elapsed = monotonic() - start
+    consumer.join()
+    return handoff_stats(latencies, elapsed)
+
+'''
+benchmark_disk_handoff()
+
+Writes HANDOFF_FRAMES frames of a camera as JPEGs as the camera delivers them and hands their paths to another
+process that reads them back, the way the eye tracker used to get its frames.  The latency runs from the moment the
+encoding starts until the frame is decoded.
+'''
+def benchmark_disk_handoff(camera, output_dir):
+    results = multiprocessing.Queue()
+    paths = multiprocessing.Queue(maxsize=2)
+    consumer = multiprocessing.Process(target=disk_consumer, args=(paths, results))
+    consumer.start()
+    start = monotonic()
+    for ii in range(HANDOFF_FRAMES):
+        frame = camera.capture_array()
+        handed_over = monotonic_ns()
+        file_path = os.path.join(output_dir, f'handoff_{ii}.jpg')
+        encode_jpeg(frame, file_path)
+        paths.put((file_path, handed_over))
+    paths.put(None)
+    latencies = results.get()
+    elapsed = monotonic() - start
+    consumer.join()
+    return handoff_stats(latencies, elapsed)
+
+if __name__ == "__main__":
+    if BENCHMARK_BACKEND == 'replay':
+        backend = create_backend('replay', side_source=REPLAY_SIDE_SOURCE, front_source=REPLAY_FRONT_SOURCE,
+                                 frame_rate=SENSOR_FRAME_RATE, preload=REPLAY_PRELOAD)
+    else:
+        backend = create_backend('synthetic', frame_rate=SENSOR_FRAME_RATE, size=ENCODE_FRAME_SIZE)
+    side_camera, front_camera = backend.open()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        print(f"Capturing {NUMBER_OF_PAIRS} pairs from {backend.name} {SENSOR_FRAME_RATE:g} fps cameras...")
+        results = benchmark_sequential(side_camera, front_camera, output_dir)
+        print(f"Sequential:  {results['pairs_per_second']:.2f} pairs/s, mean skew {results['mean_skew_ms']:.2f} ms")
+        results = benchmark_paired(side_camera, front_camera, output_dir)
+        print(f"Paired:      {results['pairs_per_second']:.2f} pairs/s, mean skew {results['mean_skew_ms']:.2f} ms, max skew {results['max_skew_ms']:.2f} ms")
+
+        frame = side_camera.capture_array()
+        frame_size = f"{frame.shape[1]}x{frame.shape[0]}"
+        print(f"\nEncoding {ENCODE_FRAMES} {backend.name} {frame_size} frames...")
+        for workers in ENCODER_WORKER_COUNTS:
+            results = benchmark_encoder(frame, workers, output_dir)
+            print(f"{workers} worker(s):  {results['frames_per_second']:.2f} frames/s, mean encode {results['mean_encode_ms']:.1f} ms")
+
+        print(f"\nAppending {ARCHIVE_NEW_PAIRS} new pairs to today's archive...")
+        for history_pairs in ARCHIVE_HISTORY_PAIRS:
+            elapsed = benchmark_archive(frame, history_pairs, output_dir)
+            print(f"{history_pairs} earlier pairs:  {elapsed:.3f} s")
+
+        milliseconds = benchmark_quality_gate(frame)
+        print(f"\nQuality gate:  {milliseconds:.2f} ms per {frame_size} pair ({1000 / milliseconds:.1f} pairs/s)")
+
+        print(f"\nHanding {HANDOFF_FRAMES} {frame_size} frames from a {SENSOR_FRAME_RATE:g} fps camera to another process...")
+        for name, results in (("Frame bus", benchmark_frame_bus(front_camera)), ("Disk (JPEG)", benchmark_disk_handoff(front_camera, output_dir))):
+            print(f"{name + ':':<13}{results['frames_per_second']:8.1f} frames/s received, {results['frames']} frames received, "
+                  f"latency p50 {results['p50_latency_ms']:.2f} ms, p99 {results['p99_latency_ms']:.2f} ms")
+
+    side_camera.close()
+    front_camera.close()
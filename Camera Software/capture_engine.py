@@ -0,0 +1,167 @@
+'''
+capture_engine.py
+
+This script contains the paired capture engine used by camera.py.
+
+Instead of capturing the side camera and then the front camera one after the other, the engine keeps one
+worker thread per camera and releases both of them at the same moment.  Every captured pair records the
+sensor timestamps reported by each camera along with the skew between them.
+'''
+
+# Necessary imports
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+import threading
+
+'''
+CapturedPair
+
+Holds the results of a single simultaneous capture from the side and front cameras.
+
+index - the image index of the pair
+side_result - whatever the side action returned
+front_result - whatever the front action returned
+side_timestamp - the side camera's sensor timestamp in nanoseconds
+front_timestamp - the front camera's sensor timestamp in nanoseconds
+'''
+class CapturedPair():
+    def __init__(self, index, side_result, front_result, side_timestamp, front_timestamp):
+        self.index = index
+        self.side_result = side_result
+        self.front_result = front_result
+        self.side_timestamp = side_timestamp
+        self.front_timestamp = front_timestamp
+
+    # The absolute difference between the two sensor timestamps in nanoseconds
+    @property
+    def skew(self):
+        return abs(self.side_timestamp - self.front_timestamp)
+
+    # The skew in milliseconds, which is easier to read when printing
+    @property
+    def skew_ms(self):
+        return self.skew / 1e6
+
+'''
+save_request()
+
+Returns an action that saves the main stream of a completed request to file_path.
+'''
+def save_request(file_path):
+    def action(request):
+        request.save("main", file_path)
+        return file_path
+    return action
+
+'''
+PairedCaptureEngine
+
+Triggers both cameras at the same time from worker threads and paces the pairs at a target rate.
+
+side_camera - the camera looking through the edge of the acrylic (Picamera2(0))
+front_camera - the camera looking straight through the acrylic (Picamera2(1))
+target_pair_rate - the number of pairs per second to aim for, or None to capture as fast as possible
+'''
+class PairedCaptureEngine():
+    def __init__(self, side_camera, front_camera, target_pair_rate=None):
+        self.side_camera = side_camera
+        self.front_camera = front_camera
+        self.target_pair_rate = target_pair_rate
+
+        # One worker per camera so that both capture requests are in flight at the same time
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="capture")
+        self.barrier = threading.Barrier(2)
+
+        # Pacing and statistics
+        self.next_trigger = None
+        self.first_trigger = None
+        self.last_finish = None
+        self.pair_count = 0
+        self.total_skew = 0
+        self.max_skew = 0
+
+    '''
+    _capture()
+
+    Runs on a worker thread.  Waits for the other worker so both cameras are triggered together, then
+    captures a request, hands it to action and releases it back to the camera.
+    '''
+    def _capture(self, camera, action):
+        self.barrier.wait()
+        request = camera.capture_request()
+        try:
+            timestamp = request.get_metadata()["SensorTimestamp"]
+            result = action(request)
+        finally:
+            request.release()
+        return result, timestamp
+
+    '''
+    _wait_for_slot()
+
+    Sleeps until it is time to trigger the next pair according to the target pair rate.
+    '''
+    def _wait_for_slot(self):
+        now = monotonic()
+        if self.target_pair_rate is None or self.next_trigger is None:
+            self.next_trigger = now
+        elif now < self.next_trigger:
+            sleep(self.next_trigger - now)
+        else:
+            # We are running behind, so do not try to catch up with a burst of pairs
+            self.next_trigger = now
+
+        if self.target_pair_rate is not None:
+            self.next_trigger += 1.0 / self.target_pair_rate
+
+    '''
+    capture_pair()
+
+    Captures one pair from both cameras at the same time and returns a CapturedPair.
+
+    index - the image index of the pair
+    side_action - called with the side camera's request, usually save_request(path)
+    front_action - called with the front camera's request, usually save_request(path)
+    '''
+    def capture_pair(self, index, side_action, front_action):
+        self._wait_for_slot()
+        if self.first_trigger is None:
+            self.first_trigger = monotonic()
+
+        side_future = self.executor.submit(self._capture, self.side_camera, side_action)
+        front_future = self.executor.submit(self._capture, self.front_camera, front_action)
+        side_result, side_timestamp = side_future.result()
+        front_result, front_timestamp = front_future.result()
+
+        pair = CapturedPair(index, side_result, front_result, side_timestamp, front_timestamp)
+
+        # Keep running statistics so the session can be summarised at the end
+        self.last_finish = monotonic()
+        self.pair_count += 1
+        self.total_skew += pair.skew
+        self.max_skew = max(self.max_skew, pair.skew)
+        return pair
+
+    '''
+    stats()
+
+    Returns a dictionary with the achieved pairs per second and the mean/max skew in milliseconds.
+    '''
+    def stats(self):
+        if self.pair_count == 0:
+            return {'pairs': 0, 'pairs_per_second': 0.0, 'mean_skew_ms': 0.0, 'max_skew_ms': 0.0}
+        elapsed = self.last_finish - self.first_trigger
+        return {
+            'pairs': self.pair_count,
+            'pairs_per_second': self.pair_count / elapsed if elapsed > 0 else float('inf'),
+            'mean_skew_ms': self.total_skew / self.pair_count / 1e6,
+            'max_skew_ms': self.max_skew / 1e6,
+        }
+
+    '''
+    close()
+
+    Shuts down the worker threads.
+    '''
+    def close(self):
+        self.executor.shutdown(wait=True)
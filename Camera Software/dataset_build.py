@@ -0,0 +1,394 @@
+'''
+dataset_build.py
+
+This script builds a pix2pixHD dataset from finished capture sessions in a single pass.
+
+Building a dataset used to mean unzipping every session archive, running image_resizer.py over the Front and Side
+folders and copying the images into train_A, train_B, test_A and test_B by hand, with every step reading every image
+again.  The build reads each pair once, straight out of the session archive (IMAGE_ID-MM-DD-YYYY.zip) or folder, and
+on a pool of worker processes:
+- matches the side and front images by their image index,
+- hashes the contents of the pair,
+- decodes both images at a reduced resolution and resizes them to BUILD_LOAD_SIZE wide (optionally warping the side
+  image with a rectification from rectification.py),
+- puts the pair into the train or test split depending on its hash, so a pair always lands in the same split no
+  matter which order or in which run it was added,
+- and optionally drops pairs that look the same as a pair already in the dataset (BUILD_DEDUPE).
+
+Every pair is recorded in build_manifest.csv, keyed by its source and side image, along with its content hash and
+the size and CRC (or modification time) of its source files.  Pairs whose source files have not changed since they
+were built (with the same settings) are skipped without reading them, so re-running the build as new sessions come in
+only resizes the new pairs.  A pair whose source files changed replaces its old images, and the images of pairs that
+are no longer in their source (or whose source is gone) are removed.  The {phase}_manifest.csv files that
+AlignedDataset reads its pairs from are rewritten at the end of every build, so the dataset root should only be
+written to by this script.
+
+    python dataset_build.py dataset_root source [source ...]
+
+where every source is a session archive, a session folder containing the Side and Front folders, or a folder of
+session archives (ie: the camera's download directory).
+'''
+
+# Necessary imports
+from dataset_export import MANIFEST_FIELDS, manifest_path, scaled_size
+from encoder_pool import encode_jpeg
+from multiprocessing import Pool
+from PIL import Image
+from rectification import SideRectifier, load_calibration
+from time import monotonic
+import csv
+import hashlib
+import io
+import numpy as np
+import os
+import re
+import sys
+import zipfile
+
+# Global configuration variables
+BUILD_LOAD_SIZE = 1024 # the width of the dataset images, this should match pix2pixHD's --loadSize
+BUILD_TEST_FRACTION = 0.1 # the fraction of the pairs that go into the test split
+BUILD_DEDUPE = False # drop pairs that look the same as a pair that is already in the dataset
+BUILD_RECTIFICATION = None # a calibration from rectification.py to warp the side images with, or None
+BUILD_WORKERS = os.cpu_count()
+BUILD_QUALITY = 90
+
+# The name of the build manifest inside the dataset root and its columns
+BUILD_MANIFEST_NAME = 'build_manifest.csv'
+BUILD_MANIFEST_FIELDS = ['source', 'side', 'front', 'stamp', 'hash', 'phase', 'A', 'B', 'index', 'dhash', 'settings']
+
+# The image types that are read from the sessions
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Finds the image index in a side or front image's name (ie: subject_side_12.jpg)
+INDEX_PATTERN = re.compile(r'_(?:side|front)_(\d+)\.')
+
+'''
+list_sessions()
+
+Returns the session archives and folders in a source.  Folders that do not contain the Side and Front folders are
+searched for session archives instead.
+'''
+def list_sessions(source):
+    source = os.path.abspath(source)
+    if zipfile.is_zipfile(source):
+        return [source]
+    if os.path.isdir(os.path.join(source, 'Side')) and os.path.isdir(os.path.join(source, 'Front')):
+        return [source]
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source)) if name.endswith('.zip')]
+    raise FileNotFoundError(f"\"{source}\" is not a session archive or folder")
+
+'''
+list_source_pairs()
+
+Returns the (session, side_name, front_name, stamp) of every pair in a session archive or folder, matched by their
+image index.  The stamp is made of the size and CRC (archives) or modification time (folders) of both images, so a
+changed pair can be found without reading it.
+'''
+def list_source_pairs(session):
+    if os.path.isdir(session):
+        stamps = {}
+        for folder in ('Side', 'Front'):
+            for name in os.listdir(os.path.join(session, folder)):
+                stat = os.stat(os.path.join(session, folder, name))
+                stamps[f'{folder}/{name}'] = f'{stat.st_size}:{stat.st_mtime_ns}'
+    else:
+        with zipfile.ZipFile(session) as archive:
+            stamps = {info.filename: f'{info.file_size}:{info.CRC:08x}' for info in archive.infolist()}
+
+    images = [name for name in stamps if name.lower().endswith(IMAGE_EXTENSIONS)]
+    front_names = {name.replace('Front/', 'Side/', 1).replace('_front_', '_side_'): name for name in images if name.startswith('Front/')}
+    return [(session, name, front_names[name], f'{stamps[name]}/{stamps[front_names[name]]}')
+            for name in sorted(images) if name.startswith('Side/') and name in front_names]
+
+'''
+build_settings()
+
+Returns a short description of the settings the images are built with.  Pairs built with different settings are
+built again.
+'''
+def build_settings(load_size, rectification):
+    if rectification is None:
+        return f'{load_size}'
+    with open(rectification, 'rb') as calibration_file:
+        return f'{load_size}:{hashlib.sha1(calibration_file.read()).hexdigest()[:12]}'
+
+'''
+pair_hash()
+
+Returns the content hash of a pair.
+'''
+def pair_hash(side_bytes, front_bytes):
+    digest = hashlib.sha1(side_bytes)
+    digest.update(front_bytes)
+    return digest.hexdigest()
+
+'''
+split_phase()
+
+Returns the split a pair belongs to.  It only depends on the pair's hash, so it never changes between builds.
+'''
+def split_phase(content_hash, test_fraction):
+    return 'test' if int(content_hash[:8], 16) / 0x100000000 < test_fraction else 'train'
+
+'''
+difference_hash()
+
+Returns the 64 bit difference hash of an image as a hex string.  Images that look the same have the same hash even
+if they were encoded differently.
+'''
+def difference_hash(image):
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return f'{int("".join("1" if bit else "0" for bit in bits), 2):016x}'
+
+'''
+read_manifest() / write_manifest()
+
+Reads the build manifest of a dataset into a dictionary keyed by the (source, side) of every pair, and writes it back.
+'''
+def read_manifest(dataset_root):
+    path = os.path.join(dataset_root, BUILD_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as manifest_file:
+        return {(row['source'], row['side']): row for row in csv.DictReader(manifest_file)}
+
+def write_manifest(dataset_root, entries):
+    path = os.path.join(dataset_root, BUILD_MANIFEST_NAME)
+    with open(path + '.partial', 'w', newline='') as manifest_file:
+        writer = csv.DictWriter(manifest_file, BUILD_MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(sorted(entries.values(), key=lambda entry: (entry['source'], entry['side'])))
+    os.replace(path + '.partial', path)
+
+'''
+write_phase_manifests()
+
+Rewrites the {phase}_manifest.csv files that AlignedDataset pairs the images with.
+'''
+def write_phase_manifests(dataset_root, entries):
+    for phase in ('train', 'test'):
+        rows = sorted((entry for entry in entries.values() if entry['phase'] == phase), key=lambda entry: entry['A'])
+        path = manifest_path(dataset_root, phase)
+        with open(path + '.partial', 'w', newline='') as manifest_file:
+            writer = csv.writer(manifest_file)
+            writer.writerow(MANIFEST_FIELDS)
+            writer.writerows([entry['A'], entry['B'], entry['index'], ''] for entry in rows)
+        os.replace(path + '.partial', path)
+
+# The state of every worker process, set up once by init_worker()
+worker = {}
+
+'''
+init_worker()
+
+Sets up a worker process with the build settings.
+'''
+def init_worker(dataset_root, load_size, test_fraction, rectification, settings):
+    worker['dataset_root'] = dataset_root
+    worker['load_size'] = load_size
+    worker['test_fraction'] = test_fraction
+    worker['rectifier'] = SideRectifier(load_calibration(rectification)) if rectification else None
+    worker['settings'] = settings
+    worker['archives'] = {}
+
+'''
+read_source_file()
+
+Returns the bytes of an image in a session archive or folder, keeping the archives open between pairs.
+'''
+def read_source_file(source, name):
+    if os.path.isdir(source):
+        with open(os.path.join(source, name), 'rb') as image_file:
+            return image_file.read()
+    if source not in worker['archives']:
+        worker['archives'][source] = zipfile.ZipFile(source)
+    return worker['archives'][source].read(name)
+
+'''
+build_image()
+
+Decodes an image at the smallest resolution that is still at least load_size wide, then resizes it to load_size wide
+and writes it.  Returns the difference hash of the image.
+'''
+def build_image(image_bytes, output_path, load_size, transform=None):
+    image = Image.open(io.BytesIO(image_bytes))
+    size = scaled_size(image.width, image.height, load_size)
+    image.draft('RGB', size)
+    image = image.convert('RGB')
+    encode_jpeg(np.asarray(image), output_path, BUILD_QUALITY, size, transform)
+    return difference_hash(image)
+
+'''
+build_pair()
+
+Hashes a pair and, unless its contents are the same as when it was last built, resizes it into its split.  Runs on
+the worker processes.
+
+task - the (session, side_name, front_name, stamp) of the pair and the content hash it was last built with, or None
+
+Returns the pair's manifest entry, or None if its contents have not changed.
+'''
+def build_pair(task):
+    (source, side_name, front_name, stamp), built_hash = task
+    side_bytes = read_source_file(source, side_name)
+    front_bytes = read_source_file(source, front_name)
+    content_hash = pair_hash(side_bytes, front_bytes)
+    if content_hash == built_hash:
+        return None
+
+    phase = split_phase(content_hash, worker['test_fraction'])
+    match = INDEX_PATTERN.search(side_name)
+    file_name = f"{os.path.splitext(os.path.basename(side_name))[0].replace('_side_', '_')}_{content_hash[:8]}.jpg"
+    entry = {
+        'source': source,
+        'side': side_name,
+        'front': front_name,
+        'stamp': stamp,
+        'hash': content_hash,
+        'phase': phase,
+        'A': f'{phase}_A/{file_name}',
+        'B': f'{phase}_B/{file_name}',
+        'index': match.group(1) if match else '',
+        'settings': worker['settings'],
+    }
+    dataset_root = worker['dataset_root']
+    side_dhash = build_image(side_bytes, os.path.join(dataset_root, entry['A']), worker['load_size'], worker['rectifier'])
+    front_dhash = build_image(front_bytes, os.path.join(dataset_root, entry['B']), worker['load_size'])
+    entry['dhash'] = side_dhash + front_dhash
+    return entry
+
+'''
+remove_outputs()
+
+Removes the images of the given pairs from the dataset, except for images that a pair still in the dataset uses (the
+same pair can be in two sources, ie: a session folder and its archive).
+'''
+def remove_outputs(dataset_root, removed, entries):
+    in_use = {entry[key] for entry in entries.values() if entry['phase'] in ('train', 'test') for key in ('A', 'B')}
+    for entry in removed:
+        for key in ('A', 'B'):
+            path = os.path.join(dataset_root, entry[key])
+            if entry[key] not in in_use and os.path.exists(path):
+                os.remove(path)
+
+'''
+already_built()
+
+Returns True if a pair in the manifest was built with the given settings and its images still exist.  Duplicates are
+only kept out of the dataset while dedupe is on, and copies of a pair in another source are kept as long as that
+pair is.
+'''
+def already_built(dataset_root, entry, settings, dedupe):
+    if entry['settings'] != settings:
+        return False
+    if entry['phase'] == 'duplicate':
+        return dedupe
+    if entry['phase'] == 'copy':
+        return True
+    return all(os.path.exists(os.path.join(dataset_root, entry[key])) for key in ('A', 'B'))
+
+'''
+build_dataset()
+
+Builds every pair of the sources that is not in the dataset yet or whose source files changed, and removes the pairs
+that are no longer in their sources.
+
+Returns the number of pairs that were built, skipped because they were already built, dropped as duplicates and
+removed.
+'''
+def build_dataset(dataset_root, sources, load_size=BUILD_LOAD_SIZE, test_fraction=BUILD_TEST_FRACTION,
+                  dedupe=BUILD_DEDUPE, rectification=BUILD_RECTIFICATION, workers=BUILD_WORKERS):
+    for phase in ('train', 'test'):
+        os.makedirs(os.path.join(dataset_root, f'{phase}_A'), exist_ok=True)
+        os.makedirs(os.path.join(dataset_root, f'{phase}_B'), exist_ok=True)
+
+    sessions = [session for source in sources for session in list_sessions(source)]
+    pairs = {(pair[0], pair[1]): pair for session in sessions for pair in list_source_pairs(session)}
+    listed = set(sessions)
+    counts = {'built': 0, 'skipped': 0, 'duplicates': 0, 'removed': 0}
+
+    # Remove the pairs that are no longer in a session that was listed or whose session is gone, along with the pairs
+    # that were not built with the current settings or lost their images (these are built again)
+    settings = build_settings(load_size, rectification)
+    entries = read_manifest(dataset_root)
+    removed = []
+    for key, entry in list(entries.items()):
+        gone = key not in pairs and (entry['source'] in listed or not os.path.exists(entry['source']))
+        if gone or not already_built(dataset_root, entry, settings, dedupe):
+            removed.append(entries.pop(key))
+            counts['removed'] += gone
+
+    # Copies are only kept while the pair they are a copy of is
+    holders = {entry['hash']: key for key, entry in entries.items() if entry['phase'] in ('train', 'test')}
+    for key, entry in list(entries.items()):
+        if entry['phase'] == 'copy' and entry['hash'] not in holders:
+            removed.append(entries.pop(key))
+    looks = {entry['dhash']: key for key, entry in entries.items() if entry['phase'] in ('train', 'test')}
+
+    # Pairs whose source files have not changed are skipped without reading them, the rest are hashed and only built
+    # if their contents changed
+    tasks = []
+    for key, pair in pairs.items():
+        if key in entries and entries[key].get('stamp') == pair[3]:
+            counts['skipped'] += 1
+        else:
+            tasks.append((pair, entries[key]['hash'] if key in entries else None))
+
+    with Pool(max(1, workers), initializer=init_worker,
+              initargs=(dataset_root, load_size, test_fraction, rectification, settings)) as pool:
+        # The results come back in order, so the same pair of two duplicates is always kept
+        for (pair, built_hash), entry in zip(tasks, pool.imap(build_pair, tasks, chunksize=4)):
+            key = (pair[0], pair[1])
+            if entry is None:
+                # Only the stamp changed (ie: the session folder was copied)
+                entries[key]['stamp'] = pair[3]
+                counts['skipped'] += 1
+                continue
+
+            # The pair changed, so its old images are replaced
+            if key in entries:
+                old = entries.pop(key)
+                removed.append(old)
+                if holders.get(old['hash']) == key:
+                    del holders[old['hash']]
+                if looks.get(old['dhash']) == key:
+                    del looks[old['dhash']]
+
+            if entry['hash'] in holders:
+                # The same pair was found in two sources, ie: a session folder and its archive
+                entry['phase'] = 'copy'
+                counts['skipped'] += 1
+            elif dedupe and entry['dhash'] in looks:
+                removed.append(dict(entry))
+                entry['phase'] = 'duplicate'
+                counts['duplicates'] += 1
+            else:
+                holders[entry['hash']] = key
+                looks[entry['dhash']] = key
+                counts['built'] += 1
+            entries[key] = entry
+
+    # Copies of a pair that changed are built again by the next build
+    for key, entry in list(entries.items()):
+        if entry['phase'] == 'copy' and entry['hash'] not in holders:
+            del entries[key]
+
+    remove_outputs(dataset_root, removed, entries)
+    write_manifest(dataset_root, entries)
+    write_phase_manifests(dataset_root, entries)
+    return counts
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 3):
+        print("Usage:  python dataset_build.py dataset_root source [source ...]")
+    else:
+        start = monotonic()
+        counts = build_dataset(sys.argv[1], sys.argv[2:])
+        elapsed = monotonic() - start
+        print(f"Built {counts['built']} pairs, skipped {counts['skipped']} that were already built, dropped "
+              f"{counts['duplicates']} duplicates and removed {counts['removed']} that are no longer in their sources "
+              f"in {elapsed:.1f} s ({(counts['built'] + counts['duplicates']) / elapsed:.1f} pairs/s)")
+        print(f"See {os.path.join(sys.argv[1], BUILD_MANIFEST_NAME)} for every pair")
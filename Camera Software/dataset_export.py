@@ -0,0 +1,122 @@
+'''
+dataset_export.py
+
+This script contains the pix2pixHD dataset exporter used by camera.py.
+
+Instead of capturing to the Front and Side folders, resizing every image with image_resizer.py and copying them by
+hand into train_A and train_B, the exporter writes each captured pair straight into the pix2pixHD dataset layout
+at the training loadSize in the same pass as the capture.  Side images go into {phase}_A and front images go into
+{phase}_B.  Every pair is also written to {phase}_manifest.csv, which AlignedDataset uses to pair the images
+explicitly instead of relying on two sorted directory listings lining up.  A pair is only added to the manifest once
+both of its images have been written, so the manifest never lists images that are missing after a crash.
+'''
+
+# Necessary imports
+import csv
+import os
+import threading
+
+# The columns of the manifest, the A and B paths are relative to the dataset root
+MANIFEST_FIELDS = ['A', 'B', 'index', 'skew_ms']
+
+'''
+manifest_path()
+
+Returns the path of the pair manifest for the given dataset phase.
+'''
+def manifest_path(dataset_root, phase='train'):
+    return os.path.join(dataset_root, f'{phase}_manifest.csv')
+
+'''
+scaled_size()
+
+Returns the (width, height) of a frame scaled to load_size wide, matching pix2pixHD's scale_width option.
+'''
+def scaled_size(width, height, load_size):
+    return (load_size, int(load_size * height / width))
+
+'''
+DatasetExporter
+
+Writes captured pairs into a pix2pixHD dataset through an EncoderPool.
+
+dataset_root - the pix2pixHD dataroot (ie: pix2pixHD/datasets/transparent_camera)
+encoder - the EncoderPool used to resize and write the images
+image_id - the name of the saved data (ie: subject name)
+phase - the dataset phase to write (ie: train or test)
+load_size - the width the images are resized to, this should match --loadSize
+rectifier - optionally warps the side images into the front camera's view (see rectification.py)
+'''
+class DatasetExporter():
+    def __init__(self, dataset_root, encoder, image_id, phase='train', load_size=1024, rectifier=None):
+        self.dataset_root = dataset_root
+        self.encoder = encoder
+        self.rectifier = rectifier
+        self.image_id = image_id
+        self.load_size = load_size
+        self.dir_A = os.path.join(dataset_root, f'{phase}_A')
+        self.dir_B = os.path.join(dataset_root, f'{phase}_B')
+        os.makedirs(self.dir_A, exist_ok=True)
+        os.makedirs(self.dir_B, exist_ok=True)
+
+        self.manifest_path = manifest_path(dataset_root, phase)
+        new_manifest = not os.path.exists(self.manifest_path)
+        self.manifest_file = open(self.manifest_path, 'a', newline='')
+        self.manifest = csv.writer(self.manifest_file)
+        if new_manifest:
+            self.manifest.writerow(MANIFEST_FIELDS)
+        self.exported = 0
+
+        # The manifest rows of the pairs whose images are still being written, by image path
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    '''
+    export_pair()
+
+    Queues a pair to be resized and written into the dataset.  It is recorded in the manifest once both of its images
+    have been written.
+
+    pair - the CapturedPair from the capture engine, side_result and front_result must be arrays
+    '''
+    def export_pair(self, pair):
+        file_name = f'{self.image_id}_{pair.index}.jpg'
+        A_path = os.path.join(self.dir_A, file_name)
+        B_path = os.path.join(self.dir_B, file_name)
+        record = {'A': A_path, 'B': B_path,
+                  'row': [os.path.relpath(A_path, self.dataset_root).replace(os.sep, '/'),
+                          os.path.relpath(B_path, self.dataset_root).replace(os.sep, '/'),
+                          pair.index, f'{pair.skew_ms:.3f}']}
+        with self.lock:
+            self.pending[A_path] = record
+            self.pending[B_path] = record
+
+        height, width = pair.side_result.shape[:2]
+        self.encoder.submit(pair.side_result, A_path, scaled_size(width, height, self.load_size), self.rectifier, notify=False, written=self.file_written)
+        height, width = pair.front_result.shape[:2]
+        self.encoder.submit(pair.front_result, B_path, scaled_size(width, height, self.load_size), notify=False, written=self.file_written)
+
+    '''
+    file_written()
+
+    Called by the encoder threads with the path of every image once it has been written.  The pair's manifest row is
+    written once neither of its images is pending anymore.
+    '''
+    def file_written(self, file_path):
+        with self.lock:
+            record = self.pending.pop(file_path, None)
+            if record is None or record['A'] in self.pending or record['B'] in self.pending:
+                return
+            self.manifest.writerow(record['row'])
+            self.manifest_file.flush()
+            self.exported += 1
+
+    '''
+    close()
+
+    Closes the manifest.  The encoder has to be closed first to finish writing the images, pairs that are still
+    pending then were not written completely.
+    '''
+    def close(self):
+        with self.lock:
+            self.manifest_file.close()
@@ -0,0 +1,145 @@
+'''
+encoder_pool.py
+
+This script contains the background JPEG encoder pool used by camera.py.
+
+Capturing straight to a file makes the capture loop wait while each frame is encoded and written to the SD card.
+The encoder pool lets the capture loop hand raw arrays to a bounded in-memory queue instead.  A pool of worker
+threads takes frames off the queue and writes the JPEGs.  When the queue is full, submit() blocks until a worker
+frees up a slot, so frames are never dropped.
+'''
+
+# Necessary imports
+from PIL import Image
+from time import monotonic
+import numpy as np
+import queue
+import threading
+
+'''
+array_request()
+
+Returns an action for the capture engine that copies the main stream of a request into a numpy array.
+'''
+def array_request():
+    def action(request):
+        return request.make_array("main")
+    return action
+
+'''
+encode_jpeg()
+
+Encodes an RGB array to a JPEG at file_path, optionally resizing it to size (width, height) first and then applying
+transform (a function from array to array, ie: a SideRectifier).
+'''
+def encode_jpeg(array, file_path, quality=90, size=None, transform=None):
+    image = Image.fromarray(array)
+    if size is not None and image.size != tuple(size):
+        # reducing_gap shrinks large frames with a cheap box filter before the bicubic pass
+        image = image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+    if transform is not None:
+        image = Image.fromarray(transform(np.asarray(image)))
+    image.save(file_path, quality=quality)
+
+'''
+EncoderPool
+
+A bounded queue of raw frames and a pool of threads that encode them to JPEG files.
+
+workers - the number of encoder threads
+queue_size - the maximum number of frames waiting to be encoded before submit() blocks
+quality - the JPEG quality to encode with
+on_written - optionally called with the path of every file once it has been written (ie: to archive it)
+'''
+class EncoderPool():
+    def __init__(self, workers=2, queue_size=8, quality=90, on_written=None):
+        self.quality = quality
+        self.on_written = on_written
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.error = None
+
+        # Statistics
+        self.encoded = 0
+        self.encode_time = 0.0
+        self.blocked_time = 0.0
+
+        self.threads = []
+        for ii in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"encoder-{ii}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    '''
+    _worker()
+
+    Encodes frames from the queue until it receives None.
+    '''
+    def _worker(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                self.frames.task_done()
+                return
+            array, file_path, size, transform, notify, written = item
+            try:
+                start = monotonic()
+                encode_jpeg(array, file_path, self.quality, size, transform)
+                with self.lock:
+                    self.encoded += 1
+                    self.encode_time += monotonic() - start
+                if notify and self.on_written is not None:
+                    self.on_written(file_path)
+                if written is not None:
+                    written(file_path)
+            except Exception as e:
+                with self.lock:
+                    if self.error is None:
+                        self.error = e
+            finally:
+                self.frames.task_done()
+
+    '''
+    submit()
+
+    Queues a frame to be written to file_path.  Blocks while the queue is full.
+
+    array - the RGB frame
+    file_path - where to write the JPEG
+    size - optionally resize the frame to (width, height) before encoding
+    transform - optionally applied to the (resized) frame before encoding
+    notify - whether on_written should be called once the file has been written
+    written - optionally called with file_path once this file has been written, on top of on_written
+    '''
+    def submit(self, array, file_path, size=None, transform=None, notify=True, written=None):
+        if self.error is not None:
+            raise self.error
+        start = monotonic()
+        self.frames.put((array, file_path, size, transform, notify, written))
+        self.blocked_time += monotonic() - start
+
+    '''
+    close()
+
+    Waits for every queued frame to be written and stops the workers.
+    '''
+    def close(self):
+        for _ in self.threads:
+            self.frames.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    '''
+    stats()
+
+    Returns a dictionary with the number of frames encoded, the mean encode latency and the time spent blocked.
+    '''
+    def stats(self):
+        with self.lock:
+            return {
+                'encoded': self.encoded,
+                'mean_encode_ms': self.encode_time / self.encoded * 1000 if self.encoded else 0.0,
+                'blocked_seconds': self.blocked_time,
+            }
@@ -0,0 +1,231 @@
+'''
+frame_bus.py
+
+This script contains the shared memory frame bus used to hand frames from the capture process to the eye tracker (or
+any other process) without writing them to disk.
+
+The bus is a single block of shared memory holding a small header and a ring of preallocated frame slots.  Publishing
+a frame copies it into the next slot and stamps the slot with a sequence number.  Readers look up the newest sequence
+number and get a numpy view straight onto its slot, so nothing is encoded or copied on the reading side.  Every slot
+is stamped with its sequence number again once it has been written (and marked as being written before), so a reader
+can always tell whether the frame it is looking at has been overwritten by the publisher in the meantime.
+
+Publishing the frames of a camera backend from the command line:
+    python frame_bus.py publish source [bus_name] [frame_rate]
+where source is a folder of images or a video file (replayed with camera_backends.ReplayCamera) or 'synthetic'.
+'''
+
+# Necessary imports
+from multiprocessing import shared_memory
+from time import monotonic_ns, sleep
+import numpy as np
+import sys
+
+# The name of the bus when none is given
+DEFAULT_BUS_NAME = 'transparent_camera_frames'
+
+# The default number of frame slots, readers have this many frames to finish with a frame before it is overwritten
+DEFAULT_SLOTS = 4
+
+# The layout of the header, every field is an int64
+MAGIC = 0x5355424d41524654 # 'TFRAMBUS'
+HEADER_FIELDS = 8 # magic, slots, height, width, channels, latest sequence, closed, unused
+SLOT_FIELDS = 3 # sequence, sensor timestamp, publish time
+LATEST = 5
+CLOSED = 6
+
+# How long readers sleep between checks for a new frame
+POLL_SECONDS = 0.0005
+
+'''
+header_size()
+
+Returns the number of bytes used by the header of a bus with the given number of slots, rounded up to a cache line.
+'''
+def header_size(slots):
+    size = (HEADER_FIELDS + slots * SLOT_FIELDS) * 8
+    return (size + 63) // 64 * 64
+
+'''
+FrameBus
+
+A ring of frame slots in shared memory.  The process that creates the bus publishes frames, any number of other
+processes can attach to it by name and read them.
+
+name - the name of the shared memory block
+shape - the (height, width, channels) of the frames, only given when creating the bus
+slots - the number of frame slots, only used when creating the bus
+'''
+class FrameBus():
+    def __init__(self, name=DEFAULT_BUS_NAME, shape=None, slots=DEFAULT_SLOTS):
+        self.owner = shape is not None
+        if self.owner:
+            height, width = shape[:2]
+            channels = shape[2] if len(shape) > 2 else 1
+            self.memory = shared_memory.SharedMemory(name, create=True, size=header_size(slots) + slots * height * width * channels)
+            header = np.ndarray(HEADER_FIELDS + slots * SLOT_FIELDS, dtype=np.int64, buffer=self.memory.buf)
+            header[:] = 0
+            header[:LATEST] = [MAGIC, slots, height, width, channels]
+        else:
+            self.memory = self._attach(name)
+            header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.memory.buf)
+            if header[0] != MAGIC:
+                self.memory.close()
+                raise ValueError(f"The shared memory \"{name}\" is not a frame bus")
+            slots = int(header[1])
+
+        self.name = name
+        self.slots = slots
+        self.header = np.ndarray(HEADER_FIELDS + slots * SLOT_FIELDS, dtype=np.int64, buffer=self.memory.buf)
+        self.slot_info = self.header[HEADER_FIELDS:].reshape(slots, SLOT_FIELDS)
+        height, width, channels = (int(value) for value in self.header[2:5])
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.memory.buf, offset=header_size(slots))
+        self.published = 0
+
+    '''
+    _attach()
+
+    Attaches to an existing bus.  Only the process that created the bus should remove it, so the attaching process
+    must not hand the block to Python's resource tracker (which would remove it when the reader exits).
+    '''
+    @staticmethod
+    def _attach(name):
+        try:
+            return shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python 3.12 and older always track the block.  Unregistering it afterwards is not enough since a forked
+            # reader shares the resource tracker of the process that created the bus, so it is never registered.
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name)
+            finally:
+                resource_tracker.register = register
+
+    '''
+    publish()
+
+    Copies a frame into the next slot and makes it the latest frame.
+
+    frame - the frame, it must have the shape the bus was created with
+    timestamp - the sensor timestamp of the frame in nanoseconds, if known
+
+    Returns the frame's sequence number.
+    '''
+    def publish(self, frame, timestamp=0):
+        sequence = int(self.header[LATEST]) + 1
+        slot = sequence % self.slots
+        info = self.slot_info[slot]
+
+        # Readers that see a negative sequence number know the slot is being written
+        info[0] = -sequence
+        np.copyto(self.frames[slot], frame.reshape(self.shape))
+        info[1] = timestamp
+        info[2] = monotonic_ns()
+        info[0] = sequence
+        self.header[LATEST] = sequence
+        self.published += 1
+        return sequence
+
+    '''
+    latest_sequence()
+
+    Returns the sequence number of the newest frame, or 0 if nothing has been published yet.
+    '''
+    def latest_sequence(self):
+        return int(self.header[LATEST])
+
+    '''
+    valid()
+
+    Returns True if the frame with the given sequence number has not been overwritten yet.  Readers that keep using a
+    frame view should check this once they are done with it.
+    '''
+    def valid(self, sequence):
+        return int(self.slot_info[sequence % self.slots][0]) == sequence
+
+    '''
+    read()
+
+    Returns the sequence number, sensor timestamp, publish time (monotonic_ns) and a view of the newest frame that is
+    newer than last_sequence, waiting up to timeout seconds (or forever if it is None) for it.  Returns None if the
+    timeout passes or the bus is closed.
+
+    copy - whether to return a copy of the frame instead of a view onto its slot
+    '''
+    def read(self, last_sequence=0, timeout=None, copy=False):
+        deadline = None if timeout is None else monotonic_ns() + int(timeout * 1e9)
+        while True:
+            sequence = int(self.header[LATEST])
+            if sequence > last_sequence:
+                slot = sequence % self.slots
+                info = self.slot_info[slot]
+                timestamp = int(info[1])
+                published = int(info[2])
+                frame = self.frames[slot].copy() if copy else self.frames[slot]
+                # The publisher may have lapped the reader while it looked the slot up
+                if self.valid(sequence):
+                    return sequence, timestamp, published, frame
+                continue
+            if self.header[CLOSED]:
+                return None
+            if deadline is not None and monotonic_ns() > deadline:
+                return None
+            sleep(POLL_SECONDS)
+
+    '''
+    close()
+
+    Detaches from the bus.  The process that created the bus also marks it as closed, so readers stop waiting, and
+    removes it.
+    '''
+    def close(self):
+        if self.owner:
+            self.header[CLOSED] = 1
+        del self.header, self.slot_info, self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+'''
+publish_camera()
+
+Publishes every frame of a simulated camera (see camera_backends.py) on a new bus until it is interrupted or
+number_of_frames frames have been published.
+'''
+def publish_camera(camera, name=DEFAULT_BUS_NAME, slots=DEFAULT_SLOTS, number_of_frames=None):
+    camera.start()
+    request = camera.capture_request()
+    frame = request.make_array("main")
+    bus = FrameBus(name, frame.shape, slots)
+    try:
+        while number_of_frames is None or bus.published < number_of_frames:
+            bus.publish(frame, request.get_metadata()['SensorTimestamp'])
+            request.release()
+            request = camera.capture_request()
+            frame = request.make_array("main")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Published {bus.published} frames on \"{name}\"")
+        bus.close()
+        camera.stop()
+        camera.close()
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 3 or sys.argv[1] != 'publish'):
+        print("Usage:  python frame_bus.py publish source [bus_name] [frame_rate]")
+    else:
+        # Only needed to publish from the command line
+        from camera_backends import ReplayCamera, SyntheticCamera
+
+        name = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_BUS_NAME
+        frame_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 30.0
+        if sys.argv[2] == 'synthetic':
+            camera = SyntheticCamera(0, frame_rate)
+        else:
+            camera = ReplayCamera(sys.argv[2], frame_rate)
+        print(f"Publishing \"{sys.argv[2]}\" on \"{name}\", press Ctrl+C to stop")
+        publish_camera(camera, name)
@@ -0,0 +1,161 @@
+'''
+quality_gate.py
+
+This script contains the capture-time quality gate used by camera.py.
+
+Every captured pair is scored before it is saved:
+- Sharpness is the variance of the Laplacian, motion blurred images score low.
+- Exposure is the fraction of pixels clipped to black or white.
+- Similarity compares the pair against the previous saved pair, so near duplicates can be skipped.  This is off by
+  default since the subject usually sits still between pairs, which would drop most of them.
+
+The scores are calculated on a strided, downscaled grayscale copy of each frame so the gate keeps up with the
+capture rate on the Raspberry Pi.  Every score is logged to the session's quality manifest.
+'''
+
+# Necessary imports
+import csv
+import cv2
+import numpy as np
+import os
+
+# The name of the quality manifest written next to the Front and Side folders
+MANIFEST_NAME = 'quality_manifest.csv'
+
+# The columns of the quality manifest
+MANIFEST_FIELDS = ['index', 'skew_ms', 'side_sharpness', 'front_sharpness', 'side_clipped', 'front_clipped', 'similarity', 'status', 'reasons']
+
+'''
+downscale_gray()
+
+Returns a grayscale copy of an RGB frame that is at most max_width pixels wide.  Striding is used instead of
+resizing since it is a free view of the array.
+'''
+def downscale_gray(array, max_width=640):
+    step = max(1, array.shape[1] // max_width)
+    return cv2.cvtColor(np.ascontiguousarray(array[::step, ::step]), cv2.COLOR_RGB2GRAY)
+
+'''
+sharpness()
+
+Returns the variance of the Laplacian of a grayscale image.  Blurred images have a low variance.
+'''
+def sharpness(gray):
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+'''
+clipped_fraction()
+
+Returns the fraction of pixels of a grayscale image that are clipped to black or white.
+'''
+def clipped_fraction(gray, low=2, high=253):
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    return float((histogram[:low + 1].sum() + histogram[high:].sum()) / gray.size)
+
+'''
+similarity()
+
+Returns how similar two grayscale images are, from 0 (completely different) to 1 (identical).
+'''
+def similarity(gray, previous_gray):
+    return 1.0 - float(cv2.absdiff(gray, previous_gray).mean()) / 255.0
+
+'''
+QualityGate
+
+Scores captured pairs and decides whether they should be saved.
+
+manifest_dir - the folder the quality manifest is written to, or None to not write one
+min_sharpness - pairs where either image has a lower Laplacian variance are rejected
+max_clipped - pairs where either image has a larger fraction of clipped pixels are rejected
+max_similarity - pairs more similar than this to the previous saved pair are rejected, or None to disable (the
+                 default).  A static subject scores above 0.98 between pairs, so keep this close to 1.
+drop - whether rejected pairs are dropped (True) or only flagged in the manifest (False)
+'''
+class QualityGate():
+    def __init__(self, manifest_dir=None, min_sharpness=50.0, max_clipped=0.05, max_similarity=None, drop=True):
+        self.min_sharpness = min_sharpness
+        self.max_clipped = max_clipped
+        self.max_similarity = max_similarity
+        self.drop = drop
+        self.previous = None
+        self.saved = 0
+        self.dropped = 0
+
+        self.manifest_file = None
+        if manifest_dir is not None:
+            path = os.path.join(manifest_dir, MANIFEST_NAME)
+            new_manifest = not os.path.exists(path)
+            self.manifest_file = open(path, 'a', newline='')
+            self.manifest = csv.writer(self.manifest_file)
+            if new_manifest:
+                self.manifest.writerow(MANIFEST_FIELDS)
+
+    '''
+    score()
+
+    Returns a dictionary with the sharpness and clipping of both images and the similarity to the previous pair.
+    The downscaled grayscale images are returned as well so they can become the next previous pair.
+    '''
+    def score(self, side_array, front_array):
+        side_gray = downscale_gray(side_array)
+        front_gray = downscale_gray(front_array)
+        scores = {
+            'side_sharpness': sharpness(side_gray),
+            'front_sharpness': sharpness(front_gray),
+            'side_clipped': clipped_fraction(side_gray),
+            'front_clipped': clipped_fraction(front_gray),
+            'similarity': None,
+        }
+        if self.previous is not None:
+            scores['similarity'] = min(similarity(side_gray, self.previous[0]), similarity(front_gray, self.previous[1]))
+        return scores, (side_gray, front_gray)
+
+    '''
+    check()
+
+    Scores a CapturedPair, logs it to the manifest and returns True if the pair should be saved.
+    '''
+    def check(self, pair):
+        scores, grays = self.score(pair.side_result, pair.front_result)
+
+        reasons = []
+        if min(scores['side_sharpness'], scores['front_sharpness']) < self.min_sharpness:
+            reasons.append('blurred')
+        if max(scores['side_clipped'], scores['front_clipped']) > self.max_clipped:
+            reasons.append('exposure')
+        if self.max_similarity is not None and scores['similarity'] is not None and scores['similarity'] > self.max_similarity:
+            reasons.append('duplicate')
+
+        if not reasons:
+            status = 'accepted'
+        elif self.drop:
+            status = 'dropped'
+        else:
+            status = 'flagged'
+
+        # Only saved pairs are compared against
+        if status != 'dropped':
+            self.previous = grays
+            self.saved += 1
+        else:
+            self.dropped += 1
+
+        if self.manifest_file is not None:
+            similarity_text = '' if scores['similarity'] is None else f"{scores['similarity']:.4f}"
+            self.manifest.writerow([pair.index, f'{pair.skew_ms:.3f}',
+                                    f"{scores['side_sharpness']:.1f}", f"{scores['front_sharpness']:.1f}",
+                                    f"{scores['side_clipped']:.4f}", f"{scores['front_clipped']:.4f}",
+                                    similarity_text, status, ';'.join(reasons)])
+            self.manifest_file.flush()
+
+        return status != 'dropped'
+
+    '''
+    close()
+
+    Closes the quality manifest.
+    '''
+    def close(self):
+        if self.manifest_file is not None:
+            self.manifest_file.close()
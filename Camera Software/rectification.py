@@ -0,0 +1,194 @@
+'''
+rectification.py
+
+This script contains the side camera rectification used by camera.py and by pix2pixHD's AlignedDataset.
+
+The side camera looks through the edge of the acrylic, so its images are heavily warped compared to the front camera.
+The calibration step estimates a mapping from the side camera to the front camera once from existing pairs by matching
+ORB features between them and fitting a homography.  If the side camera's intrinsics and lens distortion are known
+they are undone as well.  The calibration is saved to an .npz file:
+    python rectification.py side_folder front_folder side_rectification.npz [number_of_pairs]
+
+Applying the calibration precomputes the remap tables once per image size with cv2.initUndistortRectifyMap, after which
+every frame only costs a single cv2.remap.  pix2pixHD reads the same .npz file (see --rectify_maps).
+'''
+
+# Necessary imports
+import cv2
+import numpy as np
+import os
+import sys
+
+# The number of ORB features detected in every image while calibrating
+ORB_FEATURES = 4000
+
+# The width the images are downscaled to while looking for features
+CALIBRATION_WIDTH = 1024
+
+'''
+default_camera_matrix()
+
+Returns a camera matrix for an image of the given (width, height) when the real intrinsics are unknown.  With no lens
+distortion the camera matrix cancels out, so any reasonable value works.
+'''
+def default_camera_matrix(size):
+    width, height = size
+    return np.array([[width, 0, width / 2], [0, width, height / 2], [0, 0, 1]], dtype=np.float64)
+
+'''
+match_pair()
+
+Returns the matched ORB keypoints of a side and front image as two (N, 2) arrays in full resolution pixel coordinates.
+'''
+def match_pair(side_image, front_image, orb, matcher):
+    points = []
+    features = []
+    for image in (side_image, front_image):
+        scale = min(1.0, CALIBRATION_WIDTH / image.shape[1])
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        keypoints, descriptors = orb.detectAndCompute(gray, None)
+        features.append((keypoints, descriptors, scale))
+
+    (side_keypoints, side_descriptors, side_scale), (front_keypoints, front_descriptors, front_scale) = features
+    if side_descriptors is None or front_descriptors is None:
+        return np.empty((0, 2)), np.empty((0, 2))
+
+    matches = matcher.match(side_descriptors, front_descriptors)
+    side_points = np.array([side_keypoints[m.queryIdx].pt for m in matches], dtype=np.float64).reshape(-1, 2) / side_scale
+    front_points = np.array([front_keypoints[m.trainIdx].pt for m in matches], dtype=np.float64).reshape(-1, 2) / front_scale
+    return side_points, front_points
+
+'''
+calibrate()
+
+Estimates the rectification from the side camera to the front camera from a list of (side_path, front_path) pairs.
+
+pairs - the image pairs to calibrate from, more pairs of varied scenes give a better fit
+camera_matrix - the side camera's intrinsics if known
+dist_coeffs - the side camera's lens distortion coefficients if known
+
+Returns a dictionary with the homography, the image sizes and the side camera's intrinsics.
+'''
+def calibrate(pairs, camera_matrix=None, dist_coeffs=None):
+    orb = cv2.ORB_create(ORB_FEATURES)
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+    # Pool the matches of every pair so that a single homography is fit to all of them
+    all_side_points = []
+    all_front_points = []
+    side_size = front_size = None
+    for side_path, front_path in pairs:
+        side_image = cv2.imread(side_path)
+        front_image = cv2.imread(front_path)
+        side_size = (side_image.shape[1], side_image.shape[0])
+        front_size = (front_image.shape[1], front_image.shape[0])
+        side_points, front_points = match_pair(side_image, front_image, orb, matcher)
+        all_side_points.append(side_points)
+        all_front_points.append(front_points)
+
+    side_points = np.concatenate(all_side_points)
+    front_points = np.concatenate(all_front_points)
+    if len(side_points) < 4:
+        raise ValueError("Not enough features matched between the side and front images to calibrate")
+
+    if camera_matrix is None:
+        camera_matrix = default_camera_matrix(side_size)
+    if dist_coeffs is None:
+        dist_coeffs = np.zeros(5)
+
+    # Fit the homography to the undistorted side points
+    side_points = cv2.undistortPoints(side_points.reshape(-1, 1, 2), camera_matrix, dist_coeffs, P=camera_matrix).reshape(-1, 2)
+    homography, inliers = cv2.findHomography(side_points, front_points, cv2.RANSAC, 3.0)
+    if homography is None:
+        raise ValueError("Could not fit a homography between the side and front images")
+    print(f"Calibrated from {len(pairs)} pairs, {int(inliers.sum())} of {len(side_points)} matches were inliers")
+
+    return {
+        'homography': homography,
+        'side_size': np.array(side_size),
+        'front_size': np.array(front_size),
+        'camera_matrix': np.asarray(camera_matrix, dtype=np.float64),
+        'dist_coeffs': np.asarray(dist_coeffs, dtype=np.float64),
+    }
+
+'''
+save_calibration() / load_calibration()
+
+Saves and loads a calibration as an .npz file.
+'''
+def save_calibration(calibration, path):
+    np.savez(path, **calibration)
+
+def load_calibration(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+'''
+build_maps()
+
+Precomputes the remap tables that warp a side image of side_size into the front camera's view at output_size.  The
+calibration is rescaled, so the same calibration works for the full resolution and the resized training images.
+
+Returns the two fixed point maps used by cv2.remap.
+'''
+def build_maps(calibration, side_size, output_size):
+    calibrated_side = calibration['side_size'].astype(np.float64)
+    calibrated_front = calibration['front_size'].astype(np.float64)
+    side_scale = np.diag([side_size[0] / calibrated_side[0], side_size[1] / calibrated_side[1], 1.0])
+    output_scale = np.diag([output_size[0] / calibrated_front[0], output_size[1] / calibrated_front[1], 1.0])
+
+    # initUndistortRectifyMap inverts newCameraMatrix for every output pixel, so the homography goes in there
+    camera_matrix = side_scale @ calibration['camera_matrix']
+    homography = output_scale @ calibration['homography'] @ np.linalg.inv(side_scale)
+    return cv2.initUndistortRectifyMap(camera_matrix, calibration['dist_coeffs'], np.eye(3),
+                                       homography @ camera_matrix, tuple(int(v) for v in output_size), cv2.CV_16SC2)
+
+'''
+SideRectifier
+
+Warps side images into the front camera's view, building the remap tables once for every image size it sees.
+
+calibration - a calibration from calibrate() or load_calibration()
+'''
+class SideRectifier():
+    def __init__(self, calibration):
+        self.calibration = calibration
+        self.maps = {}
+
+    def __call__(self, image):
+        height, width = image.shape[:2]
+        if (width, height) not in self.maps:
+            # Keep the side image's size, scaled to the front camera's aspect ratio
+            front_width, front_height = self.calibration['front_size']
+            output_size = (width, int(round(width * front_height / front_width)))
+            self.maps[(width, height)] = build_maps(self.calibration, (width, height), output_size)
+        map1, map2 = self.maps[(width, height)]
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+'''
+list_pairs()
+
+Returns the (side_path, front_path) pairs in the Side and Front folders, matched by their image index.
+'''
+def list_pairs(side_dir, front_dir):
+    front_files = {name.replace('_front_', '_side_'): name for name in os.listdir(front_dir)}
+    pairs = []
+    for name in sorted(os.listdir(side_dir)):
+        if name in front_files:
+            pairs.append((os.path.join(side_dir, name), os.path.join(front_dir, front_files[name])))
+    return pairs
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 4):
+        print("Usage:  python rectification.py side_folder front_folder output.npz [number_of_pairs]")
+    else:
+        pairs = list_pairs(sys.argv[1], sys.argv[2])
+        if len(sys.argv) > 4:
+            # Spread the pairs over the whole session
+            step = max(1, len(pairs) // int(sys.argv[4]))
+            pairs = pairs[::step][:int(sys.argv[4])]
+        calibration = calibrate(pairs)
+        save_calibration(calibration, sys.argv[3])
+        print(f"Saved the rectification to \"{sys.argv[3]}\"")
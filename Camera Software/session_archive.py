@@ -0,0 +1,138 @@
+'''
+session_archive.py
+
+This script contains the streaming session archive used by camera.py.
+
+Rather than zipping the whole Front and Side folders after a capture, each image is appended to the day's archive as
+soon as it is written, so the cost of archiving only depends on the new images.  The archive is built next to the
+Front and Side folders under a hidden ".partial" name (so a crashed session is picked up again by the next one) and
+is only published to the camera's website once the session closes.  Publishing copies the archive into the download
+directory under a hidden name and renames it into place, so the website never serves a half-written archive.  If the
+download directory is not writable by the user running camera.py, the archive is published with sudo like before.
+Nothing is written to the download directory before the capture ends, so a download directory that cannot be written
+to never loses a session; the archive stays next to the Front and Side folders.
+'''
+
+# Necessary imports
+from datetime import datetime
+import os
+import shutil
+import subprocess
+import threading
+import zipfile
+
+# The camera's website path where archives can be downloaded from
+DOWNLOAD_DIRECTORY = "/var/www/html/download/"
+
+'''
+archive_name()
+
+Returns the name of the archive for image_id on the given date (today by default).
+'''
+def archive_name(image_id, date=None):
+    if date is None:
+        date = datetime.now()
+    return f"{image_id}-{date.strftime('%m-%d-%Y')}.zip"
+
+'''
+SessionArchive
+
+An archive that images are appended to while they are captured.
+
+image_id - the name of the saved data (ie: subject name)
+root_dir - the folder containing the Front and Side folders, archive entries are stored relative to it and the
+           archive is built in it
+destination_dir - where the archive is published
+'''
+class SessionArchive():
+    def __init__(self, image_id, root_dir, destination_dir=DOWNLOAD_DIRECTORY):
+        self.root_dir = root_dir
+        self.name = archive_name(image_id)
+        self.local_path = os.path.join(root_dir, self.name)
+        self.partial_path = os.path.join(root_dir, f".{self.name}.partial")
+        self.destination_dir = destination_dir
+        self.path = os.path.join(destination_dir, self.name)
+        self.lock = threading.Lock()
+        self.added = 0
+
+        # Pick up where we left off if a previous session crashed, otherwise continue today's archive
+        if not os.path.exists(self.partial_path) and os.path.exists(self.local_path):
+            os.replace(self.local_path, self.partial_path)
+
+        try:
+            self.zip = zipfile.ZipFile(self.partial_path, mode='a', compression=zipfile.ZIP_STORED)
+        except zipfile.BadZipFile:
+            # The partial archive was cut off by a crash, so keep it for inspection and start again
+            os.replace(self.partial_path, self.partial_path + '.corrupt')
+            print(f"Could not resume {self.partial_path}, it was moved to {self.partial_path}.corrupt")
+            self.zip = zipfile.ZipFile(self.partial_path, mode='a', compression=zipfile.ZIP_STORED)
+
+        # Remember what is already in the archive so re-captured indices are not stored twice
+        self.names = set(self.zip.namelist())
+
+    '''
+    add_file()
+
+    Appends a single image to the archive.  JPEGs are stored without compression since they do not compress further.
+    Safe to call from the encoder threads.
+
+    file_path - the image to add
+    arcname - the name inside the archive, defaults to the path relative to root_dir (ie: Side/name_side_0.jpg)
+    '''
+    def add_file(self, file_path, arcname=None):
+        if arcname is None:
+            arcname = os.path.relpath(file_path, self.root_dir).replace(os.sep, '/')
+        with self.lock:
+            if arcname in self.names:
+                return
+            self.zip.write(file_path, arcname)
+            self.names.add(arcname)
+            self.added += 1
+
+    '''
+    add_pair()
+
+    Appends a side and front image to the archive.
+    '''
+    def add_pair(self, side_file_path, front_file_path):
+        self.add_file(side_file_path)
+        self.add_file(front_file_path)
+
+    '''
+    publish()
+
+    Copies the finished archive into the download directory under a hidden name and renames it into place.  Falls back
+    to doing the same with sudo if the download directory is not writable.
+
+    Returns True if the archive was published.
+    '''
+    def publish(self):
+        published_partial_path = os.path.join(self.destination_dir, f".{self.name}.partial")
+        try:
+            os.makedirs(self.destination_dir, exist_ok=True)
+            shutil.copyfile(self.local_path, published_partial_path)
+            os.replace(published_partial_path, self.path)
+            return True
+        except PermissionError:
+            pass
+
+        try:
+            subprocess.check_call(['sudo', 'cp', self.local_path, published_partial_path])
+            subprocess.check_call(['sudo', 'mv', published_partial_path, self.path])
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Could not publish {self.local_path} to {self.destination_dir}: {e}")
+            return False
+
+    '''
+    close()
+
+    Finishes the archive next to the Front and Side folders and publishes it into the download directory.
+
+    Returns True if the archive was published.
+    '''
+    def close(self):
+        with self.lock:
+            self.zip.close()
+            os.replace(self.partial_path, self.local_path)
+        return self.publish()
@@ -0,0 +1,198 @@
+'''
+session_journal.py
+
+This script contains the crash-safe session journal used by camera.py.
+
+settings.xml is only rewritten once the whole capture loop has finished, so a crash or a power loss used to lose the
+counter and the next run would overwrite image indices.  The journal keeps two small files next to the Front and
+Side folders:
+- session_counter.dat:  A fixed size record of the next free image index.  It is overwritten in place and fsync'd
+  before every pair is captured, so updating it costs the same no matter how many images have been taken.
+- session_journal.jsonl:  An append-only log with one line for every pair once both of its images have been written.
+
+Recovering only reads the counter record and the tail of the journal, it never lists the image folders:
+    python session_journal.py resume
+'''
+
+# Necessary imports
+from time import time
+import json
+import os
+import sys
+import threading
+import zlib
+
+# The names of the journal files written next to the Front and Side folders
+COUNTER_NAME = 'session_counter.dat'
+JOURNAL_NAME = 'session_journal.jsonl'
+
+# The counter record is always this many bytes so it can be overwritten in place
+COUNTER_RECORD_SIZE = 32
+
+# How many bytes from the end of the journal are read when resuming
+JOURNAL_TAIL_SIZE = 4096
+
+'''
+write_counter()
+
+Overwrites the counter record with the next free image index and fsyncs it.
+'''
+def write_counter(fd, next_index):
+    body = f"{next_index} {zlib.crc32(str(next_index).encode()):08x}"
+    os.pwrite(fd, body.ljust(COUNTER_RECORD_SIZE - 1).encode() + b'\n', 0)
+    os.fsync(fd)
+
+'''
+read_counter()
+
+Returns the next free image index stored in the counter record, or None if it is missing or damaged.
+'''
+def read_counter(directory):
+    try:
+        with open(os.path.join(directory, COUNTER_NAME), 'rb') as counter_file:
+            next_index, checksum = counter_file.read(COUNTER_RECORD_SIZE).decode().split()
+        if f"{zlib.crc32(next_index.encode()):08x}" != checksum:
+            return None
+        return int(next_index)
+    except (OSError, ValueError, UnicodeDecodeError):
+        return None
+
+'''
+read_journal_tail()
+
+Returns the last complete record of the journal, or None if the journal is missing or empty.
+A line cut off by a crash is skipped.
+'''
+def read_journal_tail(directory):
+    try:
+        with open(os.path.join(directory, JOURNAL_NAME), 'rb') as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+            size = journal_file.tell()
+            journal_file.seek(max(0, size - JOURNAL_TAIL_SIZE))
+            tail = journal_file.read()
+    except OSError:
+        return None
+
+    for line in reversed(tail.split(b'\n')):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
+
+'''
+resume_index()
+
+Returns the next free image index from the counter record and the journal tail, whichever is further along.
+Returns 0 if there is no journal yet.
+'''
+def resume_index(directory):
+    next_index = read_counter(directory) or 0
+    last_record = read_journal_tail(directory)
+    if last_record is not None:
+        next_index = max(next_index, last_record['index'] + 1)
+    return next_index
+
+'''
+SessionJournal
+
+Records every pair of a session as it is written.
+
+directory - the folder containing the Front and Side folders
+'''
+class SessionJournal():
+    def __init__(self, directory):
+        self.counter_fd = os.open(os.path.join(directory, COUNTER_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        self.journal_file = open(os.path.join(directory, JOURNAL_NAME), 'a+')
+
+        # Start on a fresh line if the last record was cut off by a crash
+        if self.journal_file.tell() > 0:
+            self.journal_file.seek(self.journal_file.tell() - 1)
+            if self.journal_file.read(1) != '\n':
+                self.journal_file.write('\n')
+        self.next_index = resume_index(directory)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.recorded = 0
+
+    '''
+    reserve()
+
+    Marks an image index as used before its pair is captured, so a crash can never lead to it being overwritten.
+    '''
+    def reserve(self, index):
+        with self.lock:
+            if index + 1 > self.next_index:
+                self.next_index = index + 1
+                write_counter(self.counter_fd, self.next_index)
+
+    '''
+    _append()
+
+    Appends a record to the journal and fsyncs it.
+    '''
+    def _append(self, record):
+        self.journal_file.write(json.dumps(record) + '\n')
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.recorded += 1
+
+    '''
+    record_pair()
+
+    Records a pair whose images have both been written.
+    '''
+    def record_pair(self, index, side_file_path, front_file_path, skew_ms=None):
+        with self.lock:
+            self._append({'index': index, 'side': side_file_path, 'front': front_file_path, 'skew_ms': skew_ms, 'time': time()})
+
+    '''
+    expect_pair()
+
+    Registers a pair whose images are still being written by the encoders.  It is recorded once file_written() has
+    been called for both of its images.
+    '''
+    def expect_pair(self, index, side_file_path, front_file_path, skew_ms=None):
+        with self.lock:
+            record = {'index': index, 'side': side_file_path, 'front': front_file_path, 'skew_ms': skew_ms}
+            self.pending[side_file_path] = record
+            self.pending[front_file_path] = record
+
+    '''
+    file_written()
+
+    Called with the path of every image once it has been written.  Safe to call from the encoder threads.
+    '''
+    def file_written(self, file_path):
+        with self.lock:
+            record = self.pending.pop(file_path, None)
+            if record is None:
+                return
+            # The pair is complete once neither of its images is pending anymore
+            if record['side'] not in self.pending and record['front'] not in self.pending:
+                record['time'] = time()
+                self._append(record)
+
+    '''
+    close()
+
+    Closes the journal files.
+    '''
+    def close(self):
+        os.close(self.counter_fd)
+        self.journal_file.close()
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 2 or sys.argv[1] != 'resume'):
+        print("Usage:  python session_journal.py resume [directory]")
+    else:
+        # Only needed to rewrite settings.xml
+        from camera import create_settings_xml
+
+        directory = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.abspath(__file__))
+        last_record = read_journal_tail(directory)
+        if last_record is not None:
+            print(f"The last saved pair was {last_record['index']}:  {last_record['side']}, {last_record['front']}")
+        next_index = resume_index(directory)
+        create_settings_xml(next_index)
+        print(f"Rewrote settings.xml, the next image index is {next_index}")
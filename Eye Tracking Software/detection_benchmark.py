@@ -0,0 +1,157 @@
+'''
+detection_benchmark.py
+
+This python script benchmarks face detection on a folder of images.
+
+By default every (scale, upsample) setting is compared against detecting on the full resolution frame with 1x
+upsampling, which is what the eye trackers did before DETECTION_SCALE existed.  For each setting it reports the time
+spent detecting per image and the recall, the fraction of the full resolution faces that were still found.
+
+    python detection_benchmark.py [image_folder] [min_face_size]
+
+The backends mode compares every face detector backend (see face_detectors.py) against dlib's HOG detector instead.
+For each backend it reports the faces found, the ms per image and how well its faces agree with the HOG detector's:
+the recall and precision of the faces that overlap by at least MIN_IOU and their mean IoU.  Backends whose model files
+are missing are skipped.
+
+    python detection_benchmark.py backends [image_folder]
+'''
+
+import cv2          # For image processing
+import eye_tracker  # For the default input location
+import face_detectors # For the face detector backends being benchmarked
+import face_tracking # For the downscaled face detection being benchmarked
+import os           # For working with paths
+import sys          # For argument loading
+from time import perf_counter
+
+# The (scale, upsample) settings to benchmark, the automatically selected one is added to these
+SETTINGS = [(1.0, 1), (1.0, 0), (0.75, 1), (0.5, 1), (0.5, 0), (0.25, 1)]
+
+# A found face has to overlap a full resolution face by at least this much to count towards the recall
+MIN_IOU = 0.5
+
+'''
+iou()
+
+Returns the intersection over union of two dlib rectangles.
+'''
+def iou(a, b):
+    width = min(a.right(), b.right()) - max(a.left(), b.left()) + 1
+    height = min(a.bottom(), b.bottom()) - max(a.top(), b.top()) + 1
+    intersection = max(width, 0) * max(height, 0)
+    union = a.width() * a.height() + b.width() * b.height() - intersection
+    return intersection / union if union else 0.0
+
+'''
+best_ious()
+
+Returns the best IoU of every reference face with any of the found faces (0 if nothing was found).
+'''
+def best_ious(reference, found):
+    return [max((iou(rect, other) for other in found), default=0.0) for rect in reference]
+
+'''
+count_found()
+
+Returns how many of the reference faces are matched by one of the found faces.
+'''
+def count_found(reference, found):
+    return sum(1 for value in best_ious(reference, found) if value >= MIN_IOU)
+
+'''
+benchmark_setting()
+
+Detects the faces in every image with one setting.
+
+Returns the milliseconds per image and the faces found in every image.
+'''
+def benchmark_setting(detector, grays, scale, upsample):
+    found = []
+    start = perf_counter()
+    for gray in grays:
+        found.append(face_tracking.detect_faces(detector, gray, scale, upsample))
+    return (perf_counter() - start) * 1000 / len(grays), found
+
+'''
+load_grays()
+
+Returns the grayscale images in a folder.
+'''
+def load_grays(input_location):
+    names = sorted(name for name in os.listdir(input_location) if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    return [cv2.cvtColor(cv2.imread(os.path.join(input_location, name)), cv2.COLOR_BGR2GRAY) for name in names]
+
+'''
+benchmark_scales()
+
+Compares every (scale, upsample) setting of the HOG detector against full resolution detection.
+'''
+def benchmark_scales(grays, min_face_size):
+    detector = face_detectors.create_detector('hog')
+    auto_setting = face_tracking.auto_detection_scale(min_face_size)
+    settings = SETTINGS + [auto_setting] if auto_setting not in SETTINGS else SETTINGS
+
+    print(f"'auto' for faces of at least {min_face_size} pixels is scale {auto_setting[0]:.3f} with upsample {auto_setting[1]}")
+    reference_ms, reference = benchmark_setting(detector, grays, 1.0, 1)
+    reference_faces = sum(len(rects) for rects in reference)
+    for scale, upsample in settings:
+        ms, found = benchmark_setting(detector, grays, scale, upsample)
+        matched = sum(count_found(rects, other) for rects, other in zip(reference, found))
+        recall = matched / reference_faces if reference_faces else 1.0
+        label = ' (auto)' if (scale, upsample) == auto_setting else ''
+        print(f"scale {scale:.3f} upsample {upsample}{label}:  {ms:8.2f} ms/image ({reference_ms / ms:5.2f}x), "
+              f"{sum(len(rects) for rects in found)} faces, recall {recall * 100:5.1f}%")
+
+'''
+benchmark_backends()
+
+Compares every face detector backend against dlib's HOG detector at full resolution with 1x upsampling.
+'''
+def benchmark_backends(grays):
+    reference = None
+    for name in face_detectors.DETECTORS:
+        try:
+            detector = face_detectors.create_detector(name)
+        except (FileNotFoundError, cv2.error) as error:
+            print(f"{name:<5} skipped:  {error}")
+            continue
+
+        ms, found = benchmark_setting(detector, grays, 1.0, 1)
+        faces = sum(len(rects) for rects in found)
+        if reference is None:
+            reference = found
+        reference_ious = [value for rects, other in zip(reference, found) for value in best_ious(rects, other)]
+        found_ious = [value for rects, other in zip(reference, found) for value in best_ious(other, rects)]
+        matched = [value for value in reference_ious if value >= MIN_IOU]
+        recall = len(matched) / len(reference_ious) if reference_ious else 1.0
+        precision = sum(1 for value in found_ious if value >= MIN_IOU) / faces if faces else 1.0
+        mean_iou = sum(matched) / len(matched) if matched else 0.0
+        print(f"{name:<5} {ms:8.2f} ms/image, {faces:4d} faces, recall {recall * 100:5.1f}%, "
+              f"precision {precision * 100:5.1f}%, mean IoU {mean_iou:.3f}")
+
+'''
+main()
+
+Driver function for the benchmark.
+'''
+def main():
+    arguments = sys.argv[1:]
+    backends = len(arguments) > 0 and arguments[0] == 'backends'
+    if backends:
+        arguments = arguments[1:]
+    input_location = arguments[0] if len(arguments) > 0 else eye_tracker.INPUT_LOCATION
+
+    grays = load_grays(input_location)
+    if (len(grays) == 0):
+        print("Error!  There are no images in \"" + input_location + "\" to benchmark with!")
+        return
+
+    print(f"Benchmarking face detection on {len(grays)} images from \"{input_location}\"...")
+    if backends:
+        benchmark_backends(grays)
+    else:
+        benchmark_scales(grays, int(arguments[1]) if len(arguments) > 1 else face_tracking.MIN_FACE_SIZE)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+'''
+eye_engine.py
+
+This python script contains the eye tracking engine shared by eye_tracker.py and live_eye_tracker.py.
+
+The engine finds the faces in a frame, segments the eyes inside a padded box around the eye landmarks and draws the
+pupils (and optionally the eye outlines) onto the frame.  It can process single frames or every frame of a frame
+source (see frame_sources.py), so webcams, video files, image folders and in-memory images all go through the same
+code.
+
+Source:  https://towardsdatascience.com/real-time-eye-tracking-using-opencv-and-dlib-b504ca724ac6
+'''
+
+import cv2         # For image processing
+import dlib        # For loading the face recognition model
+import numpy as np # For general purpose number work
+from face_detectors import create_detector # For the selectable face detector backends
+from face_tracking import FaceTracker, MIN_FACE_SIZE # For finding the faces and their landmarks
+from time import perf_counter # For timing the stages of the eye tracker
+
+# The default threshold value to apply to the mask
+THRESHOLD = 78
+
+# The number of pixels around the eye landmarks that are included when segmenting the eyes
+EYE_PADDING = 8
+
+# These coordinates correspond to the eye coordinates given by the predictor model.
+LEFT_EYE = [36, 37, 38, 39, 40, 41]
+RIGHT_EYE = [42, 43, 44, 45, 46, 47]
+
+'''
+eye_on_mask()
+
+Finds an eye (left or right depending on side) on the given mask.
+
+shape - the shape predictor
+mask - the image mask
+side - the side of the face to detect the eye from
+'''
+def eye_on_mask(shape, mask, side):
+    points = [shape[i] for i in side]
+    points = np.array(points, dtype=np.int32)
+    mask = cv2.fillConvexPoly(mask, points, 255)
+    return mask
+
+'''
+contouring()
+
+Utilizing contouring, this function draws red circles in the center of detected eyeballs.
+
+threshold - the calculated image threshold
+mid - the midpoint between the eys
+img - the image to draw to
+right - whether or not the contour is on the right side of the face
+offset - the (x, y) position of the threshold image within img, used when the threshold is cropped to the eyes
+
+Returns the (x, y) position of the pupil in img, or None if no pupil was found.
+'''
+def contouring(threshold, mid, img, right=False, offset=(0, 0)):
+    cnts, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    # Nothing was dark enough to be a pupil
+    if not cnts:
+        return None
+    cnt = max(cnts, key = cv2.contourArea)
+    M = cv2.moments(cnt)
+
+    # The largest contour is a line or a single pixel, so it has no centroid
+    if M['m00'] == 0:
+        return None
+    cx = int(M['m10']/M['m00'])
+    cy = int(M['m01']/M['m00'])
+    if right:
+        cx += mid
+    cx += offset[0]
+    cy += offset[1]
+    cv2.circle(img, (cx, cy), 4, (0, 255, 0), 2)
+    return cx, cy
+
+'''
+eye_region()
+
+Returns the (x0, y0, x1, y1) bounding box around the eye landmarks (36-47), padded and clipped to the image.  Both
+corners are clipped, so a box that lies (partly) outside of the image is cut down to the part inside it and a box
+that lies completely outside of it is empty (x0 == x1 or y0 == y1).
+
+shape - the (68, 2) landmark coordinates
+img_shape - the shape of the image
+padding - the number of pixels to pad the box with on every side
+'''
+def eye_region(shape, img_shape, padding=EYE_PADDING):
+    eyes = shape[36:48]
+    height, width = img_shape[:2]
+    x0 = min(max(int(eyes[:, 0].min()) - padding, 0), width)
+    y0 = min(max(int(eyes[:, 1].min()) - padding, 0), height)
+    x1 = min(max(int(eyes[:, 0].max()) + padding + 1, x0), width)
+    y1 = min(max(int(eyes[:, 1].max()) + padding + 1, y0), height)
+    return x0, y0, x1, y1
+
+'''
+segment_eyes()
+
+Segments the eyes of one face inside a padded box around the eye landmarks instead of the full frame.
+
+img - the image the face was found in
+shape - the (68, 2) landmark coordinates
+threshold_value - the threshold value to apply to the mask
+kernel - if given, the eye mask is dilated with this kernel before segmenting
+
+Returns the inverted threshold of the eye region, the (x0, y0) position of the region within img and the midpoint
+between the eyes relative to the region, or None if the eyes are outside of the image (ie: a tracked face drifted
+off the frame).
+'''
+def segment_eyes(img, shape, threshold_value, kernel=None):
+    # Pad enough for the dilation to fit inside the region
+    padding = EYE_PADDING if kernel is None else EYE_PADDING + max(kernel.shape)
+    x0, y0, x1, y1 = eye_region(shape, img.shape, padding)
+    if x0 == x1 or y0 == y1:
+        return None
+    roi = img[y0:y1, x0:x1]
+    local_shape = shape - (x0, y0)
+
+    # Create the eye mask
+    mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+    mask = eye_on_mask(local_shape, mask, LEFT_EYE)
+    mask = eye_on_mask(local_shape, mask, RIGHT_EYE)
+
+    # Expand the eyes in the mask
+    if kernel is not None:
+        mask = cv2.dilate(mask, kernel, 5)
+
+    # Segment out the eyes in the mask, everything outside of the eyes (and pure black pixels) becomes white
+    eyes_gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    eyes_gray[(mask == 0) | (roi == 0).all(axis=2)] = 255
+    mid = min(max(int(shape[42][0] + shape[39][0]) // 2 - x0, 0), x1 - x0)
+
+    # Thresholding is used to create to binary nature of the mask
+    _, threshold = cv2.threshold(eyes_gray, threshold_value, 255, cv2.THRESH_BINARY)
+    # threshold = cv2.erode(threshold, None, iterations=2)
+    # threshold = cv2.dilate(threshold, None, iterations=4) # Reduces the size of the mask
+    # threshold = cv2.medianBlur(threshold, 3)
+
+    # Invert the threshold so that contouring works as intended
+    threshold = cv2.bitwise_not(threshold)
+    return threshold, (x0, y0), mid
+
+'''
+FaceResult
+
+The eyes found for one face in a frame.
+
+rect - the dlib rectangle of the face
+shape - the (68, 2) landmark coordinates
+threshold - the inverted threshold of the eye region
+offset - the (x, y) position of the eye region within the frame
+mid - the midpoint between the eyes relative to the eye region
+pupils - the (x, y) positions of the left and right pupils in the frame, None for a pupil that was not found
+'''
+class FaceResult():
+    def __init__(self, rect, shape, threshold, offset, mid, pupils):
+        self.rect = rect
+        self.shape = shape
+        self.threshold = threshold
+        self.offset = offset
+        self.mid = mid
+        self.pupils = pupils
+
+'''
+eye_mask()
+
+Returns the threshold mask of the eyes of every face pasted into a mask the size of the frame, or None if there are
+no faces.
+'''
+def eye_mask(img_shape, faces):
+    if not faces:
+        return None
+    mask = np.zeros(img_shape[:2], dtype=np.uint8)
+    for face in faces:
+        x0, y0 = face.offset
+        mask[y0:y0 + face.threshold.shape[0], x0:x0 + face.threshold.shape[1]] = face.threshold
+    return mask
+
+'''
+EyeTracker
+
+The eye tracking engine.  Loads the face detector and landmark predictor once so they can be reused for many frames.
+
+Per-stage timings (load, detect, landmark, mask and contour) are accumulated across every processed frame.
+
+model_path - the location of the landmark predictor model file
+threshold - the threshold value to apply to the mask, can be changed between frames
+detection_scale - the scale frames are resized to before looking for faces, or 'auto' (see face_tracking.py)
+upsample - the number of times the face detector upsamples the resized frame (ignored with 'auto')
+dilation_size - the size of the kernel the eye mask is dilated with, or 0 to not dilate it
+draw_outlines - whether the eye landmarks are drawn onto the frame
+redetect_interval - the face detector is run at least once every this many frames, faces are tracked in between.
+                    Leave this at 1 for unrelated images.
+use_correlation_tracker - whether faces are followed with dlib's correlation tracker between detections
+detector - the face detector backend to use, 'hog', 'haar' or 'dnn' (see face_detectors.py)
+detector_options - the options passed to the face detector backend (ie: the DNN model files)
+min_face_size - the smallest face (in full resolution pixels) that has to be found when detection_scale is 'auto'
+'''
+class EyeTracker():
+    # The stages that are timed
+    STAGES = ['load', 'detect', 'landmark', 'mask', 'contour']
+
+    def __init__(self, model_path, threshold=THRESHOLD, detection_scale=1.0, upsample=1, dilation_size=0,
+                 draw_outlines=True, redetect_interval=1, use_correlation_tracker=False, detector='hog', detector_options=None,
+                 min_face_size=MIN_FACE_SIZE):
+        self.threshold = threshold
+        self.kernel = np.ones((dilation_size, dilation_size), np.uint8) if dilation_size else None
+        self.draw_outlines = draw_outlines
+        self.timings = dict.fromkeys(self.STAGES, 0.0)
+        self.frames = 0
+        self.faces = 0
+
+        # Initialize the face detector and predictor model from dlib
+        start = perf_counter()
+        self.detector = create_detector(detector, **(detector_options or {}))
+        self.predictor = dlib.shape_predictor(model_path)
+        self.timings['load'] = perf_counter() - start
+
+        self.face_tracker = FaceTracker(self.detector, self.predictor, redetect_interval, use_correlation_tracker,
+                                        detection_scale=detection_scale, upsample=upsample, min_face_size=min_face_size)
+
+    '''
+    track()
+
+    Runs the eye tracker on a frame, drawing the detections onto it.
+
+    Returns a FaceResult for every face found.
+    '''
+    def track(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return self.find_eyes(img, self.face_tracker.track(gray))
+
+    '''
+    track_batch()
+
+    Runs the eye tracker on a chunk of unrelated frames, predicting the landmarks of all of their faces in one go.
+
+    Returns a list of the FaceResults of every frame.
+    '''
+    def track_batch(self, imgs):
+        grays = [cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) for img in imgs]
+        return [self.find_eyes(img, faces) for img, faces in zip(imgs, self.face_tracker.detect_batch(grays))]
+
+    '''
+    find_eyes()
+
+    Segments the eyes of every face found in a frame and draws the pupils onto it.
+
+    faces - the (rect, shape) tuples of the faces in the frame
+
+    Returns a FaceResult for every face.
+    '''
+    def find_eyes(self, img, faces):
+        self.frames += 1
+        self.timings['detect'] = self.face_tracker.timings['detect']
+        self.timings['landmark'] = self.face_tracker.timings['landmark']
+
+        results = []
+        for rect, shape in faces:
+            # Segment the eyes inside a box around the eye landmarks
+            start = perf_counter()
+            segmented = segment_eyes(img, shape, self.threshold, self.kernel)
+            self.timings['mask'] += perf_counter() - start
+
+            # Skip faces whose eyes are outside of the frame
+            if segmented is None:
+                continue
+            threshold, offset, mid = segmented
+            self.faces += 1
+
+            # Draw red circles in the center of the detected eyes
+            start = perf_counter()
+            left = contouring(threshold[:, 0:mid], mid, img, offset=offset)
+            right = contouring(threshold[:, mid:], mid, img, True, offset)
+
+            # Display detected eye outlines if enabled
+            if (self.draw_outlines):
+                for (x, y) in shape[36:48]:
+                    cv2.circle(img, (x, y), 2, (255, 255, 0), -1)
+            self.timings['contour'] += perf_counter() - start
+
+            results.append(FaceResult(rect, shape, threshold, offset, mid, (left, right)))
+        return results
+
+    '''
+    process()
+
+    Runs the eye tracker on an image, drawing the detections onto it.
+
+    Returns the threshold mask of the eyes of every detected face (or a copy of the image if no face was found).
+    '''
+    def process(self, img):
+        threshold = eye_mask(img.shape, self.track(img))
+        return img.copy() if threshold is None else threshold
+
+    '''
+    process_source()
+
+    Runs the eye tracker on every frame of a frame source (see frame_sources.py).
+
+    source - the frame source
+    chunk_size - when faces are not tracked between frames, this many frames are processed with track_batch() at once
+
+    Yields the name of every frame, the frame with the detections drawn onto it and its FaceResults.
+    '''
+    def process_source(self, source, chunk_size=1):
+        if chunk_size <= 1 or self.face_tracker.redetect_interval > 1:
+            for name, img in source:
+                yield name, img, self.track(img)
+            return
+
+        chunk = []
+        for frame in source:
+            chunk.append(frame)
+            if len(chunk) == chunk_size:
+                yield from self.process_chunk(chunk)
+                chunk = []
+        yield from self.process_chunk(chunk)
+
+    '''
+    process_chunk()
+
+    Runs track_batch() on a list of (name, img) frames and yields them with their FaceResults.
+    '''
+    def process_chunk(self, chunk):
+        if not chunk:
+            return
+        names, imgs = zip(*chunk)
+        for name, img, faces in zip(names, imgs, self.track_batch(imgs)):
+            yield name, img, faces
+
+    '''
+    timing_report()
+
+    Returns a summary of the total and per-image time spent in every stage.
+    '''
+    def timing_report(self):
+        return timing_report(self.timings, self.frames, self.faces)
+
+'''
+timing_report()
+
+Returns a summary of the total and per-image time spent in every stage.
+
+timings - a dictionary of the seconds spent in every stage
+frames - the number of images processed
+faces - the number of faces found
+'''
+def timing_report(timings, frames, faces):
+    lines = [f"Processed {frames} image(s) with {faces} face(s)"]
+    for stage in EyeTracker.STAGES:
+        total = timings[stage]
+        if stage == 'load' or frames == 0:
+            lines.append(f"  {stage:<9} {total * 1000:9.1f} ms")
+        else:
+            lines.append(f"  {stage:<9} {total * 1000:9.1f} ms total, {total * 1000 / frames:7.2f} ms/image")
+    return '\n'.join(lines)
@@ -0,0 +1,118 @@
+'''
+eye_records.py
+
+This python script contains the structured output of the eye tracker.
+
+Instead of (or as well as) writing an annotated image and a mask for every frame, the eye tracker can write one record
+per frame with the face rectangles, the 68 landmarks, the pupil centroids and whether the pupils were found.  This
+is a single small write per frame, so the coordinates can be used without re-running the tracker.  Two formats are
+supported:
+- jsonl:  One JSON object per frame and line.
+- csv:  One row per face (or per frame without a face) with a column for every value.
+
+Records are buffered in memory and written out in blocks.
+'''
+
+import csv         # For the csv format
+import json        # For the jsonl format
+
+# The file extension of every format
+FORMATS = {'jsonl': '.jsonl', 'csv': '.csv'}
+
+# The columns of the csv format
+CSV_FIELDS = (['frame', 'success', 'face', 'left', 'top', 'right', 'bottom', 'left_pupil_x', 'left_pupil_y',
+               'right_pupil_x', 'right_pupil_y'] + [f'{axis}{i}' for i in range(68) for axis in ('x', 'y')])
+
+'''
+frame_record()
+
+Returns the record of one frame.
+
+name - the name of the frame
+faces - the FaceResults the eye tracking engine found in the frame
+
+A frame is successful when both pupils of at least one face were found.
+'''
+def frame_record(name, faces):
+    records = []
+    for face in faces:
+        records.append({
+            'rect': [face.rect.left(), face.rect.top(), face.rect.right(), face.rect.bottom()],
+            'landmarks': face.shape.tolist(),
+            'pupils': [[int(pupil[0]), int(pupil[1])] if pupil is not None else None for pupil in face.pupils],
+            'success': all(pupil is not None for pupil in face.pupils),
+        })
+    return {'frame': name, 'success': any(record['success'] for record in records), 'faces': records}
+
+'''
+csv_rows()
+
+Returns the csv rows of a frame record, one for every face or a single row if there are no faces.
+'''
+def csv_rows(record):
+    if not record['faces']:
+        return [[record['frame'], 0, ''] + [''] * (len(CSV_FIELDS) - 3)]
+    rows = []
+    for index, face in enumerate(record['faces']):
+        row = [record['frame'], int(face['success']), index] + face['rect']
+        for pupil in face['pupils']:
+            row += pupil if pupil is not None else ['', '']
+        for x, y in face['landmarks']:
+            row += [x, y]
+        rows.append(row)
+    return rows
+
+'''
+RecordWriter
+
+Writes frame records to a jsonl or csv file, buffering them so that the file is only written every few frames.
+
+path - the file to write
+output_format - 'jsonl' or 'csv'
+buffer_size - the number of frames that are buffered before they are written
+'''
+class RecordWriter():
+    def __init__(self, path, output_format='jsonl', buffer_size=256):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format \"{output_format}\", choose one of {', '.join(FORMATS)}")
+        self.output_format = output_format
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.written = 0
+        self.file = open(path, 'w', newline='')
+        if output_format == 'csv':
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(CSV_FIELDS)
+
+    '''
+    write()
+
+    Adds the record of a frame to the buffer, writing the buffer out once it is full.
+    '''
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    '''
+    flush()
+
+    Writes every buffered record to the file.
+    '''
+    def flush(self):
+        if self.output_format == 'jsonl':
+            self.file.write(''.join(json.dumps(record) + '\n' for record in self.buffer))
+        else:
+            self.csv.writerows(row for record in self.buffer for row in csv_rows(record))
+        self.file.flush()
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    '''
+    close()
+
+    Writes the remaining records and closes the file.
+    '''
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -14,10 +14,12 @@ Source:  https://towardsdatascience.com/real-time-eye-tracking-using-opencv-and-
 '''
 
 import cv2         # For image processing
-import dlib        # For loading the face recognition model
-import numpy as np # For general purpose number work
 import sys         # For argument loading
 import os          # For working with paths
+import multiprocessing # For processing directories on multiple cores
+from eye_engine import EyeTracker, eye_mask, timing_report # The eye tracking engine shared with live_eye_tracker.py
+from eye_records import FORMATS, RecordWriter, frame_record # For writing the results as structured records
+from frame_sources import ImageDirectorySource # For reading the input images
 
 # Controls whether or not eye outlines are shown on the image
 ENABLE_EYE_OUTLINES = True
@@ -37,62 +39,56 @@ SAVE_LOCATION = os.path.join(os.getcwd(), 'images\\processed')
 # The threshold value to apply to the mask
 THRESHOLD = 78 # play with this value if your eye tracking is too sensitive or not sensitive enough
 
-'''
-shape_to_np()
+# The scale frames are downscaled to before looking for faces, the found faces are mapped back to full resolution
+# Set this to 'auto' to use the smallest scale that still finds faces of MIN_FACE_SIZE pixels
+DETECTION_SCALE = 1.0
 
-Converts a shape predictor into a set of (x, y) coordinates
+# The smallest face (in full resolution pixels) that has to be found when DETECTION_SCALE is 'auto'
+MIN_FACE_SIZE = 160
 
-shape - the shape predictor
-dtype - the type of input data
-'''
-def shape_to_np(shape, dtype="int"):
-	# Initialize the list of (x, y)-coordinates
-	coords = np.zeros((68, 2), dtype=dtype)
-     
-	# Loop over the 68 facial landmarks in the model and convert them to a 2-tuple of (x, y)-coordinates
-	for i in range(0, 68):
-		coords[i] = (shape.part(i).x, shape.part(i).y)
-          
-	# Return the list of (x, y)-coordinates
-	return coords
+# How many times the face detector upsamples the (downscaled) frame, each upsample finds faces half the size
+DETECTION_UPSAMPLE = 1
 
-'''
-eye_on_mask()
+# The size of the kernel the eye mask is expanded with before thresholding, or 0 to not expand it
+DILATION_SIZE = 0
+
+# The face detector backend, 'hog', 'haar' or 'dnn', and its options (see face_detectors.py)
+# ie: DETECTOR_OPTIONS = {'model_path': 'model/res10_300x300_ssd_iter_140000.caffemodel', 'config_path': 'model/deploy.prototxt'}
+DETECTOR_BACKEND = 'hog'
+DETECTOR_OPTIONS = {}
 
-Finds an eye (left or right depending on side) on the given mask.
+# Set this to 'jsonl' or 'csv' to write the face rectangles, landmarks and pupils of every image in directory mode to
+# RECORDS_NAME (plus the extension) in SAVE_LOCATION, or None to not write records
+OUTPUT_FORMAT = None
+RECORDS_NAME = 'eye_tracking'
+
+# Controls whether the annotated image and the mask are saved for every image
+SAVE_IMAGES = True
+
+# The default number of worker processes and the number of images handed to a worker at a time in directory mode
+BATCH_WORKERS = 1
+BATCH_CHUNK_SIZE = 4
 
-shape - the shape predictor
-mask - the image mask
-side - the side of the face to detect the eye from
 '''
-def eye_on_mask(shape, mask, side):
-    points = [shape[i] for i in side]
-    points = np.array(points, dtype=np.int32)
-    mask = cv2.fillConvexPoly(mask, points, 255)
-    return mask
+tracker_options()
 
+Returns the settings above as the keyword arguments of the eye tracking engine.
 '''
-contouring()
+def tracker_options():
+    return {'model_path': MODEL_PATH, 'threshold': THRESHOLD, 'detection_scale': DETECTION_SCALE,
+            'upsample': DETECTION_UPSAMPLE, 'dilation_size': DILATION_SIZE, 'draw_outlines': ENABLE_EYE_OUTLINES,
+            'detector': DETECTOR_BACKEND, 'detector_options': DETECTOR_OPTIONS, 'min_face_size': MIN_FACE_SIZE}
 
-Utilizing contouring, this function draws red circles in the center of detected eyeballs.
+'''
+save_result()
 
-threshold - the calculated image threshold
-mid - the midpoint between the eys
-img - the image to draw to
-right - whether or not the contour is on the right side of the face
+Saves the true image with eye detections and facial landmarks along with the mask (or a copy of the image if no face
+was found).
 '''
-def contouring(threshold, mid, img, right=False):
-    cnts, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    try:
-        cnt = max(cnts, key = cv2.contourArea)
-        M = cv2.moments(cnt)
-        cx = int(M['m10']/M['m00'])
-        cy = int(M['m01']/M['m00'])
-        if right:
-            cx += mid
-        cv2.circle(img, (cx, cy), 4, (0, 255, 0), 2)
-    except:
-        pass
+def save_result(input_file_name, img, faces):
+    threshold = eye_mask(img.shape, faces)
+    cv2.imwrite(os.path.join(SAVE_LOCATION, input_file_name + '.jpg'), img)
+    cv2.imwrite(os.path.join(SAVE_LOCATION, input_file_name + '-mask.jpg'), img if threshold is None else threshold)
 
 '''
 run_eye_detector()
@@ -100,66 +96,72 @@ run_eye_detector()
 Runs the eye_detector on a single image given by input_file_name.
 
 input_file_name - the image to run the eye detector on
+tracker - the EyeTracker to use, one is created if it is not given
 '''
-def run_eye_detector(input_file_name):
-     # Initialize the face detector and predictor model from dlib
-    detector = dlib.get_frontal_face_detector()
-    predictor = dlib.shape_predictor(MODEL_PATH)
-
-    # These coordinates correspond to the eye coordinates given by the predictor model.
-    left_eye = [36, 37, 38, 39, 40, 41]
-    right_eye = [42, 43, 44, 45, 46, 47]
+def run_eye_detector(input_file_name, tracker=None):
+    if tracker is None:
+        tracker = EyeTracker(**tracker_options())
 
     # Read from the input parameter
     img = cv2.imread(os.path.join(INPUT_LOCATION, input_file_name + '.jpg'))
-    threshold = img.copy()
-
-    # Prepare the eye tracker
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    rects = detector(gray, 1)
-    for rect in rects:
-        shape = predictor(gray, rect)
-        shape = shape_to_np(shape)
-
-        # Create the eye mask
-        mask = np.zeros(img.shape[:2], dtype=np.uint8)
-        mask = eye_on_mask(shape, mask, left_eye)
-        mask = eye_on_mask(shape, mask, right_eye)
-
-        # Expand the eyes in the mask
-        # kernel = np.ones((9, 9), np.uint8)
-        # mask = cv2.dilate(mask, kernel, 5)
-
-        # Segment out the eyes in the mask
-        eyes = cv2.bitwise_and(img, img, mask=mask)
-        mask = (eyes == [0, 0, 0]).all(axis=2)
-        eyes[mask] = [255, 255, 255]
-        mid = (shape[42][0] + shape[39][0]) // 2
-        eyes_gray = cv2.cvtColor(eyes, cv2.COLOR_BGR2GRAY)
-
-        # Thresholding is used to create to binary nature of the mask
-        # Change the threshold value depending on the value of the slider
-        threshold = THRESHOLD
-        _, threshold = cv2.threshold(eyes_gray, threshold, 255, cv2.THRESH_BINARY)
-        # threshold = cv2.erode(threshold, None, iterations=2)
-        # threshold = cv2.dilate(threshold, None, iterations=4) # Reduces the size of the mask
-        # threshold = cv2.medianBlur(threshold, 3)
-
-        # Invert the threshold so that contouring works as intended
-        threshold = cv2.bitwise_not(threshold)
-
-        # Draw red circles in the center of the detected eyes
-        contouring(threshold[:, 0:mid], mid, img)
-        contouring(threshold[:, mid:], mid, img, True)
-
-        # Display detected eye outlines if enabled
-        if (ENABLE_EYE_OUTLINES):
-            for (x, y) in shape[36:48]:
-                cv2.circle(img, (x, y), 2, (255, 255, 0), -1)
-
-    # Save the true image with eye detections and facial landmarks along with the mask
-    cv2.imwrite(os.path.join(SAVE_LOCATION, input_file_name + '.jpg'), img)
-    cv2.imwrite(os.path.join(SAVE_LOCATION, input_file_name + '-mask.jpg'), threshold)
+    faces = tracker.track(img)
+    if (SAVE_IMAGES):
+        save_result(input_file_name, img, faces)
+    return frame_record(input_file_name, faces)
+
+'''
+init_worker()
+
+Initializes a batch worker process by loading the models once for every image the worker processes.
+The locations are passed in so that changes made by the parent process also apply to the workers.
+'''
+_worker_tracker = None
+def init_worker(input_location, save_location, save_images, options):
+    global _worker_tracker, INPUT_LOCATION, SAVE_LOCATION, SAVE_IMAGES
+    INPUT_LOCATION = input_location
+    SAVE_LOCATION = save_location
+    SAVE_IMAGES = save_images
+    _worker_tracker = EyeTracker(**options)
+
+'''
+process_file()
+
+Runs the eye detector on one image inside a batch worker.
+
+Returns the file name, the number of faces found, the seconds spent in every stage (including the model load
+the first time a worker runs) and the image's record.
+'''
+def process_file(input_file_name):
+    before = dict(_worker_tracker.timings)
+    faces = _worker_tracker.faces
+    record = run_eye_detector(input_file_name, _worker_tracker)
+    timings = {stage: _worker_tracker.timings[stage] - before[stage] for stage in EyeTracker.STAGES}
+    if _worker_tracker.frames == 1:
+        timings['load'] = _worker_tracker.timings['load']
+    return input_file_name, _worker_tracker.faces - faces, timings, record
+
+'''
+run_batch()
+
+Runs the eye detector on many images with a pool of worker processes.  Every worker loads the models once.
+Results are yielded in the same order as input_file_names.
+
+input_file_names - the images to process (without the extension)
+workers - the number of worker processes
+chunk_size - how many images are handed to a worker at a time
+'''
+def run_batch(input_file_names, workers=BATCH_WORKERS, chunk_size=BATCH_CHUNK_SIZE):
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(INPUT_LOCATION, SAVE_LOCATION, SAVE_IMAGES, tracker_options())) as pool:
+        for result in pool.imap(process_file, input_file_names, chunk_size):
+            yield result
+
+'''
+list_input_files()
+
+Returns the names (without the extension) of the images in the input directory.
+'''
+def list_input_files():
+    return [file.split('.')[0] for file in sorted(os.listdir(INPUT_LOCATION)) if file.endswith('.jpg')]
 
 '''
 main()
@@ -169,6 +171,7 @@ Driver function for the eye detector.
 Should have at least one argument specifying whether to run in 'directory' mode or not.
 
 'directory' mode applies the eye_detector script to the entire input directory.
+    Optional extra arguments set the number of worker processes and the chunk size (ie: python eye_tracker.py True 4 8).
 'single' mode applies the eye_detector script to a specified file within the input directory.
 '''
 def main():
@@ -178,10 +181,41 @@ def main():
          return
 
     if (sys.argv[1] == "True"): # Directory Mode
-        for file in os.listdir(INPUT_LOCATION):
-            if (file.endswith('.jpg')):
-                print('Processing \"' + file + '\"...')
-                run_eye_detector(file.split('.')[0])
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else BATCH_WORKERS
+        chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else BATCH_CHUNK_SIZE
+
+        # The records of every image are written to a single buffered file by this process
+        writer = None
+        if (OUTPUT_FORMAT is not None):
+            writer = RecordWriter(os.path.join(SAVE_LOCATION, RECORDS_NAME + FORMATS[OUTPUT_FORMAT]), OUTPUT_FORMAT)
+
+        if (workers <= 1):
+            # Load the models once for the whole directory
+            tracker = EyeTracker(**tracker_options())
+            for file, img, faces in tracker.process_source(ImageDirectorySource(INPUT_LOCATION, list_input_files()), chunk_size):
+                print('Processed \"' + file + '.jpg\"')
+                if (SAVE_IMAGES):
+                    save_result(file, img, faces)
+                if (writer is not None):
+                    writer.write(frame_record(file, faces))
+            print(tracker.timing_report())
+        else:
+            # Fan the images out to worker processes that each load the models once
+            timings = dict.fromkeys(EyeTracker.STAGES, 0.0)
+            frames = faces = 0
+            for file, file_faces, file_timings, record in run_batch(list_input_files(), workers, chunk_size):
+                print('Processed \"' + file + '.jpg\"')
+                frames += 1
+                faces += file_faces
+                for stage in EyeTracker.STAGES:
+                    timings[stage] += file_timings[stage]
+                if (writer is not None):
+                    writer.write(record)
+            print(timing_report(timings, frames, faces))
+
+        if (writer is not None):
+            writer.close()
+            print(f"Wrote {writer.written} records to \"{writer.file.name}\"")
     elif(len(sys.argv) == 3): # Single Mode
         if (not sys.argv[2].endswith('.jpg')):
             print('Processing \"' + sys.argv[2] + "\"...")
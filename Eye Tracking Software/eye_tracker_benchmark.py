@@ -0,0 +1,77 @@
+'''
+eye_tracker_benchmark.py
+
+This python script benchmarks the eye tracker on the images in eye_tracker.py's INPUT_LOCATION.
+
+It reports the images per second of the eye tracking engine for every frame source type (the image folder, the
+same images already in memory and optionally a video file), and of directory mode against the number of worker
+processes.  The processed images are written to a temporary directory so SAVE_LOCATION is left untouched.
+
+    python eye_tracker_benchmark.py [video_file]
+'''
+
+import eye_tracker  # The eye tracker being benchmarked
+import frame_sources # The frame sources the engine is benchmarked with
+import os           # For working with paths
+import sys          # For argument loading
+import tempfile     # For a throwaway output directory
+from eye_engine import EyeTracker
+from time import perf_counter
+
+# The numbers of worker processes to benchmark
+WORKER_COUNTS = [1, 2, 4, os.cpu_count()]
+
+'''
+benchmark_batch()
+
+Runs directory mode with the given number of workers and returns the images per second.
+'''
+def benchmark_batch(input_file_names, workers):
+    start = perf_counter()
+    for _ in eye_tracker.run_batch(input_file_names, workers, eye_tracker.BATCH_CHUNK_SIZE):
+        pass
+    return len(input_file_names) / (perf_counter() - start)
+
+'''
+benchmark_source()
+
+Runs the eye tracking engine over every frame of a source and returns the frames per second.
+'''
+def benchmark_source(tracker, source):
+    frames = 0
+    start = perf_counter()
+    for _ in tracker.process_source(source):
+        frames += 1
+    source.close()
+    return frames / (perf_counter() - start)
+
+'''
+main()
+
+Driver function for the benchmark.
+'''
+def main():
+    input_file_names = eye_tracker.list_input_files()
+    if (len(input_file_names) == 0):
+        print("Error!  There are no .jpg images in \"" + eye_tracker.INPUT_LOCATION + "\" to benchmark with!")
+        return
+
+    # The models are loaded once and shared by every source, so only the processing is measured
+    tracker = EyeTracker(**eye_tracker.tracker_options())
+    directory = frame_sources.ImageDirectorySource(eye_tracker.INPUT_LOCATION, input_file_names)
+    sources = [('image folder', directory),
+               ('in-memory arrays', frame_sources.ArraySource([img for _, img in directory], input_file_names))]
+    if (len(sys.argv) > 1):
+        sources.append(('video file', frame_sources.VideoSource(sys.argv[1])))
+    for name, source in sources:
+        print(f"{name}:  {benchmark_source(tracker, source):.2f} frames/s")
+
+    with tempfile.TemporaryDirectory() as save_location:
+        eye_tracker.SAVE_LOCATION = save_location
+        print(f"Benchmarking {len(input_file_names)} images from \"{eye_tracker.INPUT_LOCATION}\"...")
+        for workers in sorted(set(WORKER_COUNTS)):
+            images_per_second = benchmark_batch(input_file_names, workers)
+            print(f"{workers} worker(s):  {images_per_second:.2f} images/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+'''
+face_detectors.py
+
+This python script contains the face detector backends the eye tracking engine can use.
+
+Every backend is called like dlib's frontal face detector, detector(gray, upsample), and returns the found faces as
+dlib rectangles, so the rest of the eye tracker does not need to know which one is used.  There are three backends:
+- hog:  dlib's HOG frontal face detector (the original detector).
+- haar:  OpenCV's Haar cascade face detector, using the cascade files that ship with opencv-python by default.
+- dnn:  OpenCV's DNN face detector (the res10 300x300 SSD) loaded from local model files.  These can be downloaded from
+  https://github.com/opencv/opencv/tree/master/samples/dnn/face_detector and placed in the model folder.
+'''
+
+import cv2         # For the OpenCV detectors
+import dlib        # For the HOG detector and the rectangles every backend returns
+import os          # For working with paths
+from face_tracking import HOG_WINDOW_SIZE # The smallest face the HOG detector finds without upsampling
+
+# The Haar cascade used when no cascade file is given
+HAAR_CASCADE_PATH = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml') if hasattr(cv2, 'data') else None
+
+# The DNN face detector's weights and network description
+DNN_MODEL_PATH = os.path.join('model', 'res10_300x300_ssd_iter_140000.caffemodel')
+DNN_CONFIG_PATH = os.path.join('model', 'deploy.prototxt')
+
+'''
+HogDetector
+
+dlib's HOG frontal face detector.
+'''
+class HogDetector():
+    name = 'hog'
+
+    def __init__(self):
+        self.detector = dlib.get_frontal_face_detector()
+
+    def __call__(self, gray, upsample=1):
+        return list(self.detector(gray, upsample))
+
+'''
+HaarDetector
+
+OpenCV's Haar cascade face detector.  Each upsample halves the smallest face that is searched for, like it does for
+the HOG detector.
+
+cascade_path - the cascade file to load
+scale_factor - how much the image is shrunk between the scales that are searched
+min_neighbors - how many overlapping detections a face needs to be kept, higher values give fewer false positives
+'''
+class HaarDetector():
+    name = 'haar'
+
+    def __init__(self, cascade_path=HAAR_CASCADE_PATH, scale_factor=1.1, min_neighbors=5):
+        if cascade_path is None or not os.path.exists(cascade_path):
+            raise FileNotFoundError(f"Could not find the Haar cascade \"{cascade_path}\"")
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def __call__(self, gray, upsample=1):
+        min_size = max(HOG_WINDOW_SIZE >> upsample, 20)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                                              minSize=(min_size, min_size))
+        return [dlib.rectangle(int(x), int(y), int(x + w - 1), int(y + h - 1)) for (x, y, w, h) in faces]
+
+'''
+DnnDetector
+
+OpenCV's DNN face detector.  The network always looks at a 300x300 copy of the frame, so upsample is ignored.
+
+model_path - the network's weights (.caffemodel)
+config_path - the network's description (.prototxt)
+confidence - faces the network is less sure of than this are dropped
+'''
+class DnnDetector():
+    name = 'dnn'
+
+    # The size of the network's input and the mean that is subtracted from every BGR pixel
+    INPUT_SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, model_path=DNN_MODEL_PATH, config_path=DNN_CONFIG_PATH, confidence=0.5):
+        for path in (model_path, config_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Could not find the DNN face detector file \"{path}\"")
+        self.net = cv2.dnn.readNetFromCaffe(config_path, model_path)
+        self.confidence = confidence
+
+    def __call__(self, gray, upsample=1):
+        height, width = gray.shape[:2]
+        img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        self.net.setInput(cv2.dnn.blobFromImage(cv2.resize(img, self.INPUT_SIZE), 1.0, self.INPUT_SIZE, self.MEAN))
+        detections = self.net.forward()
+
+        faces = []
+        for detection in detections.reshape(-1, 7):
+            if detection[2] < self.confidence:
+                continue
+            left = int(max(detection[3], 0.0) * width)
+            top = int(max(detection[4], 0.0) * height)
+            right = int(min(detection[5], 1.0) * width) - 1
+            bottom = int(min(detection[6], 1.0) * height) - 1
+            if right > left and bottom > top:
+                faces.append(dlib.rectangle(left, top, right, bottom))
+        return faces
+
+# The available detectors by name
+DETECTORS = {
+    'hog': HogDetector,
+    'haar': HaarDetector,
+    'dnn': DnnDetector,
+}
+
+'''
+create_detector()
+
+Creates the face detector with the given name, passing any options to it.
+'''
+def create_detector(name='hog', **options):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector \"{name}\", choose one of {', '.join(DETECTORS)}")
+    return DETECTORS[name](**options)
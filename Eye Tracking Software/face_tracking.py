@@ -0,0 +1,306 @@
+'''
+face_tracking.py
+
+This python script contains the detect-once-then-track face tracker used by live_eye_tracker.py.
+
+Running the HOG face detector with 1x upsampling is by far the most expensive step of the eye tracker.  Faces barely
+move between two webcam frames, so the tracker only runs the full detection every few frames.  In between, the
+landmark predictor is run again inside a box carried forward from the previous frame's landmarks (or from a dlib
+correlation tracker if enabled).  A full detection is also run as soon as the tracked faces stop looking reliable.
+
+It also contains the (optionally downscaled) face detection shared by every eye tracking entry point.
+'''
+
+import cv2         # For resizing frames before detecting faces
+import dlib        # For the face detector, landmark predictor and correlation tracker
+import numpy as np # For general purpose number work
+from time import perf_counter # For timing the detector and the landmark predictor
+
+# The smallest face (in full resolution pixels) that has to be found when the detection scale is 'auto'.  Faces
+# larger than the detector's window (HOG_WINDOW_SIZE) let the frame be downscaled by the ratio between the two.
+MIN_FACE_SIZE = 160
+
+# The size of the window dlib's frontal face detector slides over the image, smaller faces are not found
+HOG_WINDOW_SIZE = 80
+
+'''
+shape_to_np()
+
+Converts a shape predictor into a set of (x, y) coordinates
+
+All the landmarks are fetched with a single parts() call and converted in one go, instead of two part(i) calls for
+each of the 68 landmarks.  The result is identical to filling the array landmark by landmark.
+
+shape - the shape predictor
+dtype - the type of input data
+'''
+def shape_to_np(shape, dtype="int"):
+    return np.array([(point.x, point.y) for point in shape.parts()], dtype=dtype).reshape(-1, 2)
+
+'''
+predict_landmarks()
+
+Runs the landmark predictor for every face of a chunk of frames and converts all of the landmarks to numpy at once.
+dlib has no batched predictor, so the faces are still predicted one after the other, but the conversion happens
+once per chunk instead of once per face.
+
+predictor - the dlib landmark predictor
+grays - the grayscale frames
+rects - a list of the dlib rectangles of the faces in every frame
+dtype - the type of the coordinates
+
+Returns a list with a (faces, 68, 2) array of the landmarks of every frame.
+'''
+def predict_landmarks(predictor, grays, rects, dtype="int"):
+    points = [(point.x, point.y) for gray, frame_rects in zip(grays, rects) for rect in frame_rects
+              for point in predictor(gray, rect).parts()]
+    coords = np.array(points, dtype=dtype).reshape(-1, 68, 2)
+    return np.split(coords, np.cumsum([len(frame_rects) for frame_rects in rects])[:-1])
+
+'''
+auto_detection_scale()
+
+Returns the smallest (scale, upsample) that still lets the face detector find faces of min_face_size pixels.
+Upsampling is only used when the faces are smaller than the detector's window, since downscaling a frame that
+is then upsampled again only wastes time.
+'''
+def auto_detection_scale(min_face_size=MIN_FACE_SIZE):
+    scale = HOG_WINDOW_SIZE / min_face_size
+    upsample = 0
+    while scale > 1.0:
+        scale /= 2
+        upsample += 1
+    return scale, upsample
+
+'''
+scale_rect()
+
+Returns a copy of a dlib rectangle with its coordinates multiplied by factor.
+'''
+def scale_rect(rect, factor):
+    return dlib.rectangle(int(round(rect.left() * factor)), int(round(rect.top() * factor)),
+                          int(round((rect.right() + 1) * factor)) - 1, int(round((rect.bottom() + 1) * factor)) - 1)
+
+'''
+detect_faces()
+
+Runs the face detector on a downscaled copy of a grayscale frame and maps the found faces back to full resolution.
+
+detector - the dlib face detector
+gray - the full resolution grayscale frame
+scale - the scale the frame is resized to before detecting
+upsample - the number of times the detector upsamples the resized frame
+'''
+def detect_faces(detector, gray, scale=1.0, upsample=1):
+    if scale == 1.0:
+        return list(detector(gray, upsample))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return [scale_rect(rect, 1 / scale) for rect in detector(small, upsample)]
+
+'''
+landmark_box()
+
+Returns the (left, top, right, bottom) bounding box of a set of (x, y) landmark coordinates.
+'''
+def landmark_box(shape):
+    left, top = shape.min(axis=0)
+    right, bottom = shape.max(axis=0)
+    return int(left), int(top), int(right), int(bottom)
+
+'''
+TrackedFace
+
+A face that is being tracked between detections.
+
+rect - the dlib rectangle the landmark predictor was last run in
+shape - the (68, 2) landmark coordinates found in rect
+'''
+class TrackedFace():
+    def __init__(self, rect, shape):
+        self.rect = rect
+        self.shape = shape
+        self.tracker = None
+
+        # The detector's box relative to the landmarks' box, so that carried forward boxes match what the
+        # landmark predictor was trained on
+        left, top, right, bottom = landmark_box(shape)
+        width = max(right - left, 1)
+        height = max(bottom - top, 1)
+        self.margins = ((rect.left() - left) / width, (rect.top() - top) / height,
+                        (rect.right() - right) / width, (rect.bottom() - bottom) / height)
+        self.size = width * height
+
+    '''
+    carried_rect()
+
+    Returns the box to run the landmark predictor in on the next frame, built from the current landmarks.
+    '''
+    def carried_rect(self):
+        left, top, right, bottom = landmark_box(self.shape)
+        width = max(right - left, 1)
+        height = max(bottom - top, 1)
+        return dlib.rectangle(int(round(left + self.margins[0] * width)), int(round(top + self.margins[1] * height)),
+                              int(round(right + self.margins[2] * width)), int(round(bottom + self.margins[3] * height)))
+
+'''
+FaceTracker
+
+Finds the faces and their landmarks in a stream of frames, only running the face detector every few frames.
+
+detector - the dlib face detector
+predictor - the dlib landmark predictor
+redetect_interval - a full detection is run at least once every this many frames
+use_correlation_tracker - whether faces are followed with a dlib correlation tracker between detections instead of
+                          the box around the previous landmarks
+min_track_quality - a full detection is run on the next frame if a correlation tracker's peak to side lobe ratio
+                    drops below this
+max_size_change - a full detection is run on the next frame if the landmarks' box grows or shrinks by more than
+                  this fraction between two frames, which happens when the predictor loses the face
+detection_scale - the scale frames are resized to before running the face detector, or 'auto' to use the smallest
+                  scale that still finds faces of min_face_size pixels
+upsample - the number of times the face detector upsamples the resized frame
+min_face_size - the smallest face (in full resolution pixels) that has to be found when detection_scale is 'auto'
+'''
+class FaceTracker():
+    def __init__(self, detector, predictor, redetect_interval=10, use_correlation_tracker=False,
+                 min_track_quality=7.0, max_size_change=0.5, detection_scale=1.0, upsample=1, min_face_size=MIN_FACE_SIZE):
+        self.detector = detector
+        self.predictor = predictor
+        self.redetect_interval = redetect_interval
+        self.use_correlation_tracker = use_correlation_tracker
+        self.min_track_quality = min_track_quality
+        self.max_size_change = max_size_change
+        if detection_scale == 'auto':
+            detection_scale, upsample = auto_detection_scale(min_face_size)
+        self.detection_scale = detection_scale
+        self.upsample = upsample
+
+        self.faces = []
+        self.frames_since_detection = 0
+        self.redetect = True
+        self.frames = 0
+        self.detections = 0
+        self.lost = 0
+        self.timings = {'detect': 0.0, 'landmark': 0.0}
+
+    '''
+    detect()
+
+    Runs the full face detector and starts tracking every face it finds.
+    '''
+    def detect(self, gray):
+        self.faces = []
+        start = perf_counter()
+        rects = detect_faces(self.detector, gray, self.detection_scale, self.upsample)
+        self.timings['detect'] += perf_counter() - start
+
+        start = perf_counter()
+        shapes = predict_landmarks(self.predictor, [gray], [rects])[0]
+        self.timings['landmark'] += perf_counter() - start
+
+        for rect, shape in zip(rects, shapes):
+            face = TrackedFace(rect, shape)
+            if self.use_correlation_tracker:
+                face.tracker = dlib.correlation_tracker()
+                face.tracker.start_track(gray, rect)
+            self.faces.append(face)
+        self.detections += 1
+        self.frames_since_detection = 0
+
+        # Keep trying to detect while there are no faces to track
+        self.redetect = not self.faces
+
+    '''
+    follow()
+
+    Runs the landmark predictor again for every tracked face inside the box carried forward from the last frame.
+    '''
+    def follow(self, gray):
+        for face in self.faces:
+            start = perf_counter()
+            if face.tracker is not None:
+                quality = face.tracker.update(gray)
+                position = face.tracker.get_position()
+                rect = dlib.rectangle(int(round(position.left())), int(round(position.top())),
+                                      int(round(position.right())), int(round(position.bottom())))
+                if quality < self.min_track_quality:
+                    self.redetect = True
+            else:
+                rect = face.carried_rect()
+
+            face.rect = rect
+            face.shape = shape_to_np(self.predictor(gray, rect))
+            self.timings['landmark'] += perf_counter() - start
+
+            # A sudden change in the size of the landmarks means the predictor is no longer on a face
+            left, top, right, bottom = landmark_box(face.shape)
+            size = max(right - left, 1) * max(bottom - top, 1)
+            if abs(size - face.size) > self.max_size_change * face.size:
+                self.redetect = True
+            face.size = size
+
+        self.frames_since_detection += 1
+        self.lost += self.redetect
+
+    '''
+    track()
+
+    Finds the faces in the next frame of the stream.
+
+    gray - the grayscale frame
+
+    Returns a list of (rect, shape) tuples, one for every face.
+    '''
+    def track(self, gray):
+        self.frames += 1
+        if self.redetect or self.frames_since_detection + 1 >= self.redetect_interval:
+            self.detect(gray)
+        else:
+            self.follow(gray)
+        return [(face.rect, face.shape) for face in self.faces]
+
+    '''
+    detect_batch()
+
+    Finds the faces in a chunk of unrelated frames (ie: a folder of images), running the landmark predictor for the
+    faces of every frame in one go.  Nothing is tracked from one frame to the next.
+
+    grays - the grayscale frames
+
+    Returns a list of (rect, shape) tuples for every frame.
+    '''
+    def detect_batch(self, grays):
+        start = perf_counter()
+        rects = [detect_faces(self.detector, gray, self.detection_scale, self.upsample) for gray in grays]
+        self.timings['detect'] += perf_counter() - start
+
+        start = perf_counter()
+        shapes = predict_landmarks(self.predictor, grays, rects)
+        self.timings['landmark'] += perf_counter() - start
+
+        self.frames += len(grays)
+        self.detections += len(grays)
+        self.faces = []
+        self.redetect = True
+        return [list(zip(frame_rects, frame_shapes)) for frame_rects, frame_shapes in zip(rects, shapes)]
+
+    '''
+    redetection_rate()
+
+    Returns the fraction of frames that ran the full face detector.
+    '''
+    def redetection_rate(self):
+        return self.detections / self.frames if self.frames else 0.0
+
+    '''
+    report()
+
+    Prints how often the full face detector had to be run.
+    '''
+    def report(self, elapsed=None):
+        if self.frames == 0:
+            return
+        print(f"Tracked {self.frames} frames:  {self.detections} full detections "
+              f"({self.redetection_rate() * 100:.1f}% of frames, {self.lost} early because the faces were lost)")
+        if elapsed:
+            print(f"Achieved {self.frames / elapsed:.1f} fps")
@@ -0,0 +1,174 @@
+'''
+frame_sources.py
+
+This python script contains the frame sources the eye tracking engine (eye_engine.py) can read from.
+
+Every source is iterable and yields (name, img) tuples, where img is a BGR image like cv2.imread() returns:
+- VideoSource:  A webcam (given by its index) or a video file.  Frames are named by their index.
+- ImageDirectorySource:  The images in a folder.  Frames are named after their file without the extension.
+- ArraySource:  Images that are already in memory.
+- FrameBusSource:  The frames the camera publishes on a shared memory frame bus (see frame_bus.py in the Camera
+  Software folder).  Frames are named by their sequence number.
+
+open_source() picks the right source for a webcam index, a path, a frame bus ('bus:name') or a list of arrays.
+'''
+
+import cv2         # For reading images and videos
+import os          # For working with paths
+import sys         # For finding the frame bus
+
+# Where frame_bus.py is found when the Camera Software folder is not on the python path
+CAMERA_SOFTWARE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Camera Software')
+
+# Sources starting with this are read from the frame bus of that name
+FRAME_BUS_PREFIX = 'bus:'
+
+# The image types read from a folder
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+'''
+VideoSource
+
+Reads the frames of a webcam or a video file.
+
+source - the webcam index or the path of a video file
+'''
+class VideoSource():
+    def __init__(self, source=0):
+        self.source = source
+        self.live = isinstance(source, int)
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open the video source {source}")
+
+        # Webcams deliver frames at their own pace, video files are played back at this rate
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            ret, img = self.capture.read()
+            if not ret:
+                return
+            yield str(index), img
+            index += 1
+
+    def close(self):
+        self.capture.release()
+
+'''
+ImageDirectorySource
+
+Reads the images in a folder in sorted order.
+
+directory - the folder to read
+names - the images to read (without the extension), every image in the folder is read if this is not given
+'''
+class ImageDirectorySource():
+    live = False
+    fps = 0.0
+
+    def __init__(self, directory, names=None):
+        self.directory = directory
+        if names is None:
+            self.files = sorted(file for file in os.listdir(directory) if file.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            self.files = [name + '.jpg' for name in names]
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        for file in self.files:
+            yield os.path.splitext(file)[0], cv2.imread(os.path.join(self.directory, file))
+
+    def close(self):
+        pass
+
+'''
+ArraySource
+
+Serves images that are already in memory.  The arrays are drawn on by the eye tracker, pass copies if the originals
+have to be kept clean.
+
+arrays - the BGR images
+names - the name of every image, they are named by their index if this is not given
+'''
+class ArraySource():
+    live = False
+    fps = 0.0
+
+    def __init__(self, arrays, names=None):
+        self.arrays = arrays
+        self.names = names if names is not None else [str(index) for index in range(len(arrays))]
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def __iter__(self):
+        return iter(zip(self.names, self.arrays))
+
+    def close(self):
+        pass
+
+'''
+FrameBusSource
+
+Reads the newest frame from a shared memory frame bus until the publisher closes it.  Frames the tracker did not get
+to in time are skipped, like a webcam's would be.  The frame is only copied once, when it is converted to BGR, and
+frames the publisher overwrote during the conversion are skipped.
+
+name - the name of the frame bus
+rgb - whether the published frames are RGB (the camera backends publish RGB frames) rather than BGR
+'''
+class FrameBusSource():
+    live = True
+    fps = 0.0
+
+    def __init__(self, name, rgb=True):
+        try:
+            from frame_bus import FrameBus
+        except ImportError:
+            sys.path.append(CAMERA_SOFTWARE_PATH)
+            from frame_bus import FrameBus
+        self.bus = FrameBus(name)
+        self.rgb = rgb
+        self.skipped = 0
+
+    def __iter__(self):
+        sequence = 0
+        while True:
+            frame = self.bus.read(sequence)
+            if frame is None:
+                return
+            sequence, _, _, view = frame
+            if view.ndim == 2:
+                img = cv2.cvtColor(view, cv2.COLOR_GRAY2BGR)
+            elif self.rgb:
+                img = cv2.cvtColor(view, cv2.COLOR_RGBA2BGR if view.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+            else:
+                img = cv2.cvtColor(view, cv2.COLOR_BGRA2BGR) if view.shape[2] == 4 else view.copy()
+            if not self.bus.valid(sequence):
+                self.skipped += 1
+                continue
+            yield str(sequence), img
+
+    def close(self):
+        self.bus.close()
+
+'''
+open_source()
+
+Returns the frame source for a webcam index (an int or a string of digits), a folder of images, a video file, a frame
+bus ('bus:name') or a list of arrays.
+'''
+def open_source(source):
+    if isinstance(source, (list, tuple)):
+        return ArraySource(source)
+    if isinstance(source, str) and source.startswith(FRAME_BUS_PREFIX):
+        return FrameBusSource(source[len(FRAME_BUS_PREFIX):])
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageDirectorySource(source)
+    return VideoSource(source)
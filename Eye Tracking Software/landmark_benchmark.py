@@ -0,0 +1,101 @@
+'''
+landmark_benchmark.py
+
+This python script checks and benchmarks the landmark extraction on the images in eye_tracker.py's INPUT_LOCATION.
+
+The faces of every image are found once.  The landmarks are then extracted three ways:
+- reference:  The predictor is run face by face and the landmarks are copied out with 136 part(i) calls per face, the
+  way shape_to_np() used to work.
+- vectorized:  The predictor is run face by face and converted with the current shape_to_np().
+- batched:  predict_landmarks() runs the predictor for every face of a chunk of images and converts them at once.
+
+Both fast paths have to match the reference exactly.  The time spent per face is reported for the conversion alone
+and for the prediction plus conversion.
+
+    python landmark_benchmark.py [chunk_size]
+'''
+
+import cv2          # For image processing
+import dlib         # For loading the face detector and landmark predictor
+import eye_tracker  # For the model and input locations
+import numpy as np  # For comparing the landmarks
+import sys          # For argument loading
+from face_tracking import detect_faces, predict_landmarks, shape_to_np
+from time import perf_counter
+
+# How many times the conversion alone is repeated to get a stable measurement
+CONVERSION_REPEATS = 20
+
+'''
+reference_shape_to_np()
+
+The original landmark by landmark conversion, kept as the reference the fast paths are checked against.
+'''
+def reference_shape_to_np(shape, dtype="int"):
+    coords = np.zeros((68, 2), dtype=dtype)
+    for i in range(0, 68):
+        coords[i] = (shape.part(i).x, shape.part(i).y)
+    return coords
+
+'''
+time_per_face()
+
+Returns the microseconds per face spent calling function repeats times.
+'''
+def time_per_face(function, faces, repeats=1):
+    start = perf_counter()
+    for _ in range(repeats):
+        function()
+    return (perf_counter() - start) * 1e6 / (faces * repeats)
+
+'''
+main()
+
+Driver function for the benchmark.
+'''
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else eye_tracker.BATCH_CHUNK_SIZE
+    input_file_names = eye_tracker.list_input_files()
+    if (len(input_file_names) == 0):
+        print("Error!  There are no .jpg images in \"" + eye_tracker.INPUT_LOCATION + "\" to benchmark with!")
+        return
+
+    detector = dlib.get_frontal_face_detector()
+    predictor = dlib.shape_predictor(eye_tracker.MODEL_PATH)
+    grays = [cv2.cvtColor(cv2.imread(f"{eye_tracker.INPUT_LOCATION}/{name}.jpg"), cv2.COLOR_BGR2GRAY) for name in input_file_names]
+    rects = [detect_faces(detector, gray) for gray in grays]
+    faces = sum(len(frame_rects) for frame_rects in rects)
+    if (faces == 0):
+        print("Error!  No faces were found to benchmark with!")
+        return
+    print(f"Benchmarking the landmarks of {faces} faces in {len(grays)} images...")
+
+    # Run the predictor once so the conversions can be timed on their own
+    detections = [predictor(gray, rect) for gray, frame_rects in zip(grays, rects) for rect in frame_rects]
+    reference = [reference_shape_to_np(detection) for detection in detections]
+
+    # The fast paths have to produce exactly the same landmarks
+    vectorized = [shape_to_np(detection) for detection in detections]
+    batched = []
+    for start in range(0, len(grays), chunk_size):
+        for frame_shapes in predict_landmarks(predictor, grays[start:start + chunk_size], rects[start:start + chunk_size]):
+            batched.extend(frame_shapes)
+    for name, shapes in (('vectorized', vectorized), ('batched', batched)):
+        matches = all(shape.dtype == expected.dtype and np.array_equal(shape, expected) for shape, expected in zip(shapes, reference))
+        print(f"{name:<10} {'matches' if matches and len(shapes) == len(reference) else 'DOES NOT MATCH'} the reference")
+
+    print(f"Conversion only:")
+    print(f"  reference  {time_per_face(lambda: [reference_shape_to_np(d) for d in detections], faces, CONVERSION_REPEATS):8.1f} us/face")
+    print(f"  vectorized {time_per_face(lambda: [shape_to_np(d) for d in detections], faces, CONVERSION_REPEATS):8.1f} us/face")
+
+    def predict_chunks():
+        for start in range(0, len(grays), chunk_size):
+            predict_landmarks(predictor, grays[start:start + chunk_size], rects[start:start + chunk_size])
+
+    print(f"Prediction and conversion:")
+    print(f"  reference  {time_per_face(lambda: [reference_shape_to_np(predictor(g, r)) for g, fr in zip(grays, rects) for r in fr], faces):8.1f} us/face")
+    print(f"  vectorized {time_per_face(lambda: [shape_to_np(predictor(g, r)) for g, fr in zip(grays, rects) for r in fr], faces):8.1f} us/face")
+    print(f"  batched    {time_per_face(predict_chunks, faces):8.1f} us/face (chunks of {chunk_size} images)")
+
+if __name__ == "__main__":
+    main()
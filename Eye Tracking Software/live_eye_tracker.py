@@ -8,77 +8,62 @@ The original code was written by Vardan Argwal and was adapted for ECE5960/ECE69
 Model files can be downloaded from:  https://github.com/davisking/dlib-models
 You should use either one of the 68 face landmarks files, but the model68_GTX.dat seems to work best.
 
+A video file or a folder of images can be given instead of the webcam to test the tracker
+(ie: python live_eye_tracker.py recording.mp4), and the frames the camera publishes on a frame bus can be tracked
+without going through the disk (ie: python live_eye_tracker.py bus:transparent_camera_frames).
+
 Authors: Vardan Argwal, Kenneth Gordon, Khoi Nguyen, and Thomas Warren
 Date: March 18, 2024
 Source:  https://towardsdatascience.com/real-time-eye-tracking-using-opencv-and-dlib-b504ca724ac6
 '''
 
 import cv2         # For image processing
-import dlib        # For loading the face recognition model
-import numpy as np # For general purpose number work
+import sys         # For argument loading
+from eye_engine import THRESHOLD, EyeTracker # The eye tracking engine shared with eye_tracker.py
+from frame_sources import open_source # For reading the webcam, a video file or a folder of images
+from live_pipeline import FrameGrabber, LatencyStats, Processor # For grabbing, processing and showing frames on separate threads
+from time import perf_counter # For measuring the frame rate
 
 # Controls whether or not eye outlines are shown on the image
 ENABLE_EYE_OUTLINES = True
 
+# Controls whether the image and threshold windows are shown, turn this off to benchmark with a video file
+ENABLE_DISPLAY = True
+
+# The webcam index to read from when no video file is given
+VIDEO_SOURCE = 0
+
+# Controls whether video files are played back at their own frame rate like a webcam, or as fast as they decode
+REALTIME_VIDEO = True
+
 # The location of the model file
 MODEL_PATH = r"insert_the_path_to_your_model_here"
 
-'''
-shape_to_np()
+# Controls whether faces are tracked between detections instead of running the face detector on every frame
+ENABLE_TRACKING = True
 
-Converts a shape predictor into a set of (x, y) coordinates
+# The face detector is run at least once every this many frames while tracking
+REDETECT_INTERVAL = 10
 
-shape - the shape predictor
-dtype - the type of input data
-'''
-def shape_to_np(shape, dtype="int"):
-	# Initialize the list of (x, y)-coordinates
-	coords = np.zeros((68, 2), dtype=dtype)
-     
-	# Loop over the 68 facial landmarks in the model and convert them to a 2-tuple of (x, y)-coordinates
-	for i in range(0, 68):
-		coords[i] = (shape.part(i).x, shape.part(i).y)
-          
-	# Return the list of (x, y)-coordinates
-	return coords
+# Controls whether faces are followed with dlib's correlation tracker between detections instead of the box around
+# the previous frame's landmarks
+USE_CORRELATION_TRACKER = False
 
-'''
-eye_on_mask()
+# The scale webcam frames are downscaled to before looking for faces, or 'auto' (see eye_tracker.py's DETECTION_SCALE)
+DETECTION_SCALE = 1.0
 
-Finds an eye (left or right depending on side) on the given mask.
+# The smallest face (in webcam pixels) that has to be found when DETECTION_SCALE is 'auto'
+MIN_FACE_SIZE = 120
 
-shape - the shape predictor
-mask - the image mask
-side - the side of the face to detect the eye from
-'''
-def eye_on_mask(shape, mask, side):
-    points = [shape[i] for i in side]
-    points = np.array(points, dtype=np.int32)
-    mask = cv2.fillConvexPoly(mask, points, 255)
-    return mask
+# How many times the face detector upsamples the (downscaled) frame
+DETECTION_UPSAMPLE = 1
 
-'''
-contouring()
+# The size of the kernel the eye mask is expanded with before thresholding, or 0 to not expand it
+DILATION_SIZE = 9
 
-Utilizing contouring, this function draws red circles in the center of detected eyeballs.
-
-threshold - the calculated image threshold
-mid - the midpoint between the eys
-img - the image to draw to
-right - whether or not the contour is on the right side of the face
-'''
-def contouring(threshold, mid, img, right=False):
-    cnts, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    try:
-        cnt = max(cnts, key = cv2.contourArea)
-        M = cv2.moments(cnt)
-        cx = int(M['m10']/M['m00'])
-        cy = int(M['m01']/M['m00'])
-        if right:
-            cx += mid
-        cv2.circle(img, (cx, cy), 4, (0, 255, 0), 2)
-    except:
-        pass
+# The face detector backend, 'hog', 'haar' or 'dnn', and its options (see face_detectors.py)
+DETECTOR_BACKEND = 'hog'
+DETECTOR_OPTIONS = {}
 
 '''
 main()
@@ -86,82 +71,74 @@ main()
 Driver function for the live eye tracker
 '''
 def main():
-    # Initialize the face detector and predictor model from dlib
-    detector = dlib.get_frontal_face_detector()
-    predictor = dlib.shape_predictor(MODEL_PATH)
-
-    # These coordinates correspond to the eye coordinates given by the predictor model.
-    left_eye = [36, 37, 38, 39, 40, 41]
-    right_eye = [42, 43, 44, 45, 46, 47]
+    # Initialize the eye tracking engine
+    tracker = EyeTracker(MODEL_PATH, THRESHOLD, DETECTION_SCALE, DETECTION_UPSAMPLE, DILATION_SIZE, ENABLE_EYE_OUTLINES,
+                         REDETECT_INTERVAL if ENABLE_TRACKING else 1, USE_CORRELATION_TRACKER, DETECTOR_BACKEND, DETECTOR_OPTIONS,
+                         MIN_FACE_SIZE)
 
-    # Get video from the webcam
+    # Get video from the webcam, or from a video file or folder of images if one is given
     # Should this be changed to take a raw image input instead of a webcam stream for the transparent camera
-    webcam_capture = cv2.VideoCapture(0)
-    ret, img = webcam_capture.read()
-    threshold = img.copy()
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else VIDEO_SOURCE)
+    grabber = FrameGrabber(source, REALTIME_VIDEO)
 
     # Create a window to display the threshold on
-    cv2.namedWindow("Eye Tracker: Threshold")
-    kernel = np.ones((9, 9), np.uint8)
+    if (ENABLE_DISPLAY):
+        cv2.namedWindow("Eye Tracker: Threshold")
+
+        # Put a slider for the user to customize their threshold level
+        cv2.createTrackbar("Threshold", "Eye Tracker: Threshold", 0, 255, lambda arg: None)
 
-    # Put a slider for the user to customize their threshold level
-    cv2.createTrackbar("Threshold", "Eye Tracker: Threshold", 0, 255, lambda arg: None)
+    # Runs on the processing thread for the newest grabbed frame
+    def process(img):
+        faces = tracker.track(img)
+        return img, faces[-1].threshold if faces else None
 
+    processor = Processor(grabber.frames, process)
+    latency = LatencyStats()
+    grabber.start()
+    processor.start()
+
+    start = perf_counter()
+    sequence = 0
     while(True):
-        # Read from the webcam (ret needs to be there even though it isn't used)
-        ret, img = webcam_capture.read()
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        rects = detector(gray, 1)
-        for rect in rects:
-            shape = predictor(gray, rect)
-            shape = shape_to_np(shape)
-
-            # Create the eye mask
-            mask = np.zeros(img.shape[:2], dtype=np.uint8)
-            mask = eye_on_mask(shape, mask, left_eye)
-            mask = eye_on_mask(shape, mask, right_eye)
-
-            # Expand the eyes in the mask
-            mask = cv2.dilate(mask, kernel, 5)
-
-            # Segment out the eyes in the mask
-            eyes = cv2.bitwise_and(img, img, mask=mask)
-            mask = (eyes == [0, 0, 0]).all(axis=2)
-            eyes[mask] = [255, 255, 255]
-            mid = (shape[42][0] + shape[39][0]) // 2
-            eyes_gray = cv2.cvtColor(eyes, cv2.COLOR_BGR2GRAY)
-
-            # Thresholding is used to create the binary nature of the mask
-            # Change the threshold value depending on the value of the slider
-            threshold = cv2.getTrackbarPos("Threshold", "Eye Tracker: Threshold")
-            _, threshold = cv2.threshold(eyes_gray, threshold, 255, cv2.THRESH_BINARY)
-            # threshold = cv2.erode(threshold, None, iterations=2)
-            # threshold = cv2.dilate(threshold, None, iterations=4)
-            # threshold = cv2.medianBlur(threshold, 3)
-
-            # Invert the threshold so that contouring works as intended
-            threshold = cv2.bitwise_not(threshold)
-
-            # Draw red circles in the center of the detected eyes
-            contouring(threshold[:, 0:mid], mid, img)
-            contouring(threshold[:, mid:], mid, img, True)
-
-            # Display detected eye outlines if enabled
-            if (ENABLE_EYE_OUTLINES):
-                for (x, y) in shape[36:48]:
-                    cv2.circle(img, (x, y), 2, (255, 255, 0), -1)
-        
-        # Show the true image with eye detections and facial landmarks
-        cv2.imshow("Eye Tracker: Image", img)
-        cv2.imshow("Eye Tracker: Threshold", threshold)
+        # Change the threshold value depending on the value of the slider
+        if (ENABLE_DISPLAY):
+            tracker.threshold = cv2.getTrackbarPos("Threshold", "Eye Tracker: Threshold")
+
+        # Wait for the newest processed frame, stopping once a video file has been played through
+        sequence, result = processor.results.get(sequence, 0.1)
+        if result is None and not processor.is_alive():
+            break
+
+        key = -1
+        if result is not None:
+            (img, threshold), grabbed_at, started_at = result
+
+            # Show the true image with eye detections and facial landmarks
+            if (ENABLE_DISPLAY):
+                cv2.imshow("Eye Tracker: Image", img)
+                if threshold is not None:
+                    cv2.imshow("Eye Tracker: Threshold", threshold)
+                key = cv2.waitKey(1)
+            latency.add(grabbed_at, started_at, perf_counter())
+        elif (ENABLE_DISPLAY):
+            key = cv2.waitKey(1)
 
         # Quit the loop by pressing 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if key & 0xFF == ord('q'):
             break
-        
+    elapsed = perf_counter() - start
+
     # Release acquired resources
-    webcam_capture.release()
-    cv2.destroyAllWindows()
+    grabber.stop()
+    processor.stop()
+    if (ENABLE_DISPLAY):
+        cv2.destroyAllWindows()
+
+    # Report the frame rate, how often the face detector had to be run and the latency of the shown frames
+    tracker.face_tracker.report(elapsed)
+    print(f"Grabbed {grabber.grabbed} frames, processed {processor.processed} and showed {len(latency.ages)}")
+    print(latency.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,190 @@
+'''
+live_pipeline.py
+
+This python script contains the threaded capture pipeline used by live_eye_tracker.py.
+
+Reading the webcam, running the eye tracker and showing the windows used to happen one after the other, so frames
+queued up inside the webcam driver while a frame was being processed and the tracker fell further and further behind.
+The pipeline splits the work over three threads:
+- A grabber thread reads the source as fast as it delivers frames and only keeps the newest one.
+- A processing thread always works on the newest frame, skipping any it did not get to in time.
+- The main thread shows the results (OpenCV windows have to be used from the main thread).
+
+Every frame is stamped when it is grabbed, so the age of a frame when processing starts and the end-to-end latency
+until it is shown can be reported.  Any frame source (see frame_sources.py) can be grabbed from, so a video file can
+be used to test the pipeline without a webcam.
+'''
+
+import numpy as np # For the latency percentiles
+import threading   # For the pipeline threads
+from time import perf_counter, sleep
+
+'''
+LatestSlot
+
+Holds only the newest item put into it.  Older items that were never taken are dropped.
+'''
+class LatestSlot():
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.sequence = 0
+        self.closed = False
+
+    '''
+    put()
+
+    Replaces the held item with a newer one.
+    '''
+    def put(self, item):
+        with self.condition:
+            self.item = item
+            self.sequence += 1
+            self.condition.notify_all()
+
+    '''
+    get()
+
+    Waits for an item newer than last_sequence.
+
+    Returns the sequence number and the item, or (last_sequence, None) once the slot is closed or the timeout passes.
+    '''
+    def get(self, last_sequence=0, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > last_sequence or self.closed, timeout)
+            if self.sequence > last_sequence:
+                return self.sequence, self.item
+            return last_sequence, None
+
+    '''
+    close()
+
+    Wakes up everyone waiting on the slot, no more items will be put into it.
+    '''
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+'''
+FrameGrabber
+
+Reads frames from a frame source on its own thread and keeps only the newest one.
+
+source - the frame source to read from (see frame_sources.py)
+realtime - whether video files are read at their own frame rate like a webcam would deliver them, instead of as
+           fast as they can be decoded
+'''
+class FrameGrabber(threading.Thread):
+    def __init__(self, source, realtime=True):
+        threading.Thread.__init__(self, daemon=True)
+        self.source = source
+        self.frames = LatestSlot()
+        self.grabbed = 0
+        self.running = True
+
+        self.frame_period = 0.0
+        if realtime and not source.live and source.fps > 0:
+            self.frame_period = 1.0 / source.fps
+
+    def run(self):
+        next_frame = perf_counter()
+        for _, img in self.source:
+            if not self.running:
+                break
+            # Stamp the frame as soon as it is read
+            self.frames.put((img, perf_counter()))
+            self.grabbed += 1
+
+            if self.frame_period:
+                next_frame += self.frame_period
+                sleep(max(0.0, next_frame - perf_counter()))
+        self.frames.close()
+
+    '''
+    stop()
+
+    Stops reading and releases the source.
+    '''
+    def stop(self):
+        self.running = False
+        self.join()
+        self.source.close()
+
+'''
+LatencyStats
+
+Collects the frame age and end-to-end latency of every shown frame.
+'''
+class LatencyStats():
+    PERCENTILES = [50, 90, 99]
+
+    def __init__(self):
+        self.ages = []
+        self.latencies = []
+
+    '''
+    add()
+
+    Records one frame.
+
+    grabbed_at - when the frame was read from the source
+    started_at - when the processing thread started working on the frame
+    shown_at - when the result was shown
+    '''
+    def add(self, grabbed_at, started_at, shown_at):
+        self.ages.append(started_at - grabbed_at)
+        self.latencies.append(shown_at - grabbed_at)
+
+    '''
+    report()
+
+    Returns the percentiles of the frame age and end-to-end latency in milliseconds.
+    '''
+    def report(self):
+        if not self.ages:
+            return "No frames were shown"
+        lines = [f"Latency of {len(self.ages)} frames (" + ', '.join(f"p{p}" for p in self.PERCENTILES) + "):"]
+        for name, values in (("frame age", self.ages), ("end-to-end", self.latencies)):
+            percentiles = np.percentile(np.array(values) * 1000, self.PERCENTILES)
+            lines.append(f"  {name:<10} " + ', '.join(f"{value:7.1f} ms" for value in percentiles))
+        return '\n'.join(lines)
+
+'''
+Processor
+
+Runs a processing function on the newest grabbed frame on its own thread.
+
+frames - the LatestSlot the grabber puts frames into
+process - called with every frame, its return value is put into results along with the frame's timestamps
+'''
+class Processor(threading.Thread):
+    def __init__(self, frames, process):
+        threading.Thread.__init__(self, daemon=True)
+        self.frames = frames
+        self.process = process
+        self.results = LatestSlot()
+        self.processed = 0
+        self.running = True
+
+    def run(self):
+        sequence = 0
+        while self.running:
+            sequence, item = self.frames.get(sequence)
+            if item is None:
+                break
+            img, grabbed_at = item
+            started_at = perf_counter()
+            self.results.put((self.process(img), grabbed_at, started_at))
+            self.processed += 1
+        self.results.close()
+
+    '''
+    stop()
+
+    Stops processing once the current frame is done.
+    '''
+    def stop(self):
+        self.running = False
+        self.frames.close()
+        self.join()
@@ -5,11 +5,15 @@ This python script takes images stored within a specified folder and converts th
 
 It is highly customizable and allows the user to change settings as needed.
 
+The gif is streamed to disk one frame at a time, so only a single frame is held in memory no matter how many frames
+there are.  Every frame is quantized with one palette that is computed up front from a sample of the frames, and
+frames can be shrunk while they are decoded (JPEGs are decoded straight at a reduced resolution).
+
 Author:  Kenneth Gordon
 Date:  March 18, 2024
 '''
 
-from PIL import Image
+from PIL import Image, GifImagePlugin
 from natsort import natsorted # Used to sort the png files in order after they are fetched by glob
 import glob
 
@@ -19,6 +23,80 @@ frame_file_type = ".EXTENSION"
 gif_location = "put_your_directory_here"
 gif_name = "put_your_name_here"
 gif_duration = 200
+gif_size = None # the (width, height) the frames are shrunk to fit in, or None to keep their size
+palette_sample_frames = 8 # the number of frames, spread over the gif, the shared palette is computed from
+
+# The size every sampled frame is shrunk to fit in before the palette is computed
+PALETTE_SAMPLE_SIZE = (256, 256)
+
+'''
+load_frame()
+
+Opens a frame as an RGB image, shrinking it to fit in size while it is decoded if a size is given.
+'''
+def load_frame(image_path, size=None):
+    image = Image.open(image_path)
+    if size is not None:
+        # draft() only decodes JPEGs at the smallest scale that is still at least size, other formats are unaffected
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        return image
+    return image.convert("RGB")
+
+'''
+read_frames()
+
+Lazily yields the frames, all at the size of the first frame.
+'''
+def read_frames(image_paths, size=None):
+    frame_size = None
+    for image_path in image_paths:
+        frame = load_frame(image_path, size)
+        if frame_size is None:
+            frame_size = frame.size
+        elif frame.size != frame_size:
+            frame = frame.resize(frame_size, Image.LANCZOS)
+        yield frame
+
+'''
+shared_palette()
+
+Returns a palette image computed from a sample of the frames spread evenly over the gif.
+'''
+def shared_palette(image_paths, sample_frames=palette_sample_frames):
+    step = max(1, len(image_paths) // sample_frames)
+    samples = [load_frame(image_path, PALETTE_SAMPLE_SIZE) for image_path in image_paths[::step][:sample_frames]]
+
+    # Quantize a single image holding every sample so the palette covers all of them
+    width = max(sample.width for sample in samples)
+    mosaic = Image.new("RGB", (width, sum(sample.height for sample in samples)))
+    top = 0
+    for sample in samples:
+        mosaic.paste(sample, (0, top))
+        top += sample.height
+    return mosaic.quantize(256, method=Image.Quantize.MEDIANCUT)
+
+'''
+write_gif()
+
+Streams the frames into a looping gif, quantizing every frame with the palette.
+
+Returns the number of frames written.
+'''
+def write_gif(gif_path, frames, palette, duration=gif_duration):
+    written = 0
+    with open(gif_path, "wb") as gif_file:
+        for frame in frames:
+            frame = frame.quantize(palette=palette)
+            if written == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0, "optimize": False})
+                gif_file.write(b"".join(header))
+            for data in GifImagePlugin.getdata(frame, duration=duration):
+                gif_file.write(data)
+            written += 1
+        gif_file.write(b";")
+    return written
 
 '''
 make_gif()
@@ -26,18 +104,21 @@ make_gif()
 Creates a gif from the images contained in the frame folder.
 '''
 def make_gif():
-    # Create an array of the frames from the frame folder.
-    # Sort them so that frames appear in the correct order in the gif.
-    frames = [Image.open(image) for image in natsorted(glob.glob(f"{frame_folder}/*{frame_file_type}"))]
-
-    # Get the first frame and create a gif from it.
-    frame_one = frames[0]
-    frame_one.save(f"{gif_location}/{gif_name}.gif", format="GIF", append_images=frames, save_all=True, duration=gif_duration, loop=0)
-    
+    # Sort the frames so that they appear in the correct order in the gif.
+    image_paths = natsorted(glob.glob(f"{frame_folder}/*{frame_file_type}"))
+    if not image_paths:
+        print(f"There are no {frame_file_type} images in \"{frame_folder}\"!")
+        return False
+
+    # Stream the frames into the gif one at a time
+    palette = shared_palette(image_paths)
+    written = write_gif(f"{gif_location}/{gif_name}.gif", read_frames(image_paths, gif_size), palette)
+    print(f"Wrote {written} frames to {gif_location}/{gif_name}.gif")
+
     # If there are no issues, return true to let the user know a gif was successfully made
     return True
 
 if __name__ == "__main__":
     print("Making Gif...")
     if (make_gif()):
-        print("Done!")
\ No newline at end of file
+        print("Done!")
@@ -5,11 +5,20 @@ This python script takes a directory of images and resizes them to a desired siz
 
 It is customizable and allows the user to change settings as needed.
 
+The images are resized on a pool of worker processes.  When the desired size is at most half of an image's size, the
+JPEG is decoded at a reduced resolution (1/2, 1/4 or 1/8) straight away, so the full resolution image never has to be
+decoded, and the rest of the way is scaled with INTER_AREA.  Images whose resized copy already exists at the desired
+size and is newer than the image are skipped, so the script can be re-run over a growing capture folder and only
+resizes the new images.
+
 Author:  Kenneth Gordon
 Date:  April 19, 2024
 '''
 
 # Necessary imports
+from functools import partial
+from multiprocessing import Pool
+from PIL import Image
 import cv2
 import os
 
@@ -18,22 +27,88 @@ input_image_directory = "put_your_directory_here"
 output_image_directory = "put_your_directory_here"
 x_resize = 1152
 y_resize = 648
+number_of_workers = os.cpu_count() # the number of processes resizing images at the same time
+image_extensions = (".jpg", ".jpeg")
+
+# The reduced decoding modes by how much they shrink the image, largest first
+REDUCED_READ_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
+'''
+image_size()
+
+Returns the (width, height) of an image by only reading its header, or None if it cannot be read.
+'''
+def image_size(image_path):
+    try:
+        with Image.open(image_path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+'''
+read_flag()
+
+Returns the cv2.imread() flag that decodes an image of the given size at the smallest resolution that is still at
+least x by y.
+'''
+def read_flag(size, x, y):
+    width, height = size
+    for factor, flag in REDUCED_READ_FLAGS:
+        if width // factor >= x and height // factor >= y:
+            return flag
+    return cv2.IMREAD_COLOR
+
+'''
+up_to_date()
+
+Returns True if the resized image already exists at the desired size and is newer than the input image.
+'''
+def up_to_date(input_path, output_path, x, y):
+    if not os.path.exists(output_path) or os.path.getmtime(output_path) < os.path.getmtime(input_path):
+        return False
+    return image_size(output_path) == (x, y)
 
 '''
 resize_image()
 
 Resizes the input image to the desired dimensions.
+
+Returns whether the image was 'resized', 'skipped' because it was up to date or 'failed' to be read.
+'''
+def resize_image(image_name, x, y, input_directory=None, output_directory=None):
+    input_path = f"{input_directory or input_image_directory}/{image_name}"
+    output_path = f"{output_directory or output_image_directory}/{image_name}"
+    if up_to_date(input_path, output_path, x, y):
+        return 'skipped'
+
+    size = image_size(input_path)
+    image = cv2.imread(input_path, read_flag(size, x, y) if size is not None else cv2.IMREAD_COLOR)
+    if image is None:
+        return 'failed'
+    if (image.shape[1], image.shape[0]) != (x, y):
+        image = cv2.resize(image, (x, y), interpolation=cv2.INTER_AREA)
+    cv2.imwrite(output_path, image)
+    return 'resized'
+
+'''
+resize_directory()
+
+Resizes every image in the input directory on a pool of worker processes and returns how many were resized, skipped
+and failed.
 '''
-def resize_image(image_name, x, y):
-    image = cv2.imread(f"{input_image_directory}/{image_name}")
-    resized_image = cv2.resize(image, (x, y), )
-    cv2.imwrite(f"{output_image_directory}/{image_name}", resized_image)
-    pass
+def resize_directory(input_directory, output_directory, x, y, workers=number_of_workers):
+    os.makedirs(output_directory, exist_ok=True)
+    image_names = sorted(image for image in os.listdir(input_directory) if image.lower().endswith(image_extensions))
+    counts = {'resized': 0, 'skipped': 0, 'failed': 0}
+    resize = partial(resize_image, x=x, y=y, input_directory=input_directory, output_directory=output_directory)
+    with Pool(max(1, workers)) as pool:
+        for image, result in zip(image_names, pool.imap(resize, image_names, chunksize=4)):
+            if result == 'failed':
+                print(f"Could not read {image}!")
+            counts[result] += 1
+    return counts
 
 if __name__ == "__main__":
-    print(f"Resizing images in \"{input_image_directory}\"")
-    for image in os.listdir(input_image_directory):
-        if (image.endswith(".jpg")):
-            print(f"Resizing {image}...")
-            resize_image(image, x_resize, y_resize)
-    print("Done!")
\ No newline at end of file
+    print(f"Resizing images in \"{input_image_directory}\" with {number_of_workers} workers")
+    counts = resize_directory(input_image_directory, output_image_directory, x_resize, y_resize)
+    print(f"Done!  Resized {counts['resized']} images, skipped {counts['skipped']} that were up to date and could not read {counts['failed']}")
@@ -1,6 +1,6 @@
 import os.path
-from data.base_dataset import BaseDataset, get_params, get_transform, normalize
-from data.image_folder import make_dataset
+from data.base_dataset import BaseDataset, get_params, get_transform, normalize, resize_for_cache, transform_cached
+from data.image_folder import make_dataset, make_paired_dataset
 from PIL import Image
 
 class AlignedDataset(BaseDataset):
@@ -19,6 +19,12 @@ class AlignedDataset(BaseDataset):
             self.dir_B = os.path.join(opt.dataroot, opt.phase + dir_B)  
             self.B_paths = sorted(make_dataset(self.dir_B))
 
+        ### explicit A/B pairs written by the camera's dataset exporter
+        manifest = os.path.join(opt.dataroot, opt.phase + '_manifest.csv')
+        if self.opt.label_nc == 0 and os.path.isfile(manifest):
+            print('----------- loading pairs from %s ----------' % manifest)
+            self.A_paths, self.B_paths = make_paired_dataset(manifest, opt.dataroot)
+
         ### instance maps
         if not opt.no_instance:
             self.dir_inst = os.path.join(opt.dataroot, opt.phase + '_inst')
@@ -30,12 +36,54 @@ class AlignedDataset(BaseDataset):
             print('----------- loading features from %s ----------' % self.dir_feat)
             self.feat_paths = sorted(make_dataset(self.dir_feat))
 
+        ### side camera rectification
+        self.rectifier = None
+        if getattr(opt, 'rectify_maps', '') and self.opt.label_nc == 0:
+            from data.rectify import SideRectifier
+            self.rectifier = SideRectifier(opt.rectify_maps)
+
+        ### uint8 cache of the resized images
+        self.cache = None
+        if getattr(opt, 'tensor_cache', False):
+            if self.opt.label_nc == 0 and opt.no_instance:
+                from data.tensor_cache import TensorCache, cache_options
+                sources = {'A': self.A_paths}
+                if opt.isTrain or opt.use_encoded_image:
+                    sources['B'] = self.B_paths
+                self.cache = TensorCache(os.path.join(opt.dataroot, opt.phase + '_cache'), sources, cache_options(opt), self.load_resized)
+            else:
+                print('--tensor_cache needs --label_nc 0 and --no_instance, loading the images from disk')
+
         self.dataset_size = len(self.A_paths) 
       
+    def load_resized(self, name, path):
+        # decodes and resizes an image the way __getitem__ does, used to fill the tensor cache
+        img = Image.open(path).convert('RGB')
+        if name == 'A' and self.rectifier is not None:
+            img = self.rectifier(img)
+        return img.size, resize_for_cache(self.opt, img)
+
+    def get_cached(self, index):
+        A, A_size = self.cache.get('A', index)
+        params = get_params(self.opt, A_size)
+        A_tensor = transform_cached(self.opt, params, A)
+
+        B_tensor = 0
+        if 'B' in self.cache:
+            B, _ = self.cache.get('B', index)
+            B_tensor = transform_cached(self.opt, params, B)
+
+        return {'label': A_tensor, 'inst': 0, 'image': B_tensor, 'feat': 0, 'path': self.A_paths[index]}
+
     def __getitem__(self, index):        
+        if self.cache is not None:
+            return self.get_cached(index)
+
         ### input A (label maps)
         A_path = self.A_paths[index]              
         A = Image.open(A_path)        
+        if self.rectifier is not None:
+            A = self.rectifier(A.convert('RGB'))
         params = get_params(self.opt, A.size)
         if self.opt.label_nc == 0:
             transform_A = get_transform(self.opt, params)
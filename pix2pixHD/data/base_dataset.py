@@ -3,6 +3,7 @@ from PIL import Image
 import torchvision.transforms as transforms
 import numpy as np
 import random
+import torch
 
 class BaseDataset(data.Dataset):
     def __init__(self):
@@ -57,6 +58,30 @@ def get_transform(opt, params, method=Image.BICUBIC, normalize=True):
                                                 (0.5, 0.5, 0.5))]
     return transforms.Compose(transform_list)
 
+def resize_for_cache(opt, img, method=Image.BICUBIC):
+    # the deterministic resize at the start of get_transform, applied once when the tensor cache is built
+    if 'resize' in opt.resize_or_crop:
+        return img.resize((opt.loadSize, opt.loadSize), method)
+    elif 'scale_width' in opt.resize_or_crop:
+        return __scale_width(img, opt.loadSize, method)
+    elif opt.resize_or_crop == 'none':
+        base = float(2 ** opt.n_downsample_global)
+        if opt.netG == 'local':
+            base *= (2 ** opt.n_local_enhancers)
+        return __make_power_2(img, base, method)
+    return img
+
+def transform_cached(opt, params, array, normalize=True):
+    # the rest of get_transform (crop, flip, ToTensor and Normalize) applied to a cached uint8 HxWx3 array
+    if 'crop' in opt.resize_or_crop:
+        array = __crop_array(array, params['crop_pos'], opt.fineSize)
+    if opt.isTrain and not opt.no_flip and params['flip']:
+        array = array[:, ::-1]
+    tensor = torch.from_numpy(np.ascontiguousarray(array.transpose(2, 0, 1))).float().div(255)
+    if normalize:
+        tensor = tensor.sub(0.5).div(0.5)
+    return tensor
+
 def normalize():    
     return transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
 
@@ -84,6 +109,19 @@ def __crop(img, pos, size):
         return img.crop((x1, y1, x1 + tw, y1 + th))
     return img
 
+def __crop_array(array, pos, size):
+    # matches __crop, which pads with black when the crop runs past the image
+    oh, ow = array.shape[:2]
+    x1, y1 = pos
+    if (ow > size or oh > size):
+        crop = array[y1:y1 + size, x1:x1 + size]
+        if crop.shape[:2] != (size, size):
+            padded = np.zeros((size, size) + array.shape[2:], dtype=array.dtype)
+            padded[:crop.shape[0], :crop.shape[1]] = crop
+            crop = padded
+        return crop
+    return array
+
 def __flip(img, flip):
     if flip:
         return img.transpose(Image.FLIP_LEFT_RIGHT)
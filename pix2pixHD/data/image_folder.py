@@ -7,6 +7,7 @@
 import torch.utils.data as data
 from PIL import Image
 import os
+import csv
 
 IMG_EXTENSIONS = [
     '.jpg', '.JPG', '.jpeg', '.JPEG',
@@ -31,6 +32,17 @@ def make_dataset(dir):
     return images
 
 
+def make_paired_dataset(manifest, root):
+    # reads the A/B pairs listed in a manifest written by the camera's dataset exporter
+    # paths in the manifest are relative to root
+    A_paths, B_paths = [], []
+    with open(manifest, newline='') as f:
+        for row in csv.DictReader(f):
+            A_paths.append(os.path.join(root, row['A']))
+            B_paths.append(os.path.join(root, row['B']))
+    return A_paths, B_paths
+
+
 def default_loader(path):
     return Image.open(path).convert('RGB')
 
@@ -0,0 +1,43 @@
+###############################################################################
+# Applies the side camera rectification computed by
+# Camera Software/rectification.py to the A (side camera) images.
+# The remap tables are built once per image size and reused for every image.
+###############################################################################
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def load_calibration(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def build_maps(calibration, side_size, output_size):
+    # rescale the calibration to the size of the images being loaded
+    calibrated_side = calibration['side_size'].astype(np.float64)
+    calibrated_front = calibration['front_size'].astype(np.float64)
+    side_scale = np.diag([side_size[0] / calibrated_side[0], side_size[1] / calibrated_side[1], 1.0])
+    output_scale = np.diag([output_size[0] / calibrated_front[0], output_size[1] / calibrated_front[1], 1.0])
+
+    # initUndistortRectifyMap inverts newCameraMatrix for every output pixel, so the homography goes in there
+    camera_matrix = side_scale @ calibration['camera_matrix']
+    homography = output_scale @ calibration['homography'] @ np.linalg.inv(side_scale)
+    return cv2.initUndistortRectifyMap(camera_matrix, calibration['dist_coeffs'], np.eye(3),
+                                       homography @ camera_matrix, tuple(int(v) for v in output_size), cv2.CV_16SC2)
+
+
+class SideRectifier():
+    def __init__(self, path):
+        self.calibration = load_calibration(path)
+        self.maps = {}
+
+    def __call__(self, img):
+        # img is an RGB PIL image, the rectified image keeps its width
+        width, height = img.size
+        if (width, height) not in self.maps:
+            front_width, front_height = self.calibration['front_size']
+            output_size = (width, int(round(width * front_height / front_width)))
+            self.maps[(width, height)] = build_maps(self.calibration, (width, height), output_size)
+        map1, map2 = self.maps[(width, height)]
+        return Image.fromarray(cv2.remap(np.asarray(img), map1, map2, cv2.INTER_LINEAR))
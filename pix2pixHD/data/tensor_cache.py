@@ -0,0 +1,108 @@
+###############################################################################
+# Caches the images of AlignedDataset as uint8 arrays in memory-mapped files
+# (--tensor_cache).  Every image is decoded and resized to loadSize once, so
+# later epochs only crop, flip and normalize a slice of the cache.
+# The cache is rebuilt whenever a source image or a resize option changes.
+###############################################################################
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def cache_options(opt):
+    # the options that change the cached images
+    options = {name: getattr(opt, name, None) for name in
+               ('loadSize', 'resize_or_crop', 'n_downsample_global', 'netG', 'n_local_enhancers')}
+    rectify_maps = getattr(opt, 'rectify_maps', '')
+    if rectify_maps:
+        stat = os.stat(rectify_maps)
+        options['rectify_maps'] = [os.path.abspath(rectify_maps), stat.st_size, stat.st_mtime_ns]
+    return options
+
+
+def cache_key(sources, options):
+    # changes whenever an image is added, removed, reordered or modified, or an option changes
+    digest = hashlib.sha1(json.dumps({'version': CACHE_VERSION, 'options': options}, sort_keys=True).encode())
+    for name in sorted(sources):
+        for path in sources[name]:
+            stat = os.stat(path)
+            digest.update(('%s\0%s\0%d\0%d\n' % (name, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+
+class TensorCache():
+    # sources maps a name ('A' or 'B') to its image paths, load(name, path) returns the
+    # (width, height) of the image before it was resized and the resized RGB PIL image
+    def __init__(self, cache_dir, sources, options, load):
+        self.cache_dir = cache_dir
+        self.names = sorted(sources)
+        self.key = cache_key(sources, options)
+        self.index_path = os.path.join(cache_dir, 'index.npz')
+        self.arrays = {}
+
+        if not self.load_index():
+            print('----------- building the tensor cache in %s ----------' % cache_dir)
+            self.build(sources, load)
+            self.load_index()
+
+    def data_path(self, name):
+        return os.path.join(self.cache_dir, name + '.u8')
+
+    def load_index(self):
+        if not os.path.isfile(self.index_path):
+            return False
+        with np.load(self.index_path) as index:
+            if str(index['key']) != self.key:
+                return False
+            self.index = {name: (index[name + '_offsets'], index[name + '_shapes'], index[name + '_sizes']) for name in self.names}
+        return True
+
+    def build(self, sources, load):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+        index = {'key': np.array(self.key)}
+        for name in self.names:
+            offsets, shapes, sizes = [], [], []
+            offset = 0
+            with open(self.data_path(name) + '.partial', 'wb') as data_file:
+                for path in sources[name]:
+                    size, img = load(name, path)
+                    array = np.asarray(img, dtype=np.uint8)
+                    data_file.write(array.tobytes())
+                    offsets.append(offset)
+                    shapes.append(array.shape[:2])
+                    sizes.append(size)
+                    offset += array.nbytes
+            os.replace(self.data_path(name) + '.partial', self.data_path(name))
+            index[name + '_offsets'] = np.array(offsets, dtype=np.int64)
+            index[name + '_shapes'] = np.array(shapes, dtype=np.int64).reshape(-1, 2)
+            index[name + '_sizes'] = np.array(sizes, dtype=np.int64).reshape(-1, 2)
+
+        # the index is written last, so a cache that was cut off is rebuilt
+        with open(self.index_path + '.partial', 'wb') as index_file:
+            np.savez(index_file, **index)
+        os.replace(self.index_path + '.partial', self.index_path)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name, i):
+        # returns a read-only view of the cached HxWx3 image and its (width, height) before it was resized
+        if name not in self.arrays:
+            # opened lazily, so every data loader worker maps the file itself
+            self.arrays[name] = np.memmap(self.data_path(name), dtype=np.uint8, mode='r')
+        offsets, shapes, sizes = self.index[name]
+        height, width = shapes[i]
+        array = self.arrays[name][offsets[i]:offsets[i] + height * width * 3].reshape(height, width, 3)
+        return array, tuple(int(v) for v in sizes[i])
+
+    def __getstate__(self):
+        # do not copy the mapped files into spawned data loader workers
+        state = self.__dict__.copy()
+        state['arrays'] = {}
+        return state
@@ -35,6 +35,8 @@ class BaseOptions():
         self.parser.add_argument('--serial_batches', action='store_true', help='if true, takes images in order to make batches, otherwise takes them randomly')        
         self.parser.add_argument('--no_flip', action='store_true', help='if specified, do not flip the images for data argumentation') 
         self.parser.add_argument('--nThreads', default=2, type=int, help='# threads for loading data')                
+        self.parser.add_argument('--rectify_maps', type=str, default='', help='side camera rectification (.npz from Camera Software/rectification.py) applied to the A images at load time')
+        self.parser.add_argument('--tensor_cache', action='store_true', help='decode and resize every image to loadSize once into a memory-mapped uint8 cache in [dataroot]/[phase]_cache, later epochs only crop, flip and normalize')
         self.parser.add_argument('--max_dataset_size', type=int, default=float("inf"), help='Maximum number of samples allowed per dataset. If the dataset directory contains more than max_dataset_size, only a subset is loaded.')
 
         # for displays